@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compare the content encodings supported by HttpCompressionMiddleware: encode
+the bundled HTML sample with each of them and report the compression ratio
+and the decoding throughput, decoding the body at once (like the middleware)
+and in network-sized chunks (like the HTTP/1.1 download handler).
+
+usage:
+
+    python decompression-bench.py [number of rounds]
+
+"""
+from __future__ import print_function
+import os
+import sys
+import zlib
+from time import time
+
+from scrapy.utils.decompression import ACCEPTED_ENCODINGS, Decompressor
+from scrapy.utils.gz import gunzip
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests',
+                      'sample_data', 'compressed', 'html-gzip.bin')
+CHUNK_SIZE = 16 * 1024
+
+
+def gzip_encode(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def deflate_encode(data):
+    return zlib.compress(data, 6)
+
+
+def br_encode(data):
+    import brotli
+    return brotli.compress(data)
+
+
+def zstd_encode(data):
+    import zstandard
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+ENCODERS = {
+    b'gzip': gzip_encode,
+    b'deflate': deflate_encode,
+    b'br': br_encode,
+    b'zstd': zstd_encode,
+}
+
+
+def decode(encoding, data, chunk_size):
+    decompressor = Decompressor(encoding)
+    for i in range(0, len(data), chunk_size):
+        decompressor.decompress(data[i:i + chunk_size])
+    decompressor.flush()
+
+
+def bench(encoding, data, rounds, chunk_size):
+    start = time()
+    for _ in range(rounds):
+        decode(encoding, data, chunk_size)
+    return rounds / (time() - start)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(SAMPLE, 'rb') as f:
+        body = gunzip(f.read())
+    print("%d rounds of a %d bytes body" % (rounds, len(body)))
+    print("%-10s %8s %14s %14s" % ('encoding', 'ratio', 'whole MB/s',
+                                   'chunked MB/s'))
+    mb = len(body) / 1024.0 / 1024
+    for encoding in ACCEPTED_ENCODINGS:
+        data = ENCODERS[encoding](body)
+        print("%-10s %8.1f %14.0f %14.0f" % (
+            encoding.decode('ascii'), float(len(body)) / len(data),
+            mb * bench(encoding, data, rounds, len(data)),
+            mb * bench(encoding, data, rounds, CHUNK_SIZE)))
+
+
+if __name__ == '__main__':
+    main()
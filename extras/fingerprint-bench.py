@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Measure request fingerprinting throughput on a few URL mixes, comparing the
+old approach (canonicalize every new Request's URL) with the canonical URL
+cache of scrapy.utils.request, for hex and binary fingerprints.
+
+Every fingerprint is computed on a new Request object, like it happens when
+the same link is extracted from many pages.
+
+usage:
+
+    python fingerprint-bench.py [number of requests]
+
+"""
+from __future__ import print_function
+import gc
+import sys
+import random
+import hashlib
+import weakref
+from time import time
+
+from w3lib.url import canonicalize_url
+
+from scrapy.http import Request
+from scrapy.utils.python import to_bytes
+from scrapy.utils.request import request_fingerprint, \
+    request_fingerprint_digest, _canonical_url_cache
+
+
+_old_cache = weakref.WeakKeyDictionary()
+
+
+def old_fingerprint(request):
+    # request_fingerprint() before the canonical URL cache
+    cache = _old_cache.setdefault(request, {})
+    if None not in cache:
+        fp = hashlib.sha1()
+        fp.update(to_bytes(request.method))
+        fp.update(to_bytes(canonicalize_url(request.url)))
+        fp.update(request.body or b'')
+        cache[None] = fp.hexdigest()
+    return cache[None]
+
+
+def make_url(i):
+    return 'http://www.example%d.com/category/%d/item?page=%d&id=%d&sort=asc' % (
+        i % 100, i % 7, i % 13, i)
+
+
+def url_mixes(n):
+    rnd = random.Random(0)
+    # every URL is new
+    yield 'unique', [make_url(i) for i in range(n)]
+    # each URL is linked from ~5 pages, like pagination and item links
+    yield 'repeated x5', [make_url(rnd.randrange(n // 5)) for _ in range(n)]
+    # most links point to a few hundred navigation pages
+    yield 'navigation', [make_url(rnd.randrange(500)) if rnd.random() < 0.8
+                         else make_url(n + i) for i in range(n)]
+
+
+def bench(func, urls):
+    _canonical_url_cache.clear()
+    requests = [Request(url) for url in urls]
+    gc.collect()
+    start = time()
+    for request in requests:
+        func(request)
+    return len(requests) / (time() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    funcs = [('old', old_fingerprint),
+             ('request_fingerprint', request_fingerprint),
+             ('digest', request_fingerprint_digest),
+             ('digest (md5)',
+              lambda r: request_fingerprint_digest(r, hash_function=hashlib.md5))]
+    print("%d requests, fingerprints/s" % n)
+    print("%-14s" % 'urls' + ''.join("%22s" % name for name, _ in funcs))
+    for mix, urls in url_mixes(n):
+        print("%-14s" % mix + ''.join("%22.0f" % bench(func, urls)
+                                      for _, func in funcs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Measure the overhead of the HTTP/1.1 download handler, with and without
+reusing Twisted agents, against a local server returning small responses.
+
+It reports the time spent choosing an agent for a request (like
+ScrapyAgent._get_agent does for every download) and the number of requests
+per second downloaded through the handler.
+
+usage:
+
+    python http11-handler-bench.py [number of requests] [concurrency]
+
+"""
+from __future__ import print_function
+import sys
+from time import time
+
+from twisted.internet import defer, reactor, task
+from twisted.web import resource, server
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler, \
+    ScrapyAgent
+from scrapy.http import Request
+from scrapy.settings import Settings
+from scrapy.spiders import Spider
+
+
+class Small(resource.Resource):
+    isLeaf = True
+
+    def render(self, request):
+        return b'ok'
+
+
+def bench_get_agent(handler, request, n):
+    agent = ScrapyAgent(contextFactory=handler._contextFactory,
+                        pool=handler._pool, agents=handler._agents)
+    start = time()
+    for _ in range(n):
+        agent._get_agent(request, 180)
+    return (time() - start) / n * 1e6
+
+
+@defer.inlineCallbacks
+def bench_downloads(handler, url, n, concurrency):
+    spider = Spider('bench')
+    requests = iter(Request(url) for _ in range(n))
+
+    def work():
+        for request in requests:
+            yield handler.download_request(request, spider)
+
+    start = time()
+    coop = task.Cooperator()
+    yield defer.DeferredList([coop.coiterate(work())
+                              for _ in range(concurrency)])
+    defer.returnValue(n / (time() - start))
+
+
+@defer.inlineCallbacks
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    port = reactor.listenTCP(0, server.Site(Small()), interface='127.0.0.1')
+    url = 'http://127.0.0.1:%d/' % port.getHost().port
+    settings = Settings({'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency})
+    print("%d requests, concurrency %d" % (n, concurrency))
+    print("%-10s %16s %14s" % ('agents', 'us/_get_agent', 'requests/s'))
+    try:
+        for name, cache in [('new', False), ('reused', True)]:
+            handler = HTTP11DownloadHandler(settings)
+            if not cache:
+                handler._agents = None
+            per_call = bench_get_agent(handler, Request(url), n)
+            rate = yield bench_downloads(handler, url, n, concurrency)
+            yield handler.close()
+            print("%-10s %16.1f %14.0f" % (name, per_call, rate))
+    finally:
+        yield port.stopListening()
+        reactor.stop()
+
+
+if __name__ == '__main__':
+    reactor.callWhenRunning(main)
+    reactor.run()
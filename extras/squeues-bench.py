@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compare the scheduler disk queues: push and pop a batch of serialized requests
+through each queue class and report the throughput and the disk usage.
+
+usage:
+
+    python squeues-bench.py [number of requests]
+
+"""
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+from time import time
+
+from scrapy.http import Request
+from scrapy.spiders import Spider
+from scrapy.utils.reqser import request_to_dict, request_from_dict
+from scrapy import squeues
+
+QUEUES = ['PickleLifoDiskQueue', 'MarshalLifoDiskQueue', 'CompactLifoDiskQueue']
+
+
+class BenchSpider(Spider):
+    name = 'bench'
+
+    def parse_item(self, response):
+        pass
+
+
+def make_requests(spider, n):
+    for i in range(n):
+        yield Request(
+            'http://www.example%d.com/category/%d/item?id=%d&page=%d' % (
+                i % 100, i % 7, i, i % 13),
+            callback=spider.parse_item,
+            headers={'Referer': 'http://www.example%d.com/' % (i % 100)},
+            meta={'depth': i % 5, 'download_slot': 'www.example%d.com' % (i % 100)},
+            priority=-(i % 5),
+        )
+
+
+def disk_usage(path):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+
+def bench(qclass, spider, requests):
+    path = tempfile.mkdtemp()
+    try:
+        qpath = os.path.join(path, 'queue')
+        q = qclass(qpath)
+        start = time()
+        for request in requests:
+            q.push(request_to_dict(request, spider))
+        pushed = time()
+        q.close()
+        size = disk_usage(path)
+        q = qclass(qpath)
+        popstart = time()
+        while len(q):
+            request_from_dict(q.pop(), spider)
+        end = time()
+        q.close()
+    finally:
+        shutil.rmtree(path)
+    n = len(requests)
+    return n / (pushed - start), n / (end - popstart), size
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    spider = BenchSpider()
+    requests = list(make_requests(spider, n))
+    print("%d requests" % n)
+    print("%-24s %12s %12s %14s" % ('queue', 'push/s', 'pop/s', 'bytes/request'))
+    for name in QUEUES:
+        push, pop, size = bench(getattr(squeues, name), spider, requests)
+        print("%-24s %12.0f %12.0f %14.1f" % (name, push, pop, size / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compare the byte accounting of the DownloaderStats middleware, building the
+HTTP representation of requests and responses to take its length (the old
+approach) or adding up the lengths of their parts, for a few body sizes.
+
+Reports the throughput and, on Python 3, the peak memory allocated while
+accounting a single response.
+
+usage:
+
+    python stats-bench.py [number of responses]
+
+"""
+from __future__ import print_function
+import sys
+from time import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from scrapy.downloadermiddlewares.stats import get_request_size, \
+    get_response_size
+from scrapy.http import Request, Response
+from scrapy.utils.request import request_httprepr
+from scrapy.utils.response import response_httprepr
+
+BODY_SIZES = [1024, 100 * 1024, 1024 * 1024]
+
+HEADERS = {
+    'Content-Type': 'text/html; charset=utf-8',
+    'Cache-Control': 'max-age=600',
+    'Set-Cookie': ['a=1; Path=/', 'b=2; Path=/; HttpOnly'],
+    'Server': 'nginx',
+}
+
+
+def httprepr_size(request, response):
+    return len(request_httprepr(request)), len(response_httprepr(response))
+
+
+def parts_size(request, response):
+    return get_request_size(request), get_response_size(response)
+
+
+def peak_memory(func, request, response):
+    if tracemalloc is None:
+        return float('nan')
+    tracemalloc.start()
+    func(request, response)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench(func, request, response, n):
+    start = time()
+    for _ in range(n):
+        func(request, response)
+    return n / (time() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    request = Request('http://www.example.com/category/1/item?id=1',
+                      headers={'Referer': 'http://www.example.com/',
+                               'Accept-Encoding': 'gzip,deflate'})
+    print("%d responses" % n)
+    print("%-10s %-10s %14s %16s" % ('body', 'approach', 'responses/s',
+                                     'peak bytes'))
+    for size in BODY_SIZES:
+        response = Response(request.url, headers=HEADERS, body=b'x' * size)
+        assert httprepr_size(request, response) == \
+            parts_size(request, response)
+        for name, func in [('httprepr', httprepr_size),
+                           ('parts', parts_size)]:
+            print("%-10d %-10s %14.0f %16.0f" % (
+                size, name, bench(func, request, response, n),
+                peak_memory(func, request, response)))
+
+
+if __name__ == '__main__':
+    main()
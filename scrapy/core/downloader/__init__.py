@@ -6,10 +6,14 @@ from datetime import datetime
 from collections import deque
 
 import six
-from twisted.internet import reactor, defer, task
+from twisted.internet import defer
 
+from scrapy.http import Response
 from scrapy.utils.defer import mustbe_deferred
 from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.ratelimit import TokenBucket
+from scrapy.utils.reactor import DelayedCallHeap
+from scrapy.utils.request import request_fingerprint
 from scrapy.resolver import dnscache
 from scrapy import signals
 from .middleware import DownloaderMiddlewareManager
@@ -19,16 +23,18 @@ from .handlers import DownloadHandlers
 class Slot(object):
     """Downloader slot"""
 
-    def __init__(self, concurrency, delay, randomize_delay):
+    def __init__(self, concurrency, delay, randomize_delay, bandwidth=0):
         self.concurrency = concurrency
         self.delay = delay
         self.randomize_delay = randomize_delay
+        self.bandwidth = TokenBucket(bandwidth) if bandwidth else None
 
         self.active = set()
         self.queue = deque()
         self.transferring = set()
         self.lastseen = 0
         self.latercall = None
+        self.gccall = None
 
     def free_transfer_slots(self):
         return self.concurrency - len(self.transferring)
@@ -41,6 +47,8 @@ class Slot(object):
     def close(self):
         if self.latercall and self.latercall.active():
             self.latercall.cancel()
+        if self.gccall and self.gccall.active():
+            self.gccall.cancel()
 
     def __repr__(self):
         cls_name = self.__class__.__name__
@@ -78,16 +86,23 @@ class Downloader(object):
     def __init__(self, crawler):
         self.settings = crawler.settings
         self.signals = crawler.signals
+        self.stats = crawler.stats
         self.slots = {}
         self.active = set()
+        # fingerprint -> deferreds waiting for an in-flight download
+        self.inflight = {}
         self.handlers = DownloadHandlers(crawler)
         self.total_concurrency = self.settings.getint('CONCURRENT_REQUESTS')
         self.domain_concurrency = self.settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
         self.ip_concurrency = self.settings.getint('CONCURRENT_REQUESTS_PER_IP')
         self.randomize_delay = self.settings.getbool('RANDOMIZE_DOWNLOAD_DELAY')
+        self.slot_bandwidth = self.settings.getint('DOWNLOAD_SLOT_BANDWIDTH')
+        bandwidth = self.settings.getint('DOWNLOAD_BANDWIDTH')
+        self.bandwidth = TokenBucket(bandwidth) if bandwidth else None
         self.middleware = DownloaderMiddlewareManager.from_crawler(crawler)
-        self._slot_gc_loop = task.LoopingCall(self._slot_gc)
-        self._slot_gc_loop.start(60)
+        # slot delays and idle slot expiration share a single reactor call
+        self._timer = DelayedCallHeap(stats=crawler.stats,
+                                      stats_prefix='downloader/slots')
 
     def fetch(self, request, spider):
         def _deactivate(response):
@@ -106,7 +121,8 @@ class Downloader(object):
         if key not in self.slots:
             conc = self.ip_concurrency if self.ip_concurrency else self.domain_concurrency
             conc, delay = _get_concurrency_delay(conc, spider, self.settings)
-            self.slots[key] = Slot(conc, delay, self.randomize_delay)
+            self.slots[key] = Slot(conc, delay, self.randomize_delay,
+                                   self.slot_bandwidth)
 
         return key, self.slots[key]
 
@@ -121,19 +137,49 @@ class Downloader(object):
         return key
 
     def _enqueue_request(self, request, spider):
+        fingerprint = None
+        if request.meta.get('download_coalesce') and \
+                not request.meta.get('download_chunk_callback'):
+            fingerprint = request_fingerprint(request)
+            if fingerprint in self.inflight:
+                # the same request is being downloaded already
+                self.stats.inc_value('downloader/coalesced', spider=spider)
+                waiter = defer.Deferred()
+                self.inflight[fingerprint].append((waiter, request))
+                return waiter
+            self.inflight[fingerprint] = []
+
         key, slot = self._get_slot(request, spider)
         request.meta['download_slot'] = key
 
         def _deactivate(response):
             slot.active.remove(request)
+            if not slot.active:
+                self._schedule_slot_gc(key, slot)
+            self.signals.send_catch_log(signal=signals.request_left_downloader,
+                                        request=request, spider=spider)
             return response
 
         slot.active.add(request)
         deferred = defer.Deferred().addBoth(_deactivate)
+        if fingerprint is not None:
+            deferred.addBoth(self._share_download, fingerprint, request)
         slot.queue.append((request, deferred))
         self._process_queue(spider, slot)
         return deferred
 
+    def _share_download(self, result, fingerprint, request):
+        for waiter, waiting_request in self.inflight.pop(fingerprint):
+            # as if downloaded along with the request actually downloaded
+            for key in ('download_slot', 'download_latency'):
+                if key in request.meta:
+                    waiting_request.meta[key] = request.meta[key]
+            if isinstance(result, Response):
+                waiter.callback(result.replace(flags=list(result.flags)))
+            else:
+                waiter.errback(result)
+        return result
+
     def _process_queue(self, spider, slot):
         if slot.latercall and slot.latercall.active():
             return
@@ -144,7 +190,17 @@ class Downloader(object):
         if delay:
             penalty = delay - now + slot.lastseen
             if penalty > 0:
-                slot.latercall = reactor.callLater(penalty, self._process_queue, spider, slot)
+                slot.latercall = self._timer.callLater(
+                    penalty, self._process_queue, spider, slot)
+                return
+
+        # Delay queue processing while over the bandwidth limits
+        buckets = self._buckets(slot)
+        if slot.queue and buckets:
+            wait = max(bucket.delay() for bucket in buckets)
+            if wait > 0:
+                slot.latercall = self._timer.callLater(
+                    wait, self._process_queue, spider, slot)
                 return
 
         # Process enqueued requests if there are free slots to transfer for this slot
@@ -182,18 +238,50 @@ class Downloader(object):
 
         def finish_transferring(_):
             slot.transferring.remove(request)
+            if self._buckets(slot):
+                self._bandwidth_stats(slot, request, spider)
             self._process_queue(spider, slot)
             return _
 
         return dfd.addBoth(finish_transferring)
 
+    def bandwidth_buckets(self, key):
+        """Return the bandwidth limits (:class:`~scrapy.utils.ratelimit.TokenBucket`
+        objects) which download handlers take the bytes received for requests
+        of the ``key`` slot from"""
+        slot = self.slots.get(key)
+        if slot is None:
+            return [self.bandwidth] if self.bandwidth is not None else []
+        return self._buckets(slot)
+
+    def _buckets(self, slot):
+        return [b for b in (self.bandwidth, slot.bandwidth) if b is not None]
+
+    def _bandwidth_stats(self, slot, request, spider):
+        if self.bandwidth is not None:
+            self.stats.set_value('downloader/bandwidth/rate',
+                                 int(self.bandwidth.current_rate), spider=spider)
+        if slot.bandwidth is not None:
+            self.stats.set_value(
+                'downloader/bandwidth/slot/%s' % request.meta['download_slot'],
+                int(slot.bandwidth.current_rate), spider=spider)
+
     def close(self):
-        self._slot_gc_loop.stop()
         for slot in six.itervalues(self.slots):
             slot.close()
+        self._timer.close()
 
-    def _slot_gc(self, age=60):
-        mintime = time() - age
-        for key, slot in list(self.slots.items()):
-            if not slot.active and slot.lastseen + slot.delay < mintime:
-                self.slots.pop(key).close()
+    def _schedule_slot_gc(self, key, slot, age=60):
+        if slot.gccall and slot.gccall.active():
+            return
+        delay = slot.lastseen + slot.delay + age - time()
+        slot.gccall = self._timer.callLater(max(delay, 0), self._slot_gc,
+                                            key, slot, age)
+
+    def _slot_gc(self, key, slot, age=60):
+        if slot.active or self.slots.get(key) is not slot:
+            return  # idle again later, or already removed
+        if slot.lastseen + slot.delay <= time() - age:
+            self.slots.pop(key).close()
+        else:
+            self._schedule_slot_gc(key, slot, age)
@@ -14,6 +14,7 @@ if twisted_version >= (14, 0, 0):
     from twisted.web.iweb import IPolicyForHTTPS
 
     from scrapy.core.downloader.tls import ScrapyClientTLSOptions, DEFAULT_CIPHERS
+    from scrapy.utils.datatypes import LRUCache
 
 
     @implementer(IPolicyForHTTPS)
@@ -26,11 +27,26 @@ if twisted_version >= (14, 0, 0):
 
         'A TLS/SSL connection established with [this method] may
          understand the SSLv3, TLSv1, TLSv1.1 and TLSv1.2 protocols.'
+
+        The TLS context and the last TLS session are kept for the
+        ``tls_cache_size`` most recently used hosts, so new connections
+        reuse the context and resume the session (unless ``resume_sessions``
+        is false) instead of doing a full handshake. Handshakes are counted
+        in ``stats``, if set.
+
+        ``acceptable_protocols`` is the list of protocols offered to servers
+        through ALPN (e.g. ``[b'h2', b'http/1.1']``), none by default.
         """
 
-        def __init__(self, method=SSL.SSLv23_METHOD, *args, **kwargs):
+        tls_cache_size = 1000
+        resume_sessions = True
+        stats = None
+
+        def __init__(self, method=SSL.SSLv23_METHOD, acceptable_protocols=None,
+                     *args, **kwargs):
             super(ScrapyClientContextFactory, self).__init__(*args, **kwargs)
             self._ssl_method = method
+            self._acceptable_protocols = acceptable_protocols
 
         def getCertificateOptions(self):
             # setting verify=True will require you to provide CAs
@@ -44,11 +60,16 @@ if twisted_version >= (14, 0, 0):
             #
             # * getattr() for `_ssl_method` attribute for context factories
             #   not calling super(..., self).__init__
+            kwargs = {}
+            protocols = getattr(self, '_acceptable_protocols', None)
+            if protocols:
+                kwargs['acceptableProtocols'] = protocols
             return CertificateOptions(verify=False,
                         method=getattr(self, 'method',
                                        getattr(self, '_ssl_method', None)),
                         fixBrokenPeers=True,
-                        acceptableCiphers=DEFAULT_CIPHERS)
+                        acceptableCiphers=DEFAULT_CIPHERS,
+                        **kwargs)
 
         # kept for old-style HTTP/1.0 downloader context twisted calls,
         # e.g. connectSSL()
@@ -56,7 +77,17 @@ if twisted_version >= (14, 0, 0):
             return self.getCertificateOptions().getContext()
 
         def creatorForNetloc(self, hostname, port):
-            return ScrapyClientTLSOptions(hostname.decode("ascii"), self.getContext())
+            # not created in __init__, for subclasses not calling it
+            creators = self.__dict__.setdefault(
+                '_creators', LRUCache(self.tls_cache_size))
+            key = (hostname, port)
+            if key in creators:
+                return creators[key]
+            creator = ScrapyClientTLSOptions(
+                hostname.decode("ascii"), self.getContext(),
+                resume_sessions=self.resume_sessions, stats=self.stats)
+            creators[key] = creator
+            return creator
 
 
     @implementer(IPolicyForHTTPS)
@@ -80,11 +111,15 @@ if twisted_version >= (14, 0, 0):
             #
             # This means that a website like https://www.cacert.org will be rejected
             # by default, since CAcert.org CA certificate is seldom shipped.
+            kwargs = {}
+            if self._acceptable_protocols:
+                kwargs['acceptableProtocols'] = self._acceptable_protocols
             return optionsForClientTLS(hostname.decode("ascii"),
                                        trustRoot=platformTrust(),
                                        extraCertificateOptions={
                                             'method': self._ssl_method,
-                                       })
+                                       },
+                                       **kwargs)
 
 else:
 
@@ -42,7 +42,10 @@ class DownloadHandlers(object):
         path = self._schemes[scheme]
         try:
             dhcls = load_object(path)
-            dh = dhcls(self._crawler.settings)
+            if hasattr(dhcls, 'from_crawler'):
+                dh = dhcls.from_crawler(self._crawler)
+            else:
+                dh = dhcls(self._crawler.settings)
         except NotConfigured as ex:
             self._notconfigured[scheme] = str(ex)
             return None
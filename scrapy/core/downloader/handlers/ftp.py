@@ -18,6 +18,11 @@ The status of the built html response will be, by default
 
 or raise corresponding ftp exception otherwise
 
+Logged-in control connections are kept in a pool, at most FTP_POOL_SIZE idle
+ones per server and credentials, and reused by later requests until they have
+been idle for FTP_POOL_IDLE_TIMEOUT seconds. Set FTP_POOL_SIZE to 0 to open a
+new connection for every request.
+
 The matching from server ftp command return codes to html response codes is defined in the
 CODE_MAPPING attribute of the handler class. The key 'default' is used for any code
 that is not explicitly present among the map keys. You may need to overwrite this
@@ -33,8 +38,9 @@ from io import BytesIO
 from six.moves.urllib.parse import unquote
 
 from twisted.internet import reactor
-from twisted.protocols.ftp import FTPClient, CommandFailed
+from twisted.protocols.ftp import FTPClient, CommandFailed, ConnectionLost
 from twisted.internet.protocol import Protocol, ClientCreator
+from twisted.python.failure import Failure
 
 from scrapy.http import Response
 from scrapy.responsetypes import responsetypes
@@ -59,6 +65,74 @@ class ReceivedDataProtocol(Protocol):
     def close(self):
         self.body.close() if self.filename else self.body.seek(0)
 
+
+class _PooledFTPClient(FTPClient):
+    """An FTP client which leaves its pool once disconnected"""
+
+    pool = None
+    key = None
+    lost = False
+
+    def connectionLost(self, reason):
+        FTPClient.connectionLost(self, reason)
+        self.lost = True
+        if self.pool is not None:
+            self.pool.discard(self)
+
+
+class FTPConnectionPool(object):
+    """Keep idle FTP clients for reuse, at most ``maxsize`` of them per
+    ``key`` (server and credentials), each one disconnected after ``timeout``
+    seconds idle"""
+
+    def __init__(self, maxsize, timeout, clock=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.clock = clock or reactor
+        self._clients = {}
+        self._timeouts = {}
+
+    def get(self, key):
+        """Return an idle client for ``key``, or ``None``"""
+        clients = self._clients.get(key)
+        while clients:
+            client = clients.pop()
+            self._timeouts.pop(client).cancel()
+            if not client.lost:
+                return client
+        return None
+
+    def put(self, client):
+        """Keep ``client`` for reuse, or disconnect it if there are too many
+        idle clients for its key already"""
+        clients = self._clients.setdefault(client.key, [])
+        if client.lost or len(clients) >= self.maxsize:
+            client.transport.loseConnection()
+            return
+        client.pool = self
+        clients.append(client)
+        self._timeouts[client] = self.clock.callLater(
+            self.timeout, self._expire, client)
+
+    def discard(self, client):
+        """Forget an idle ``client``"""
+        if client in self._timeouts:
+            self._timeouts.pop(client).cancel()
+            self._clients[client.key].remove(client)
+
+    def _expire(self, client):
+        del self._timeouts[client]
+        self._clients[client.key].remove(client)
+        client.transport.loseConnection()
+
+    def close(self):
+        """Disconnect all idle clients"""
+        for clients in list(self._clients.values()):
+            for client in list(clients):
+                self.discard(client)
+                client.transport.loseConnection()
+
+
 _CODE_RE = re.compile("\d+")
 class FTPDownloadHandler(object):
 
@@ -71,6 +145,10 @@ class FTPDownloadHandler(object):
         self.default_user = settings['FTP_USER']
         self.default_password = settings['FTP_PASSWORD']
         self.passive_mode = settings['FTP_PASSIVE_MODE']
+        poolsize = settings.getint('FTP_POOL_SIZE')
+        self._pool = FTPConnectionPool(
+            poolsize, settings.getfloat('FTP_POOL_IDLE_TIMEOUT')) \
+            if poolsize else None
 
     def download_request(self, request, spider):
         parsed_url = urlparse_cached(request)
@@ -78,20 +156,57 @@ class FTPDownloadHandler(object):
         password = request.meta.get("ftp_password", self.default_password)
         passive_mode = 1 if bool(request.meta.get("ftp_passive",
                                                   self.passive_mode)) else 0
-        creator = ClientCreator(reactor, FTPClient, user, password,
+        key = (parsed_url.hostname, parsed_url.port or 21, user, password,
+               passive_mode)
+        filepath = unquote(parsed_url.path)
+        client = self._pool.get(key) if self._pool is not None else None
+        if client is None:
+            return self._connect(key).addCallback(self.gotClient, request,
+                                                  filepath)
+        # the server may have closed the connection while it was idle
+        return self.gotClient(client, request, filepath).addErrback(
+            self._reconnect, key, request, filepath)
+
+    def _connect(self, key):
+        host, port, user, password, passive_mode = key
+        creator = ClientCreator(reactor, _PooledFTPClient, user, password,
             passive=passive_mode)
-        return creator.connectTCP(parsed_url.hostname, parsed_url.port or 21).addCallback(self.gotClient,
-                                request, unquote(parsed_url.path))
+        return creator.connectTCP(host, port).addCallback(self._set_key, key)
+
+    def _set_key(self, client, key):
+        client.key = key
+        return client
+
+    def _reconnect(self, failure, key, request, filepath):
+        failure.trap(ConnectionLost)
+        return self._connect(key).addCallback(self.gotClient, request,
+                                              filepath)
 
     def gotClient(self, client, request, filepath):
         self.client = client
         protocol = ReceivedDataProtocol(request.meta.get("ftp_local_filename"))
         return client.retrieveFile(filepath, protocol)\
+                .addBoth(self._release, client)\
                 .addCallbacks(callback=self._build_response,
                         callbackArgs=(request, protocol),
                         errback=self._failed,
                         errbackArgs=(request,))
 
+    def _release(self, result, client):
+        # the connection is left in a known state after a successful
+        # transfer or a refused command, not after other errors
+        reusable = not isinstance(result, Failure) or \
+            result.check(CommandFailed)
+        if self._pool is not None and reusable:
+            self._pool.put(client)
+        elif not client.lost:
+            client.transport.loseConnection()
+        return result
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+
     def _build_response(self, result, request, protocol):
         self.result = result
         respcls = responsetypes.from_args(url=request.url)
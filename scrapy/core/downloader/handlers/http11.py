@@ -2,8 +2,10 @@
 
 import re
 import logging
+import tempfile
 from io import BytesIO
 from time import time
+from collections import deque
 import warnings
 from six.moves.urllib.parse import urldefrag
 
@@ -12,6 +14,7 @@ from twisted.internet import defer, reactor, protocol
 from twisted.web.http_headers import Headers as TxHeaders
 from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
 from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
 from twisted.web.http import _DataLoss, PotentialDataLoss
 from twisted.web.client import Agent, ProxyAgent, ResponseDone, \
     HTTPConnectionPool, ResponseFailed
@@ -25,6 +28,10 @@ from scrapy.http import Headers
 from scrapy.responsetypes import responsetypes
 from scrapy.core.downloader.webclient import _parse
 from scrapy.core.downloader.tls import openssl_methods
+from scrapy.downloadermiddlewares.httpcompression import update_stats
+from scrapy.utils.datatypes import LRUCache
+from scrapy.utils.decompression import Decompressor, \
+    DecompressionMaxSizeExceeded
 from scrapy.utils.misc import load_object
 from scrapy.utils.python import to_bytes, to_unicode
 from scrapy import twisted_version
@@ -34,9 +41,15 @@ logger = logging.getLogger(__name__)
 
 class HTTP11DownloadHandler(object):
 
-    def __init__(self, settings):
+    # number of Twisted agents kept for reuse, see ScrapyAgent._get_agent
+    agent_cache_size = 100
+
+    def __init__(self, settings, crawler=None):
         self._pool = HTTPConnectionPool(reactor, persistent=True)
+        self._agents = LRUCache(self.agent_cache_size) \
+            if self.agent_cache_size else None
         self._pool.maxPersistentPerHost = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self._pool.cachedConnectionTimeout = settings.getint('DOWNLOAD_POOL_IDLE_TIMEOUT')
         self._pool._factory.noisy = False
 
         self._sslMethod = openssl_methods[settings.get('DOWNLOADER_CLIENT_TLS_METHOD')]
@@ -53,17 +66,32 @@ class HTTP11DownloadHandler(object):
  Please upgrade your context factory class to handle it or ignore it.""" % (
                 settings['DOWNLOADER_CLIENTCONTEXTFACTORY'],)
             warnings.warn(msg)
+        self._crawler = crawler
+        self._stats = crawler.stats if crawler is not None else None
+        if self._stats is not None and hasattr(self._contextFactory, 'stats'):
+            self._contextFactory.stats = self._stats
+        if hasattr(self._contextFactory, 'resume_sessions'):
+            self._contextFactory.resume_sessions = settings.getbool(
+                'DOWNLOADER_TLS_SESSION_RESUMPTION')
         self._default_maxsize = settings.getint('DOWNLOAD_MAXSIZE')
         self._default_warnsize = settings.getint('DOWNLOAD_WARNSIZE')
+        self._default_spoolsize = settings.getint('DOWNLOAD_SPOOLSIZE')
         self._fail_on_dataloss = settings.getbool('DOWNLOAD_FAIL_ON_DATALOSS')
         self._disconnect_timeout = 1
 
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
     def download_request(self, request, spider):
         """Return a deferred for the HTTP download"""
         agent = ScrapyAgent(contextFactory=self._contextFactory, pool=self._pool,
             maxsize=getattr(spider, 'download_maxsize', self._default_maxsize),
             warnsize=getattr(spider, 'download_warnsize', self._default_warnsize),
-            fail_on_dataloss=self._fail_on_dataloss)
+            fail_on_dataloss=self._fail_on_dataloss,
+            spoolsize=self._default_spoolsize, stats=self._stats,
+            agents=self._agents,
+            buckets=get_bandwidth_buckets(self._crawler, request))
         return agent.download_request(request)
 
     def close(self):
@@ -87,6 +115,15 @@ class HTTP11DownloadHandler(object):
         return d
 
 
+def get_bandwidth_buckets(crawler, request):
+    """Return the bandwidth limits to take the bytes received for
+    ``request`` from, kept by the downloader for the request slot"""
+    engine = getattr(crawler, 'engine', None)
+    if engine is None or 'download_slot' not in request.meta:
+        return None
+    return engine.downloader.bandwidth_buckets(request.meta['download_slot'])
+
+
 class TunnelError(Exception):
     """An HTTP CONNECT tunnel could not be established by the proxy."""
 
@@ -94,10 +131,8 @@ class TunnelError(Exception):
 class TunnelingTCP4ClientEndpoint(TCP4ClientEndpoint):
     """An endpoint that tunnels through proxies to allow HTTPS downloads. To
     accomplish that, this endpoint sends an HTTP CONNECT to the proxy.
-    The HTTP CONNECT is always sent when using this endpoint, I think this could
-    be improved as the CONNECT will be redundant if the connection associated
-    with this endpoint comes from the pool and a CONNECT has already been issued
-    for it.
+    The connection pool only connects the endpoint when it has no idle tunnel
+    to reuse, so a CONNECT is sent for every new tunnel, not for every request.
     """
 
     _responseMatcher = re.compile(b'HTTP/1\.. (?P<status>\d{3})(?P<reason>.{,32})')
@@ -107,11 +142,10 @@ class TunnelingTCP4ClientEndpoint(TCP4ClientEndpoint):
         proxyHost, proxyPort, self._proxyAuthHeader = proxyConf
         super(TunnelingTCP4ClientEndpoint, self).__init__(reactor, proxyHost,
             proxyPort, timeout, bindAddress)
-        self._tunnelReadyDeferred = defer.Deferred()
         self._tunneledHost = host
         self._tunneledPort = port
         self._contextFactory = contextFactory
-        self._connectBuffer = bytearray()
+        self.tunnelOpened = False
 
     def requestTunnel(self, protocol):
         """Asks the proxy to open a tunnel."""
@@ -149,6 +183,7 @@ class TunnelingTCP4ClientEndpoint(TCP4ClientEndpoint):
                 sslOptions = self._contextFactory
             self._protocol.transport.startTLS(sslOptions,
                                               self._protocolFactory)
+            self.tunnelOpened = True
             self._tunnelReadyDeferred.callback(self._protocol)
         else:
             if respm:
@@ -165,6 +200,10 @@ class TunnelingTCP4ClientEndpoint(TCP4ClientEndpoint):
         self._tunnelReadyDeferred.errback(reason)
 
     def connect(self, protocolFactory):
+        # the pool connects again when a request fails on a tunnel that the
+        # proxy closed while idle, each time needs a new CONNECT
+        self._tunnelReadyDeferred = defer.Deferred()
+        self._connectBuffer = bytearray()
         self._protocolFactory = protocolFactory
         connectDeferred = super(TunnelingTCP4ClientEndpoint,
                                 self).connect(protocolFactory)
@@ -203,11 +242,12 @@ class TunnelingAgent(Agent):
     """
 
     def __init__(self, reactor, proxyConf, contextFactory=None,
-                 connectTimeout=None, bindAddress=None, pool=None):
+                 connectTimeout=None, bindAddress=None, pool=None, stats=None):
         super(TunnelingAgent, self).__init__(reactor, contextFactory,
             connectTimeout, bindAddress, pool)
         self._proxyConf = proxyConf
         self._contextFactory = contextFactory
+        self._stats = stats
 
     if twisted_version >= (15, 0, 0):
         def _getEndpoint(self, uri):
@@ -224,12 +264,23 @@ class TunnelingAgent(Agent):
 
     def _requestWithEndpoint(self, key, endpoint, method, parsedURI,
             headers, bodyProducer, requestPath):
-        # proxy host and port are required for HTTP pool `key`
+        # proxy host, port and credentials are required for HTTP pool `key`
         # otherwise, same remote host connection request could reuse
-        # a cached tunneled connection to a different proxy
+        # a cached tunneled connection to a different proxy, or one opened
+        # with different credentials
         key = key + self._proxyConf
-        return super(TunnelingAgent, self)._requestWithEndpoint(key, endpoint, method, parsedURI,
+        d = super(TunnelingAgent, self)._requestWithEndpoint(key, endpoint, method, parsedURI,
             headers, bodyProducer, requestPath)
+        if self._stats is not None:
+            d.addCallback(self._cb_tunnel_stats, endpoint)
+        return d
+
+    def _cb_tunnel_stats(self, result, endpoint):
+        if endpoint.tunnelOpened:
+            self._stats.inc_value('downloader/tunnel/opened')
+        else:
+            self._stats.inc_value('downloader/tunnel/reused')
+        return result
 
 
 class ScrapyProxyAgent(Agent):
@@ -267,7 +318,8 @@ class ScrapyAgent(object):
     _TunnelingAgent = TunnelingAgent
 
     def __init__(self, contextFactory=None, connectTimeout=10, bindAddress=None, pool=None,
-                 maxsize=0, warnsize=0, fail_on_dataloss=True):
+                 maxsize=0, warnsize=0, fail_on_dataloss=True, spoolsize=0,
+                 stats=None, agents=None, buckets=None):
         self._contextFactory = contextFactory
         self._connectTimeout = connectTimeout
         self._bindAddress = bindAddress
@@ -275,7 +327,12 @@ class ScrapyAgent(object):
         self._maxsize = maxsize
         self._warnsize = warnsize
         self._fail_on_dataloss = fail_on_dataloss
+        self._spoolsize = spoolsize
+        self._stats = stats
+        self._agents = agents
+        self._buckets = buckets
         self._txresponse = None
+        self._decompressor = None
 
     def _get_agent(self, request, timeout):
         bindaddress = request.meta.get('bindaddress') or self._bindAddress
@@ -288,15 +345,26 @@ class ScrapyAgent(object):
             if  scheme == b'https' and not omitConnectTunnel:
                 proxyConf = (proxyHost, proxyPort,
                              request.headers.get(b'Proxy-Authorization', None))
-                return self._TunnelingAgent(reactor, proxyConf,
+                key = ('tunnel', proxyConf, bindaddress, timeout)
+                factory = lambda: self._TunnelingAgent(reactor, proxyConf,
                     contextFactory=self._contextFactory, connectTimeout=timeout,
-                    bindAddress=bindaddress, pool=self._pool)
+                    bindAddress=bindaddress, pool=self._pool, stats=self._stats)
             else:
-                return self._ProxyAgent(reactor, proxyURI=to_bytes(proxy, encoding='ascii'),
+                key = ('proxy', proxy, bindaddress, timeout)
+                factory = lambda: self._ProxyAgent(reactor, proxyURI=to_bytes(proxy, encoding='ascii'),
                     connectTimeout=timeout, bindAddress=bindaddress, pool=self._pool)
-
-        return self._Agent(reactor, contextFactory=self._contextFactory,
-            connectTimeout=timeout, bindAddress=bindaddress, pool=self._pool)
+        else:
+            key = ('direct', bindaddress, timeout)
+            factory = lambda: self._Agent(reactor, contextFactory=self._contextFactory,
+                connectTimeout=timeout, bindAddress=bindaddress, pool=self._pool)
+
+        # agents keep no per-request state, so they can be reused
+        if self._agents is None:
+            return factory()
+        if key in self._agents:
+            return self._agents[key]
+        agent = self._agents[key] = factory()
+        return agent
 
     def download_request(self, request):
         timeout = request.meta.get('download_timeout') or self._connectTimeout
@@ -363,6 +431,8 @@ class ScrapyAgent(object):
         warnsize = request.meta.get('download_warnsize', self._warnsize)
         expected_size = txresponse.length if txresponse.length != UNKNOWN_LENGTH else -1
         fail_on_dataloss = request.meta.get('download_fail_on_dataloss', self._fail_on_dataloss)
+        spoolsize = request.meta.get('download_spoolsize', self._spoolsize)
+        chunk_callback = request.meta.get('download_chunk_callback')
 
         if maxsize and expected_size > maxsize:
             error_msg = ("Cancelling download of %(url)s: expected response "
@@ -382,21 +452,61 @@ class ScrapyAgent(object):
             # Abort connection immediately.
             txresponse._transport._producer.abortConnection()
 
+        if 'decompression_maxsize' in request.meta and \
+                chunk_callback is None and request.method != 'HEAD':
+            self._decompressor = self._get_decompressor(txresponse, request)
+
         d = defer.Deferred(_cancel)
-        txresponse.deliverBody(_ResponseReader(
-            d, txresponse, request, maxsize, warnsize, fail_on_dataloss))
+        reader = _ResponseReader(d, txresponse, request, maxsize, warnsize,
+                                 fail_on_dataloss, spoolsize,
+                                 self._decompressor, self._buckets)
+        if chunk_callback is not None:
+            url = urldefrag(request.url)[0]
+            reader.stream(chunk_callback, self._build_response(txresponse, url))
+        txresponse.deliverBody(reader)
 
         # save response for timeouts
         self._txresponse = txresponse
 
         return d
 
+    def _get_decompressor(self, txresponse, request):
+        # set by HttpCompressionMiddleware, which decodes the body otherwise
+        maxsize = request.meta['decompression_maxsize']
+        encodings = txresponse.headers.getRawHeaders(b'Content-Encoding')
+        if not encodings:
+            return None
+        decompressor = Decompressor.for_encoding(encodings[-1], maxsize)
+        if decompressor is not None:
+            # the response is built with the decoded body
+            if len(encodings) > 1:
+                txresponse.headers.setRawHeaders(b'Content-Encoding',
+                                                 encodings[:-1])
+            else:
+                txresponse.headers.removeHeader(b'Content-Encoding')
+        return decompressor
+
     def _cb_bodydone(self, result, request, url):
         txresponse, body, flags = result
+        response = self._build_response(txresponse, url, body, flags)
+        if self._decompressor is not None:
+            update_stats(self._stats, self._decompressor)
+            response.encoded_size = self._decompressor.encoded_size
+        return response
+
+    def _build_response(self, txresponse, url, body=None, flags=None):
         status = int(txresponse.code)
         headers = Headers(txresponse.headers.getAllRawHeaders())
-        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
-        return respcls(url=url, status=status, headers=headers, body=body, flags=flags)
+        if body is None or isinstance(body, bytes):
+            respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+            return respcls(url=url, status=status, headers=headers, body=body,
+                           flags=flags)
+        # spooled body, guess the response class from its beginning
+        respcls = responsetypes.from_args(headers=headers, url=url,
+                                          body=body.read(5000))
+        body.seek(0)
+        return respcls(url=url, status=status, headers=headers, body_file=body,
+                       flags=flags)
 
 
 @implementer(IBodyProducer)
@@ -420,7 +530,8 @@ class _RequestBodyProducer(object):
 class _ResponseReader(protocol.Protocol):
 
     def __init__(self, finished, txresponse, request, maxsize, warnsize,
-                 fail_on_dataloss):
+                 fail_on_dataloss, spoolsize=0, decompressor=None,
+                 buckets=None):
         self._finished = finished
         self._txresponse = txresponse
         self._request = request
@@ -431,6 +542,25 @@ class _ResponseReader(protocol.Protocol):
         self._fail_on_dataloss_warned = False
         self._reached_warnsize = False
         self._bytes_received = 0
+        self._spoolsize = spoolsize
+        self._spooled = False
+        self._decompressor = decompressor
+        self._chunk_callback = None
+        self._chunks = deque()  # received, not yet passed to _chunk_callback
+        self._pending = None  # deferred returned by _chunk_callback
+        self._lost_reason = None
+        self._buckets = buckets  # bandwidth limits, see get_bandwidth_buckets
+        self._throttled = None  # delayed call resuming the transport
+
+    def stream(self, chunk_callback, response):
+        """Pass body chunks to ``chunk_callback`` as they arrive, along with
+        ``response`` (without body), instead of buffering the body.
+
+        If the callback returns a deferred, the transport is paused and no
+        more chunks are passed until it fires.
+        """
+        self._chunk_callback = chunk_callback
+        self._response = response
 
     def dataReceived(self, bodyBytes):
         # This maybe called several times after cancel was called with buffered
@@ -438,8 +568,18 @@ class _ResponseReader(protocol.Protocol):
         if self._finished.called:
             return
 
-        self._bodybuf.write(bodyBytes)
         self._bytes_received += len(bodyBytes)
+        if self._buckets:
+            self._throttle(len(bodyBytes))
+        if self._chunk_callback is not None:
+            self._chunks.append(bodyBytes)
+            self._deliver()
+        else:
+            if self._decompressor is not None:
+                bodyBytes = self._decode(self._decompressor.decompress, bodyBytes)
+                if bodyBytes is None:
+                    return
+            self._write(bodyBytes)
 
         if self._maxsize and self._bytes_received > self._maxsize:
             logger.error("Received (%(bytes)s) bytes larger than download "
@@ -459,22 +599,120 @@ class _ResponseReader(protocol.Protocol):
                            {'warnsize': self._warnsize,
                             'request': self._request})
 
+    def _throttle(self, size):
+        delay = max([bucket.consume(size) for bucket in self._buckets])
+        if delay > 0 and self._throttled is None:
+            # over the bandwidth limit: stop reading until the debt is paid
+            self._txresponse._transport.pauseProducing()
+            self._throttled = reactor.callLater(delay, self._unthrottle)
+
+    def _unthrottle(self):
+        delay = max([bucket.delay() for bucket in self._buckets])
+        if delay > 0:
+            self._throttled = reactor.callLater(delay, self._unthrottle)
+            return
+        self._throttled = None
+        if self._pending is None and not self._finished.called:
+            self._txresponse._transport.resumeProducing()
+
+    def _write(self, data):
+        self._bodybuf.write(data)
+        if self._spoolsize and not self._spooled \
+                and self._bodybuf.tell() > self._spoolsize:
+            self._spool()
+
+    def _decode(self, func, *args):
+        try:
+            return func(*args)
+        except DecompressionMaxSizeExceeded:
+            logger.error("Decompressed size of %(request)s larger than "
+                         "decompression max size (%(maxsize)s).",
+                         {'request': self._request,
+                          'maxsize': self._decompressor.maxsize})
+            self._bodybuf.truncate(0)
+            self._finished.cancel()
+        except Exception:
+            self._abort(Failure())
+
+    def _spool(self):
+        # keep large bodies in a temporary file instead of memory
+        spool = tempfile.TemporaryFile(prefix='scrapy-body-')
+        spool.write(self._bodybuf.getvalue())
+        self._bodybuf = spool
+        self._spooled = True
+
+    def _getbody(self):
+        if not self._spooled:
+            return self._bodybuf.getvalue()
+        # handed over as Response.body_file, closed once the response is done
+        self._bodybuf.flush()
+        self._bodybuf.seek(0)
+        return self._bodybuf
+
+    def _deliver(self):
+        while self._chunks and self._pending is None and not self._finished.called:
+            chunk = self._chunks.popleft()
+            try:
+                result = self._chunk_callback(self._response, chunk)
+            except Exception:
+                self._abort(Failure())
+                return
+            if isinstance(result, defer.Deferred):
+                # backpressure: stop reading until the chunk is processed
+                self._pending = result
+                self._txresponse._transport.pauseProducing()
+                result.addCallbacks(self._delivered, self._abort)
+        if self._lost_reason is not None and self._pending is None \
+                and not self._chunks:
+            self.connectionLost(self._lost_reason)
+
+    def _delivered(self, _):
+        self._pending = None
+        if not self._finished.called:
+            if self._throttled is None:
+                self._txresponse._transport.resumeProducing()
+            self._deliver()
+
+    def _abort(self, failure):
+        self._pending = None
+        self._chunks.clear()
+        if not self._finished.called:
+            self._finished.errback(failure)
+            self._txresponse._transport.stopProducing()
+
     def connectionLost(self, reason):
+        if self._throttled is not None and self._throttled.active():
+            self._throttled.cancel()
+        self._throttled = None
         if self._finished.called:
+            self._bodybuf.close()
+            return
+
+        if self._chunks or self._pending is not None:
+            # finish once all chunks went through the chunk callback
+            self._lost_reason = reason
             return
+        self._lost_reason = None
 
-        body = self._bodybuf.getvalue()
+        if self._decompressor is not None:
+            tail = self._decode(self._decompressor.flush)
+            if tail is None:
+                self._bodybuf.close()
+                return
+            self._write(tail)
+        body = self._getbody()
+        flags = ['streamed'] if self._chunk_callback is not None else []
         if reason.check(ResponseDone):
-            self._finished.callback((self._txresponse, body, None))
+            self._finished.callback((self._txresponse, body, flags or None))
             return
 
         if reason.check(PotentialDataLoss):
-            self._finished.callback((self._txresponse, body, ['partial']))
+            self._finished.callback((self._txresponse, body, flags + ['partial']))
             return
 
         if reason.check(ResponseFailed) and any(r.check(_DataLoss) for r in reason.value.reasons):
             if not self._fail_on_dataloss:
-                self._finished.callback((self._txresponse, body, ['dataloss']))
+                self._finished.callback((self._txresponse, body, flags + ['dataloss']))
                 return
 
             elif not self._fail_on_dataloss_warned:
@@ -484,4 +722,5 @@ class _ResponseReader(protocol.Protocol):
                             self._txresponse.request.absoluteURI.decode())
                 self._fail_on_dataloss_warned = True
 
+        self._bodybuf.close()
         self._finished.errback(reason)
@@ -0,0 +1,518 @@
+"""Download handler for HTTP/2 over TLS, using the h2 library.
+
+Requests to the same origin are multiplexed as streams over a single
+connection. Whatever can't be downloaded over HTTP/2 (plain HTTP, proxied
+requests, servers which don't negotiate HTTP/2 through ALPN, or all requests
+if h2 is not installed) is downloaded by the HTTP/1.1 handler instead.
+"""
+
+import logging
+import tempfile
+from io import BytesIO
+from time import time
+from collections import deque
+
+from six.moves.urllib.parse import urldefrag
+from zope.interface import implementer
+from twisted.internet import defer, protocol, reactor
+from twisted.internet.endpoints import TCP4ClientEndpoint, wrapClientTLS
+from twisted.internet.error import ConnectionLost, TimeoutError
+from twisted.internet.interfaces import IHandshakeListener
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseFailed
+from twisted.web.http import _DataLoss
+
+try:
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.errors import ErrorCodes
+    from h2.events import (ConnectionTerminated, DataReceived,
+                           ResponseReceived, StreamEnded, StreamReset,
+                           WindowUpdated)
+    from h2.exceptions import H2Error
+except ImportError:
+    H2Connection = None
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler, \
+    get_bandwidth_buckets
+from scrapy.core.downloader.tls import openssl_methods
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.datatypes import LocalCache
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
+from scrapy.utils.python import to_bytes
+
+logger = logging.getLogger(__name__)
+
+# headers which are specific to an HTTP/1.1 connection, forbidden in HTTP/2
+_CONNECTION_HEADERS = frozenset([b'connection', b'host', b'keep-alive',
+                                 b'proxy-connection', b'transfer-encoding',
+                                 b'upgrade'])
+
+_ALPN_PROTOCOLS = [b'h2', b'http/1.1']
+
+
+class H2NotNegotiated(Exception):
+    """The server did not choose HTTP/2 during the TLS handshake."""
+
+
+class H2DownloadHandler(object):
+
+    def __init__(self, settings, crawler=None):
+        self._http11 = HTTP11DownloadHandler(settings, crawler)
+        self._crawler = crawler
+        self._enabled = H2Connection is not None
+        if not self._enabled:
+            logger.warning("h2 is not installed, HTTP/2 downloads are "
+                           "disabled and HTTP/1.1 will be used instead")
+        method = openssl_methods[settings.get('DOWNLOADER_CLIENT_TLS_METHOD')]
+        contextFactoryClass = load_object(settings['DOWNLOADER_CLIENTCONTEXTFACTORY'])
+        try:
+            # offer HTTP/2 and HTTP/1.1 through ALPN
+            self._contextFactory = contextFactoryClass(
+                method=method, acceptable_protocols=_ALPN_PROTOCOLS)
+        except TypeError:
+            # servers never negotiate HTTP/2 without ALPN, so all requests
+            # end up downloaded by the HTTP/1.1 handler
+            logger.warning("%(factory)s does not accept an "
+                           "'acceptable_protocols' argument, HTTP/2 "
+                           "downloads are disabled",
+                           {'factory': contextFactoryClass.__name__})
+            self._enabled = False
+            try:
+                self._contextFactory = contextFactoryClass(method=method)
+            except TypeError:
+                # the HTTP/1.1 handler already warned about it
+                self._contextFactory = contextFactoryClass()
+        if crawler is not None and hasattr(self._contextFactory, 'stats'):
+            self._contextFactory.stats = crawler.stats
+        if hasattr(self._contextFactory, 'resume_sessions'):
+            self._contextFactory.resume_sessions = settings.getbool(
+                'DOWNLOADER_TLS_SESSION_RESUMPTION')
+        self._pool = H2ConnectionPool(self._contextFactory)
+        self._default_maxsize = settings.getint('DOWNLOAD_MAXSIZE')
+        self._default_warnsize = settings.getint('DOWNLOAD_WARNSIZE')
+        self._default_spoolsize = settings.getint('DOWNLOAD_SPOOLSIZE')
+        self._fail_on_dataloss = settings.getbool('DOWNLOAD_FAIL_ON_DATALOSS')
+        self._connectTimeout = 10
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def download_request(self, request, spider):
+        """Return a deferred for the HTTP download"""
+        parsed = urlparse_cached(request)
+        key = (parsed.hostname, parsed.port or 443,
+               request.meta.get('bindaddress'))
+        if not self._enabled or parsed.scheme != 'https' \
+                or request.meta.get('proxy') \
+                or 'download_chunk_callback' in request.meta \
+                or key in self._pool.http11_keys:
+            return self._http11.download_request(request, spider)
+
+        timeout = request.meta.get('download_timeout') or self._connectTimeout
+        maxsize = request.meta.get('download_maxsize',
+            getattr(spider, 'download_maxsize', self._default_maxsize))
+        warnsize = request.meta.get('download_warnsize',
+            getattr(spider, 'download_warnsize', self._default_warnsize))
+        spoolsize = request.meta.get('download_spoolsize',
+                                     self._default_spoolsize)
+        fail_on_dataloss = request.meta.get('download_fail_on_dataloss',
+                                            self._fail_on_dataloss)
+        url = urldefrag(request.url)[0]
+        buckets = get_bandwidth_buckets(self._crawler, request)
+
+        d = self._pool.get_connection(key, timeout)
+        d.addCallback(lambda conn: conn.request(
+            request, url, time(), maxsize, warnsize, spoolsize,
+            fail_on_dataloss, buckets))
+        d.addErrback(self._cb_fallback, request, spider)
+        timeout_cl = reactor.callLater(timeout, d.cancel)
+        d.addBoth(self._cb_timeout, url, timeout, timeout_cl)
+        return d
+
+    def _cb_fallback(self, failure, request, spider):
+        failure.trap(H2NotNegotiated)
+        return self._http11.download_request(request, spider)
+
+    def _cb_timeout(self, result, url, timeout, timeout_cl):
+        if timeout_cl.active():
+            timeout_cl.cancel()
+            return result
+        raise TimeoutError("Getting %s took longer than %s seconds." % (url, timeout))
+
+    def close(self):
+        return defer.DeferredList([self._pool.close(), self._http11.close()])
+
+
+class H2ConnectionPool(object):
+    """Keep a single HTTP/2 connection per ``(host, port, bindaddress)``
+    key, and remember the keys of servers which don't support HTTP/2"""
+
+    def __init__(self, contextFactory):
+        self._contextFactory = contextFactory
+        self._connections = {}
+        self._waiting = {}  # key -> deferreds waiting for a new connection
+        self.http11_keys = LocalCache(10000)
+
+    def get_connection(self, key, timeout):
+        conn = self._connections.get(key)
+        if conn is not None and conn.usable:
+            return defer.succeed(conn)
+        d = defer.Deferred()
+        if key in self._waiting:
+            self._waiting[key].append(d)
+            return d
+        self._waiting[key] = [d]
+        host, port, bindaddress = key
+        creator = self._contextFactory.creatorForNetloc(to_bytes(host), port)
+        endpoint = wrapClientTLS(creator, TCP4ClientEndpoint(
+            reactor, host, port, timeout=timeout, bindAddress=bindaddress))
+        ready = defer.Deferred()
+        endpoint.connect(_H2ClientFactory(ready)).addErrback(
+            lambda f: None if ready.called else ready.errback(f))
+        ready.addBoth(self._connected, key)
+        return d
+
+    def _connected(self, result, key):
+        if isinstance(result, Failure):
+            if result.check(H2NotNegotiated):
+                self.http11_keys[key] = True
+        else:
+            self._connections[key] = result
+            result.closed.addBoth(self._lost, key, result)
+        for d in self._waiting.pop(key):
+            if d.called:  # cancelled
+                continue
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+    def _lost(self, _, key, conn):
+        if self._connections.get(key) is conn:
+            del self._connections[key]
+
+    def close(self):
+        closed = []
+        for conn in list(self._connections.values()):
+            closed.append(conn.closed)
+            conn.close()
+        return defer.DeferredList(closed)
+
+
+class _H2ClientFactory(protocol.Factory):
+
+    noisy = False
+
+    def __init__(self, ready):
+        self.ready = ready
+
+    def buildProtocol(self, addr):
+        return H2ClientProtocol(self.ready)
+
+
+@implementer(IHandshakeListener)
+class H2ClientProtocol(protocol.Protocol):
+    """HTTP/2 client connection, multiplexing requests as streams.
+
+    ``ready`` is fired with the protocol once HTTP/2 is negotiated, or fails
+    with :exc:`H2NotNegotiated` if the server chose another protocol.
+    """
+
+    def __init__(self, ready):
+        self.conn = H2Connection(config=H2Configuration(
+            client_side=True, header_encoding=None))
+        self.streams = {}
+        self.queue = deque()  # streams over the server concurrency limit
+        self.usable = True
+        self.closed = defer.Deferred()
+        self._ready = ready
+        self._delayed_acks = set()  # flow control held back by bandwidth limits
+
+    def handshakeCompleted(self):
+        ready, self._ready = self._ready, None
+        if self.transport.negotiatedProtocol != b'h2':
+            self.usable = False
+            self.transport.loseConnection()
+            ready.errback(H2NotNegotiated())
+            return
+        self.conn.initiate_connection()
+        self._flush()
+        ready.callback(self)
+
+    def request(self, request, url, start_time, maxsize, warnsize, spoolsize,
+                fail_on_dataloss, buckets=None):
+        stream = _Stream(self, request, url, start_time, maxsize, warnsize,
+                         spoolsize, fail_on_dataloss, buckets)
+        self.queue.append(stream)
+        self._open_streams()
+        return stream.deferred
+
+    def close(self):
+        self.usable = False
+        if self.transport is not None and self.transport.connected:
+            self.conn.close_connection()
+            self._flush()
+            self.transport.loseConnection()
+
+    def reset_stream(self, stream):
+        if stream in self.queue:
+            self.queue.remove(stream)
+        elif self.streams.pop(stream.id, None) is not None:
+            self.conn.reset_stream(stream.id, ErrorCodes.CANCEL)
+            self._flush()
+            self._open_streams()
+
+    def _open_streams(self):
+        limit = self.conn.remote_settings.max_concurrent_streams
+        while self.queue and self.usable and len(self.streams) < limit:
+            stream = self.queue.popleft()
+            stream.id = self.conn.get_next_available_stream_id()
+            self.streams[stream.id] = stream
+            self.conn.send_headers(stream.id, stream.request_headers(),
+                                   end_stream=not stream.pending_body)
+            self._send_body(stream)
+        self._flush()
+
+    def _send_body(self, stream):
+        while stream.pending_body:
+            size = min(self.conn.local_flow_control_window(stream.id),
+                       self.conn.max_outbound_frame_size,
+                       len(stream.pending_body))
+            if size <= 0:
+                return  # wait for a WindowUpdated event
+            data = stream.pending_body[:size]
+            stream.pending_body = stream.pending_body[size:]
+            self.conn.send_data(stream.id, data,
+                                end_stream=not stream.pending_body)
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.transport.write(data)
+
+    def dataReceived(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except H2Error as e:
+            logger.debug("HTTP/2 protocol error: %(error)s", {'error': e})
+            self.usable = False
+            self._flush()
+            self.transport.loseConnection()
+            return
+        for event in events:
+            stream = self.streams.get(getattr(event, 'stream_id', None))
+            if isinstance(event, ResponseReceived) and stream:
+                stream.receive_headers(event.headers)
+            elif isinstance(event, DataReceived):
+                delay = 0
+                if stream:
+                    stream.receive_data(event.data)
+                    delay = stream.throttle(len(event.data))
+                if event.stream_id not in self.streams:
+                    continue
+                if delay > 0:
+                    # over the bandwidth limit: the server waits for the
+                    # window update instead of the whole connection pausing
+                    self._delayed_acks.add(reactor.callLater(
+                        delay, self._acknowledge,
+                        event.flow_controlled_length, event.stream_id))
+                else:
+                    self.conn.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, StreamEnded) and stream:
+                del self.streams[event.stream_id]
+                stream.finish()
+            elif isinstance(event, StreamReset) and stream:
+                del self.streams[event.stream_id]
+                stream.lost(Failure(ResponseFailed([Failure(ConnectionLost(
+                    "HTTP/2 stream reset (error code %s)" % event.error_code))])))
+            elif isinstance(event, WindowUpdated):
+                if event.stream_id:
+                    if stream:
+                        self._send_body(stream)
+                else:
+                    for stream in list(self.streams.values()):
+                        self._send_body(stream)
+            elif isinstance(event, ConnectionTerminated):
+                self.usable = False
+                self._abort_streams(event.last_stream_id)
+                self.transport.loseConnection()
+        self._open_streams()
+
+    def _acknowledge(self, size, stream_id):
+        self._delayed_acks = set(c for c in self._delayed_acks if c.active())
+        if self.transport.connected:
+            self.conn.acknowledge_received_data(size, stream_id)
+            self._flush()
+
+    def _abort_streams(self, last_stream_id=0):
+        # streams never processed by the server can be safely retried
+        reason = Failure(ConnectionLost("HTTP/2 connection closed by the server"))
+        for stream_id, stream in list(self.streams.items()):
+            if stream_id > last_stream_id:
+                del self.streams[stream_id]
+                stream.lost(reason)
+        while self.queue:
+            self.queue.popleft().lost(reason)
+
+    def connectionLost(self, reason):
+        self.usable = False
+        for call in self._delayed_acks:
+            if call.active():
+                call.cancel()
+        self._delayed_acks.clear()
+        if self._ready is not None:
+            ready, self._ready = self._ready, None
+            ready.errback(reason)
+        self._abort_streams()
+        self.closed.callback(None)
+
+
+class _Stream(object):
+    """A request/response exchange over an HTTP/2 connection"""
+
+    def __init__(self, protocol, request, url, start_time, maxsize, warnsize,
+                 spoolsize, fail_on_dataloss, buckets=None):
+        self.protocol = protocol
+        self.request = request
+        self.url = url
+        self.start_time = start_time
+        self.maxsize = maxsize
+        self.warnsize = warnsize
+        self.spoolsize = spoolsize
+        self.fail_on_dataloss = fail_on_dataloss
+        self.id = None
+        self.pending_body = request.body
+        self.deferred = defer.Deferred(self._cancel)
+        self.status = None
+        self.headers = Headers()
+        self.body = BytesIO()
+        self.spooled = False
+        self.bytes_received = 0
+        self.reached_warnsize = False
+        self.buckets = buckets  # bandwidth limits
+
+    def request_headers(self):
+        parsed = urlparse_cached(self.request)
+        path = parsed.path or '/'
+        if parsed.params:
+            path += ';' + parsed.params
+        if parsed.query:
+            path += '?' + parsed.query
+        authority = self.request.headers.get(b'Host')
+        if authority is None:
+            authority = parsed.hostname
+            if ':' in authority:
+                authority = '[%s]' % authority  # IPv6 address
+            if parsed.port and parsed.port != 443:
+                authority += ':%d' % parsed.port
+        headers = [(b':method', to_bytes(self.request.method)),
+                   (b':authority', to_bytes(authority)),
+                   (b':scheme', b'https'),
+                   (b':path', to_bytes(path))]
+        for name, values in self.request.headers.items():
+            name = name.lower()
+            if name not in _CONNECTION_HEADERS:
+                headers.extend((name, value) for value in values)
+        if b'Content-Length' not in self.request.headers and \
+                (self.pending_body or self.request.method == 'POST'):
+            # like with HTTP/1.1, send "Content-Length: 0" for bodyless POSTs
+            headers.append((b'content-length',
+                            to_bytes(str(len(self.pending_body)))))
+        return headers
+
+    def receive_headers(self, headers):
+        self.request.meta['download_latency'] = time() - self.start_time
+        for name, value in headers:
+            if name == b':status':
+                self.status = int(value)
+            elif not name.startswith(b':'):
+                self.headers.appendlist(name, value)
+        expected_size = int(self.headers.get(b'Content-Length', -1))
+        if self.maxsize and expected_size > self.maxsize:
+            error_msg = ("Cancelling download of %(url)s: expected response "
+                         "size (%(size)s) larger than download max size (%(maxsize)s).")
+            error_args = {'url': self.url, 'size': expected_size,
+                          'maxsize': self.maxsize}
+            logger.error(error_msg, error_args)
+            self.deferred.errback(defer.CancelledError(error_msg % error_args))
+            self.protocol.reset_stream(self)
+        elif self.warnsize and expected_size > self.warnsize:
+            logger.warning("Expected response size (%(size)s) larger than "
+                           "download warn size (%(warnsize)s) in request %(request)s.",
+                           {'size': expected_size, 'warnsize': self.warnsize,
+                            'request': self.request})
+
+    def receive_data(self, data):
+        if self.deferred.called:
+            return
+        self.body.write(data)
+        self.bytes_received += len(data)
+        if self.spoolsize and not self.spooled \
+                and self.bytes_received > self.spoolsize:
+            # keep large bodies in a temporary file instead of memory
+            spool = tempfile.TemporaryFile(prefix='scrapy-body-')
+            spool.write(self.body.getvalue())
+            self.body = spool
+            self.spooled = True
+        if self.maxsize and self.bytes_received > self.maxsize:
+            logger.error("Received (%(bytes)s) bytes larger than download "
+                         "max size (%(maxsize)s) in request %(request)s.",
+                         {'bytes': self.bytes_received,
+                          'maxsize': self.maxsize,
+                          'request': self.request})
+            self.body.close()
+            self.deferred.cancel()
+            return
+        if self.warnsize and self.bytes_received > self.warnsize \
+                and not self.reached_warnsize:
+            self.reached_warnsize = True
+            logger.warning("Received more bytes than download "
+                           "warn size (%(warnsize)s) in request %(request)s.",
+                           {'warnsize': self.warnsize,
+                            'request': self.request})
+
+    def throttle(self, size):
+        """Take ``size`` received bytes from the bandwidth limits and return
+        the time to wait before acknowledging them"""
+        if not self.buckets:
+            return 0
+        return max([bucket.consume(size) for bucket in self.buckets])
+
+    def finish(self, flags=None):
+        if self.deferred.called:
+            return
+        if self.spooled:
+            # handed over as Response.body_file, closed once the response
+            # is done; guess the response class from its beginning
+            self.body.flush()
+            self.body.seek(0)
+            kwargs = {'body_file': self.body}
+            body = self.body.read(5000)
+            self.body.seek(0)
+        else:
+            body = self.body.getvalue()
+            kwargs = {'body': body}
+        respcls = responsetypes.from_args(headers=self.headers, url=self.url,
+                                          body=body)
+        self.deferred.callback(respcls(url=self.url, status=self.status,
+                                       headers=self.headers, flags=flags,
+                                       **kwargs))
+
+    def lost(self, reason):
+        if self.deferred.called:
+            return
+        if self.status is not None and self.bytes_received:
+            # the response was interrupted
+            if not self.fail_on_dataloss:
+                self.finish(['dataloss'])
+                return
+            reason = Failure(ResponseFailed([Failure(_DataLoss()), reason]))
+        self.deferred.errback(reason)
+
+    def _cancel(self, _):
+        self.protocol.reset_stream(self)
@@ -35,6 +35,15 @@ if twisted_version >= (14, 0, 0):
     except ImportError:
         SSL_CB_HANDSHAKE_START = 0x10
         SSL_CB_HANDSHAKE_DONE = 0x20
+    SSL_CB_ALERT = getattr(SSL, 'SSL_CB_ALERT', 0x4000)
+    # value of the info callback ``ret`` argument for a close_notify alert:
+    # the alert level (warning) in the high byte, its description (0) in the
+    # low byte
+    CLOSE_NOTIFY_ALERT = 1 << 8
+
+    # pyOpenSSL 0.14+
+    SESSION_RESUMPTION_SUPPORTED = hasattr(SSL.Connection, 'get_session') \
+        and hasattr(SSL.Connection, 'set_session')
 
     from twisted.internet.ssl import AcceptableCiphers
     from twisted.internet._sslverify import (ClientTLSOptions,
@@ -57,12 +66,32 @@ if twisted_version >= (14, 0, 0):
         Same as Twisted's private _sslverify.ClientTLSOptions,
         except that VerificationError and ValueError exceptions are caught,
         so that the connection is not closed, only logging warnings.
+
+        If ``resume_sessions`` is true (and pyOpenSSL supports it), the TLS
+        session of the last connection is resumed by the next one, saving a
+        full handshake when the server supports it. Handshakes are then
+        counted in ``stats``, if given.
         """
 
+        def __init__(self, hostname, ctx, resume_sessions=False, stats=None):
+            ClientTLSOptions.__init__(self, hostname, ctx)
+            self._resume_sessions = resume_sessions and \
+                SESSION_RESUMPTION_SUPPORTED
+            self._session = None
+            self._stats = stats
+
+        def clientConnectionForTLS(self, tlsProtocol):
+            connection = ClientTLSOptions.clientConnectionForTLS(self, tlsProtocol)
+            if self._session is not None:
+                connection.set_session(self._session)
+            return connection
+
         def _identityVerifyingInfoCallback(self, connection, where, ret):
             if where & SSL_CB_HANDSHAKE_START:
                 set_tlsext_host_name(connection, self._hostnameBytes)
             elif where & SSL_CB_HANDSHAKE_DONE:
+                if self._resume_sessions:
+                    self._handshake_done(connection)
                 try:
                     verifyHostname(connection, self._hostnameASCII)
                 except VerificationError as e:
@@ -75,5 +104,53 @@ if twisted_version >= (14, 0, 0):
                         'Ignoring error while verifying certificate '
                         'from host "{}" (exception: {})'.format(
                             self._hostnameASCII, repr(e)))
+            elif where & SSL_CB_ALERT and ret == CLOSE_NOTIFY_ALERT \
+                    and self._resume_sessions:
+                # TLS 1.3 session tickets arrive after the handshake, so
+                # keep the session again when the connection is cleanly closed
+                session = connection.get_session()
+                if session is not None:
+                    self._session = session
+
+        def _handshake_done(self, connection):
+            self._session = connection.get_session()
+            if self._stats is None:
+                return
+            try:
+                resumed = session_reused(connection)
+            except Exception:
+                # relies on private pyOpenSSL and cryptography APIs, which
+                # must not break the handshake
+                logger.debug('Cannot tell whether the TLS session was resumed',
+                             exc_info=True)
+                resumed = None
+            self._stats.inc_value('tls/handshakes')
+            if resumed is None:
+                return
+            if resumed:
+                self._stats.inc_value('tls/sessions_resumed')
+            self._stats.set_value('tls/session_resumption_rate', round(
+                self._stats.get_value('tls/sessions_resumed', 0) /
+                float(self._stats.get_value('tls/handshakes')), 4))
+
+
+    def _get_session_reused_function():
+        # SSL_session_reused() is not exposed by pyOpenSSL, look it up in
+        # the OpenSSL bindings of cryptography (which pyOpenSSL is built on)
+        try:
+            from cryptography.hazmat.bindings.openssl.binding import Binding
+            return getattr(Binding().lib, 'SSL_session_reused', None)
+        except Exception:
+            return None
+
+    _SSL_session_reused = _get_session_reused_function()
+
+    def session_reused(connection):
+        """Return whether the handshake of the ``OpenSSL.SSL.Connection``
+        resumed a previous session, or ``None`` if it can't be told"""
+        ssl = getattr(connection, '_ssl', None)
+        if _SSL_session_reused is None or ssl is None:
+            return None
+        return bool(_SSL_session_reused(ssl))
 
     DEFAULT_CIPHERS = AcceptableCiphers.fromOpenSSLCipherString('DEFAULT')
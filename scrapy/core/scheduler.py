@@ -1,11 +1,19 @@
 import os
 import json
+import shutil
+import hashlib
 import logging
+import tempfile
 from os.path import join, exists
 
+import six
+
+from scrapy.pqueues import pop_lowest
+from scrapy.squeues import SegmentedDiskPriorityQueue
 from scrapy.utils.reqser import request_to_dict, request_from_dict
 from scrapy.utils.misc import load_object
 from scrapy.utils.job import job_dir
+from scrapy.utils.python import to_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -13,48 +21,71 @@ logger = logging.getLogger(__name__)
 class Scheduler(object):
 
     def __init__(self, dupefilter, jobdir=None, dqclass=None, mqclass=None,
-                 logunser=False, stats=None, pqclass=None):
+                 logunser=False, stats=None, pqclass=None, crawler=None,
+                 mqlimit=0):
         self.df = dupefilter
         self.dqdir = self._dqdir(jobdir)
+        # without a job directory, requests past the memory queue limit are
+        # spilled to a temporary disk queue
+        self.mqlimit = mqlimit if not self.dqdir else 0
+        self.spilldir = None
+        # number of requests in the memory queue by priority, when spilling
+        self._mqprios = {}
         self.pqclass = pqclass
         self.dqclass = dqclass
         self.mqclass = mqclass
         self.logunser = logunser
         self.stats = stats
+        self.crawler = crawler
 
     @classmethod
     def from_crawler(cls, crawler):
         settings = crawler.settings
         dupefilter_cls = load_object(settings['DUPEFILTER_CLASS'])
-        dupefilter = dupefilter_cls.from_settings(settings)
+        if hasattr(dupefilter_cls, 'from_crawler'):
+            dupefilter = dupefilter_cls.from_crawler(crawler)
+        else:
+            dupefilter = dupefilter_cls.from_settings(settings)
         pqclass = load_object(settings['SCHEDULER_PRIORITY_QUEUE'])
         dqclass = load_object(settings['SCHEDULER_DISK_QUEUE'])
         mqclass = load_object(settings['SCHEDULER_MEMORY_QUEUE'])
         logunser = settings.getbool('LOG_UNSERIALIZABLE_REQUESTS', settings.getbool('SCHEDULER_DEBUG'))
+        mqlimit = settings.getint('SCHEDULER_MEMORY_QUEUE_LIMIT')
         return cls(dupefilter, jobdir=job_dir(settings), logunser=logunser,
-                   stats=crawler.stats, pqclass=pqclass, dqclass=dqclass, mqclass=mqclass)
+                   stats=crawler.stats, pqclass=pqclass, dqclass=dqclass, mqclass=mqclass,
+                   crawler=crawler, mqlimit=mqlimit)
 
     def has_pending_requests(self):
         return len(self) > 0
 
     def open(self, spider):
         self.spider = spider
-        self.mqs = self.pqclass(self._newmq)
+        self.mqs = self._newpq(self._newmq)
+        if self.mqlimit:
+            self.spilldir = self.dqdir = tempfile.mkdtemp(prefix='scrapy-requests-')
         self.dqs = self._dq() if self.dqdir else None
         return self.df.open()
 
     def close(self, reason):
-        if self.dqs:
-            prios = self.dqs.close()
-            with open(join(self.dqdir, 'active.json'), 'w') as f:
-                json.dump(prios, f)
+        try:
+            if self.dqs is not None:
+                prios = self.dqs.close()
+                if not self.spilldir:
+                    with open(join(self.dqdir, 'active.json'), 'w') as f:
+                        json.dump(prios, f)
+        finally:
+            if self.spilldir:
+                shutil.rmtree(self.spilldir, ignore_errors=True)
         return self.df.close(reason)
 
     def enqueue_request(self, request):
         if not request.dont_filter and self.df.request_seen(request):
             self.df.log(request, self.spider)
             return False
-        dqok = self._dqpush(request)
+        if self.spilldir:
+            dqok = self._spill(request)
+        else:
+            dqok = self._dqpush(request)
         if dqok:
             self.stats.inc_value('scheduler/enqueued/disk', spider=self.spider)
         else:
@@ -64,7 +95,7 @@ class Scheduler(object):
         return True
 
     def next_request(self):
-        request = self.mqs.pop()
+        request = self._mqpop()
         if request:
             self.stats.inc_value('scheduler/dequeued/memory', spider=self.spider)
         else:
@@ -73,6 +104,8 @@ class Scheduler(object):
                 self.stats.inc_value('scheduler/dequeued/disk', spider=self.spider)
         if request:
             self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        if self.spilldir:
+            self._refill_mq()
         return request
 
     def __len__(self):
@@ -100,6 +133,62 @@ class Scheduler(object):
 
     def _mqpush(self, request):
         self.mqs.push(request, -request.priority)
+        if self.spilldir:
+            self._mqprios[request.priority] = \
+                self._mqprios.get(request.priority, 0) + 1
+
+    def _mqpop(self):
+        request = self.mqs.pop()
+        if request is not None and self.spilldir:
+            self._mqforget(request)
+        return request
+
+    def _mqforget(self, request):
+        if self._mqprios[request.priority] == 1:
+            del self._mqprios[request.priority]
+        else:
+            self._mqprios[request.priority] -= 1
+
+    def _spill(self, request):
+        """Push ``request`` to the disk queue if it doesn't belong in memory,
+        return True if it was pushed.
+
+        The memory queue keeps the highest priority requests: everything
+        spilled to disk has a lower (or the same) priority than everything in
+        memory, so that requests are still popped by priority.
+        """
+        if not self._mqprios:
+            return False
+        lowest = min(self._mqprios)
+        if len(self.mqs) < self.mqlimit:
+            if request.priority < lowest and len(self.dqs):
+                return self._dqpush(request)
+            return False
+        if request.priority <= lowest:
+            return self._dqpush(request)
+        # memory is full: make room by spilling one of the lowest priority
+        # requests in memory instead
+        spilled = pop_lowest(self.mqs)
+        if spilled is None:  # not supported by SCHEDULER_PRIORITY_QUEUE
+            return self._dqpush(request)
+        self._mqforget(spilled)
+        if self._dqpush(spilled):
+            self.stats.inc_value('scheduler/moved/disk', spider=self.spider)
+        else:
+            self._mqpush(spilled)
+        return False
+
+    def _refill_mq(self):
+        # move spilled requests back to memory in batches, once the memory
+        # queue is half empty
+        if len(self.mqs) > self.mqlimit // 2:
+            return
+        for _ in range(min(len(self.dqs), self.mqlimit - len(self.mqs))):
+            request = self._dqpop()
+            if request is None:
+                break
+            self._mqpush(request)
+            self.stats.inc_value('scheduler/moved/memory', spider=self.spider)
 
     def _dqpop(self):
         if self.dqs:
@@ -107,20 +196,32 @@ class Scheduler(object):
             if d:
                 return request_from_dict(d, self.spider)
 
-    def _newmq(self, priority):
+    def _newpq(self, qfactory, startprios=()):
+        if self.crawler is not None and hasattr(self.pqclass, 'from_crawler'):
+            return self.pqclass.from_crawler(self.crawler, qfactory, startprios)
+        return self.pqclass(qfactory, startprios)
+
+    def _newmq(self, priority, slot=None):
         return self.mqclass()
 
-    def _newdq(self, priority):
-        return self.dqclass(join(self.dqdir, 'p%s' % priority))
+    def _newdq(self, priority, slot=None):
+        if slot is None:
+            return self.dqclass(join(self.dqdir, 'p%s' % priority))
+        return self.dqclass(join(self.dqdir, _path_safe(slot), 'p%s' % priority))
 
     def _dq(self):
-        activef = join(self.dqdir, 'active.json')
-        if exists(activef):
-            with open(activef) as f:
-                prios = json.load(f)
+        if isinstance(self.dqclass, type) and \
+                issubclass(self.dqclass, SegmentedDiskPriorityQueue):
+            # already a priority queue, no need for one queue per priority
+            q = self.dqclass(self.dqdir)
         else:
-            prios = ()
-        q = self.pqclass(self._newdq, startprios=prios)
+            activef = join(self.dqdir, 'active.json')
+            if exists(activef):
+                with open(activef) as f:
+                    prios = json.load(f)
+            else:
+                prios = ()
+            q = self._newpq(self._newdq, startprios=prios)
         if q:
             logger.info("Resuming crawl (%(queuesize)d requests scheduled)",
                         {'queuesize': len(q)}, extra={'spider': self.spider})
@@ -132,3 +233,18 @@ class Scheduler(object):
             if not exists(dqdir):
                 os.makedirs(dqdir)
             return dqdir
+
+
+def _path_safe(text):
+    """Return a filesystem-safe (and still unique) version of ``text``, used
+    for naming the disk queue directory of a download slot.
+
+    >>> _path_safe('example.com').startswith('example.com-')
+    True
+    >>> _path_safe('some@symbol?').startswith('some_symbol_-')
+    True
+    """
+    text = six.text_type(text)
+    pathable = ''.join(c if c.isalnum() or c in '-._' else '_' for c in text)
+    # the digest keeps slots with the same "pathable" name apart
+    return '%s-%s' % (pathable, hashlib.md5(to_bytes(text)).hexdigest())
@@ -17,6 +17,7 @@ from scrapy.http import Request, Response
 from scrapy.item import BaseItem
 from scrapy.core.spidermw import SpiderMiddlewareManager
 from scrapy.utils.request import referer_str
+from scrapy.utils.response import response_body_size
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +39,7 @@ class Slot(object):
         deferred = defer.Deferred()
         self.queue.append((response, request, deferred))
         if isinstance(response, Response):
-            self.active_size += max(len(response.body), self.MIN_RESPONSE_SIZE)
+            self.active_size += self._response_size(response)
         else:
             self.active_size += self.MIN_RESPONSE_SIZE
         return deferred
@@ -51,10 +52,15 @@ class Slot(object):
     def finish_response(self, response, request):
         self.active.remove(request)
         if isinstance(response, Response):
-            self.active_size -= max(len(response.body), self.MIN_RESPONSE_SIZE)
+            self.active_size -= self._response_size(response)
+            if response.body_file is not None:
+                response.body_file.close()
         else:
             self.active_size -= self.MIN_RESPONSE_SIZE
 
+    def _response_size(self, response):
+        return max(response_body_size(response), self.MIN_RESPONSE_SIZE)
+
     def is_idle(self):
         return not (self.queue or self.active)
 
@@ -8,7 +8,6 @@ from twisted.internet import reactor, defer
 from zope.interface.verify import verifyClass, DoesNotImplement
 
 from scrapy.core.engine import ExecutionEngine
-from scrapy.resolver import CachingThreadedResolver
 from scrapy.interfaces import ISpiderLoader
 from scrapy.extension import ExtensionManager
 from scrapy.settings import overridden_settings, Settings
@@ -268,8 +267,9 @@ class CrawlerProcess(CrawlerRunner):
     def start(self, stop_after_crawl=True):
         """
         This method starts a Twisted `reactor`_, adjusts its pool size to
-        :setting:`REACTOR_THREADPOOL_MAXSIZE`, and installs a DNS cache based
-        on :setting:`DNSCACHE_ENABLED` and :setting:`DNSCACHE_SIZE`.
+        :setting:`REACTOR_THREADPOOL_MAXSIZE`, and installs the
+        :setting:`DNS_RESOLVER`, with a DNS cache based on
+        :setting:`DNSCACHE_ENABLED` and :setting:`DNSCACHE_SIZE`.
 
         If `stop_after_crawl` is True, the reactor will be stopped after all
         crawlers have finished, using :meth:`join`.
@@ -291,15 +291,8 @@ class CrawlerProcess(CrawlerRunner):
         reactor.run(installSignalHandlers=False)  # blocking call
 
     def _get_dns_resolver(self):
-        if self.settings.getbool('DNSCACHE_ENABLED'):
-            cache_size = self.settings.getint('DNSCACHE_SIZE')
-        else:
-            cache_size = 0
-        return CachingThreadedResolver(
-            reactor=reactor,
-            cache_size=cache_size,
-            timeout=self.settings.getfloat('DNS_TIMEOUT')
-        )
+        resolver_class = load_object(self.settings['DNS_RESOLVER'])
+        return resolver_class.from_settings(self.settings, reactor)
 
     def _graceful_stop_reactor(self):
         d = self.stop()
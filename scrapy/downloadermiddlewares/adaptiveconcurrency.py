@@ -0,0 +1,167 @@
+"""
+Adaptive concurrency middleware
+
+See documentation in docs/topics/downloader-middleware.rst
+"""
+import logging
+import weakref
+from collections import deque
+from email.utils import mktime_tz, parsedate_tz
+from time import time
+
+import six
+from twisted.internet import defer
+from twisted.internet.error import TimeoutError, TCPTimedOutError
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.python import to_native_str
+
+logger = logging.getLogger(__name__)
+
+
+class _SlotState(object):
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.base_latency = None
+        self.credit = 0.0
+        self.last_decrease = 0
+        self.hold_until = 0
+
+
+class AdaptiveConcurrencyMiddleware(object):
+    """Adjust the concurrency of each download slot: additive increase while
+    the slot responds fine, multiplicative decrease on congestion"""
+
+    EXCEPTIONS_TO_DECREASE = (defer.TimeoutError, TimeoutError,
+                              TCPTimedOutError)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = settings.getint('ADAPTIVE_CONCURRENCY_MIN')
+        self.max_concurrency = settings.getint('ADAPTIVE_CONCURRENCY_MAX')
+        self.decrease_factor = settings.getfloat('ADAPTIVE_CONCURRENCY_DECREASE_FACTOR')
+        self.latency_factor = settings.getfloat('ADAPTIVE_CONCURRENCY_LATENCY_FACTOR')
+        self.window = settings.getint('ADAPTIVE_CONCURRENCY_WINDOW')
+        self.max_retry_after = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_RETRY_AFTER')
+        self.http_codes = set(int(x) for x in
+                              settings.getlist('ADAPTIVE_CONCURRENCY_HTTP_CODES'))
+        self.debug = settings.getbool('ADAPTIVE_CONCURRENCY_DEBUG')
+        # slots are removed by the downloader when unused, and their state
+        # goes away with them
+        self._states = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_response(self, request, response, spider):
+        key, slot = self._get_slot(request)
+        latency = request.meta.get('download_latency')
+        if slot is None or latency is None or 'cached' in response.flags:
+            return response
+        now = time()
+        if response.status in self.http_codes:
+            self._decrease(key, slot, spider, now, now - latency,
+                           self._retry_after(response, now))
+        else:
+            self._response(key, slot, spider, now, latency)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, self.EXCEPTIONS_TO_DECREASE):
+            return
+        key, slot = self._get_slot(request)
+        if slot is not None:
+            now = time()
+            started = now - request.meta.get('download_timeout', 0)
+            self._decrease(key, slot, spider, now, started)
+
+    def _get_slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def _get_state(self, slot):
+        state = self._states.get(slot)
+        if state is None:
+            state = self._states[slot] = _SlotState(self.window)
+        return state
+
+    def _response(self, key, slot, spider, now, latency):
+        state = self._get_state(slot)
+        state.latencies.append(latency)
+        if state.base_latency is None or latency < state.base_latency:
+            state.base_latency = latency
+        if len(state.latencies) == self.window and \
+                percentile(state.latencies, 90) > \
+                self.latency_factor * state.base_latency:
+            # responses are getting slower than the fastest ones seen
+            self._decrease(key, slot, spider, now, now - latency)
+            return
+        if now < state.hold_until or slot.concurrency >= self.max_concurrency:
+            return
+        # about one more concurrent request per round of responses
+        state.credit += 1.0 / slot.concurrency
+        if state.credit >= 1:
+            state.credit = 0.0
+            self._set_concurrency(key, slot, spider, slot.concurrency + 1)
+            self.stats.inc_value('adaptive_concurrency/increases', spider=spider)
+
+    def _decrease(self, key, slot, spider, now, started, hold=0):
+        state = self._get_state(slot)
+        state.hold_until = max(state.hold_until, now + hold)
+        # requests sent before the last decrease don't count, they were
+        # sent with the old concurrency
+        if started < state.last_decrease:
+            return
+        state.last_decrease = now
+        state.credit = 0.0
+        # the latencies seen so far are the new reference
+        if state.latencies:
+            state.base_latency = min(state.latencies)
+            state.latencies.clear()
+        concurrency = max(self.min_concurrency,
+                          int(slot.concurrency * self.decrease_factor))
+        self._set_concurrency(key, slot, spider, concurrency)
+        self.stats.inc_value('adaptive_concurrency/decreases', spider=spider)
+
+    def _set_concurrency(self, key, slot, spider, concurrency):
+        if concurrency == slot.concurrency:
+            return
+        if self.debug:
+            logger.info("slot: %(slot)s | concurrency: %(old)d -> %(new)d",
+                        {'slot': key, 'old': slot.concurrency,
+                         'new': concurrency}, extra={'spider': spider})
+        slot.concurrency = concurrency
+        self.stats.max_value('adaptive_concurrency/max_slot_concurrency',
+                             concurrency, spider=spider)
+        # rebuilt from the live slots (the downloader removes idle ones), so
+        # that it doesn't grow with the number of domains crawled
+        slots = self.crawler.engine.downloader.slots
+        self.stats.set_value('adaptive_concurrency/slots', dict(
+            (k, s.concurrency) for k, s in six.iteritems(slots)),
+            spider=spider)
+
+    def _retry_after(self, response, now):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return 0
+        value = to_native_str(value).strip()
+        if value.isdigit():
+            delay = int(value)
+        else:
+            date = parsedate_tz(value)
+            if date is None:
+                return 0
+            delay = mktime_tz(date) - now
+        return min(max(delay, 0), self.max_retry_after)
+
+
+def percentile(values, p):
+    """Return the ``p`` percentile (0-100) of ``values``, nearest rank"""
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
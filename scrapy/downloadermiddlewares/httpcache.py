@@ -41,8 +41,10 @@ class HttpCacheMiddleware(object):
         if request.meta.get('dont_cache', False):
             return
 
-        # Skip uncacheable requests
-        if not self.policy.should_cache_request(request):
+        # Skip uncacheable requests. Streamed downloads are never stored, as
+        # their body is handed to download_chunk_callback instead
+        if (request.meta.get('download_chunk_callback') or
+                not self.policy.should_cache_request(request)):
             request.meta['_dont_cache'] = True  # flag as uncacheable
             return
 
@@ -101,7 +103,8 @@ class HttpCacheMiddleware(object):
             return cachedresponse
 
     def _cache_response(self, spider, response, request, cachedresponse):
-        if self.policy.should_cache_response(response, request):
+        if ('streamed' not in response.flags and
+                self.policy.should_cache_response(response, request)):
             self.stats.inc_value('httpcache/store', spider=spider)
             self.storage.store_response(spider, request, response)
         else:
@@ -1,42 +1,47 @@
-import zlib
+import logging
 
-from scrapy.utils.gz import gunzip
 from scrapy.http import Response, TextResponse
 from scrapy.responsetypes import responsetypes
-from scrapy.exceptions import NotConfigured
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.decompression import ACCEPTED_ENCODINGS, Decompressor, \
+    DecompressionMaxSizeExceeded
 
-
-ACCEPTED_ENCODINGS = [b'gzip', b'deflate']
-
-try:
-    import brotli
-    ACCEPTED_ENCODINGS.append(b'br')
-except ImportError:
-    pass
+logger = logging.getLogger(__name__)
 
 
 class HttpCompressionMiddleware(object):
     """This middleware allows compressed (gzip, deflate) traffic to be
     sent/received from web sites"""
+
+    def __init__(self, stats=None, maxsize=0):
+        self.stats = stats
+        self.maxsize = maxsize
+
     @classmethod
     def from_crawler(cls, crawler):
         if not crawler.settings.getbool('COMPRESSION_ENABLED'):
             raise NotConfigured
-        return cls()
+        return cls(crawler.stats,
+                   crawler.settings.getint('DECOMPRESSION_MAXSIZE'))
 
     def process_request(self, request, spider):
+        if 'download_chunk_callback' in request.meta:
+            return  # streamed bodies are not decoded, see below
         request.headers.setdefault('Accept-Encoding',
                                    b",".join(ACCEPTED_ENCODINGS))
+        # also tells the HTTP/1.1 download handler to decode the body
+        # while it is downloaded
+        request.meta.setdefault('decompression_maxsize', self.maxsize)
 
     def process_response(self, request, response, spider):
 
-        if request.method == 'HEAD':
+        if request.method == 'HEAD' or 'streamed' in response.flags:
             return response
         if isinstance(response, Response):
             content_encoding = response.headers.getlist('Content-Encoding')
             if content_encoding:
                 encoding = content_encoding.pop()
-                decoded_body = self._decode(response.body, encoding.lower())
+                decoded_body = self._decode(request, response, encoding, spider)
                 respcls = responsetypes.from_args(headers=response.headers, \
                     url=response.url, body=decoded_body)
                 kwargs = dict(cls=respcls, body=decoded_body)
@@ -50,20 +55,31 @@ class HttpCompressionMiddleware(object):
 
         return response
 
-    def _decode(self, body, encoding):
-        if encoding == b'gzip' or encoding == b'x-gzip':
-            body = gunzip(body)
-
-        if encoding == b'deflate':
-            try:
-                body = zlib.decompress(body)
-            except zlib.error:
-                # ugly hack to work with raw deflate content that may
-                # be sent by microsoft servers. For more information, see:
-                # http://carsten.codimi.de/gzip.yaws/
-                # http://www.port80software.com/200ok/archive/2005/10/31/868.aspx
-                # http://www.gzip.org/zlib/zlib_faq.html#faq38
-                body = zlib.decompress(body, -15)
-        if encoding == b'br' and b'br' in ACCEPTED_ENCODINGS:
-            body = brotli.decompress(body)
+    def _decode(self, request, response, encoding, spider):
+        maxsize = request.meta.get('decompression_maxsize', self.maxsize)
+        decompressor = Decompressor.for_encoding(encoding, maxsize)
+        if decompressor is None:
+            return response.body
+        try:
+            body = decompressor.decompress(response.body) + decompressor.flush()
+        except DecompressionMaxSizeExceeded:
+            logger.error("Cancelled decoding of %(request)s: decompressed "
+                         "size larger than decompression max size "
+                         "(%(maxsize)s).",
+                         {'request': request, 'maxsize': maxsize},
+                         extra={'spider': spider})
+            raise IgnoreRequest("Decompressed size of %s larger than %d "
+                                "bytes" % (request, maxsize))
+        update_stats(self.stats, decompressor, spider)
         return body
+
+
+def update_stats(stats, decompressor, spider=None):
+    """Count a response decoded by ``decompressor`` in the stats"""
+    if not stats:
+        return
+    stats.inc_value('httpcompression/response_count', spider=spider)
+    stats.inc_value('httpcompression/response_bytes', decompressor.size,
+                    spider=spider)
+    stats.inc_value('httpcompression/encoded_bytes',
+                    decompressor.encoded_size, spider=spider)
@@ -1,7 +1,45 @@
+from twisted.web import http
+from six.moves.urllib.parse import urlunparse
+
 from scrapy.exceptions import NotConfigured
-from scrapy.utils.request import request_httprepr
-from scrapy.utils.response import response_httprepr
-from scrapy.utils.python import global_object_name
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.python import global_object_name, to_bytes
+from scrapy.utils.response import response_body_size
+
+
+def get_header_size(headers):
+    """Return the length of ``headers.to_string()``, without building it"""
+    size = lines = 0
+    for key, values in headers.items():
+        size += len(values) * (len(key) + 2)  # b'key: value'
+        size += sum(len(value) for value in values)
+        lines += len(values)
+    return size + 2 * (lines - 1) if lines else 0  # b'\r\n' between lines
+
+
+def get_request_size(request):
+    """Return the length of
+    :func:`~scrapy.utils.request.request_httprepr` for ``request``,
+    without building it"""
+    parsed = urlparse_cached(request)
+    path = urlunparse(('', '', parsed.path or '/', parsed.params,
+                       parsed.query, ''))
+    size = len(to_bytes(request.method)) + len(to_bytes(path)) + 12
+    size += len(to_bytes(parsed.hostname or b'')) + 8
+    if request.headers:
+        size += get_header_size(request.headers) + 2
+    return size + 2 + len(request.body)
+
+
+def get_response_size(response):
+    """Return the length of
+    :func:`~scrapy.utils.response.response_httprepr` for ``response``,
+    without building it"""
+    size = len(to_bytes(str(response.status))) + 12
+    size += len(to_bytes(http.RESPONSES.get(response.status, b'')))
+    if response.headers:
+        size += get_header_size(response.headers) + 2
+    return size + 2 + response_body_size(response)
 
 
 class DownloaderStats(object):
@@ -18,13 +56,16 @@ class DownloaderStats(object):
     def process_request(self, request, spider):
         self.stats.inc_value('downloader/request_count', spider=spider)
         self.stats.inc_value('downloader/request_method_count/%s' % request.method, spider=spider)
-        reqlen = len(request_httprepr(request))
+        reqlen = get_request_size(request)
         self.stats.inc_value('downloader/request_bytes', reqlen, spider=spider)
 
     def process_response(self, request, response, spider):
         self.stats.inc_value('downloader/response_count', spider=spider)
         self.stats.inc_value('downloader/response_status_count/%s' % response.status, spider=spider)
-        reslen = len(response_httprepr(response))
+        reslen = get_response_size(response)
+        if response.encoded_size is not None:
+            # count the body as received, like for other download handlers
+            reslen += response.encoded_size - response_body_size(response)
         self.stats.inc_value('downloader/response_bytes', reslen, spider=spider)
         return response
 
@@ -1,9 +1,24 @@
 from __future__ import print_function
 import os
+import struct
+import hashlib
+import shutil
 import logging
+import binascii
+import tempfile
+from time import time
 
+import six
+
+from scrapy import signals
+from scrapy.utils.bloom import ScalableBloomFilter
+from scrapy.utils.datatypes import FingerprintSet, FingerprintTimestamps
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.job import job_dir
-from scrapy.utils.request import request_fingerprint
+from scrapy.utils.lsm import LSMFingerprintSet
+from scrapy.utils.python import to_bytes
+from scrapy.utils.request import request_fingerprint, \
+    request_fingerprint_digest
 
 
 class BaseDupeFilter(object):
@@ -55,6 +70,12 @@ class RFPDupeFilter(BaseDupeFilter):
     def request_fingerprint(self, request):
         return request_fingerprint(request)
 
+    def request_digest(self, request, size=20):
+        """Return ``size`` bytes of binary fingerprint for ``request``, used
+        instead of :meth:`request_fingerprint` by filters which store binary
+        fingerprints. Override both to change how duplicates are checked."""
+        return request_fingerprint_digest(request)[:size]
+
     def close(self, reason):
         if self.file:
             self.file.close()
@@ -71,3 +92,332 @@ class RFPDupeFilter(BaseDupeFilter):
             self.logdupes = False
 
         spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+
+
+class CompactRFPDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter which keeps fingerprints as
+    binary digests (optionally truncated to ``digest_size`` bytes) in a
+    :class:`~scrapy.utils.datatypes.FingerprintSet`, instead of a ``set`` of
+    hexadecimal strings.
+
+    The ``requests.seen`` file in the job directory uses the same format as
+    :class:`RFPDupeFilter`, so both filters can resume each other's crawls.
+    """
+
+    def __init__(self, path=None, debug=False, digest_size=20, stats=None):
+        super(CompactRFPDupeFilter, self).__init__(debug=debug)
+        self.fingerprints = FingerprintSet(digest_size)
+        self.stats = stats
+        if path:
+            self.file = open(os.path.join(path, 'requests.seen'), 'a+')
+            self.file.seek(0)
+            self.fingerprints.update(self._digest(x.rstrip()) for x in self.file)
+        self._update_stats()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                   settings.getint('DUPEFILTER_DIGEST_SIZE'), crawler.stats)
+
+    def request_seen(self, request):
+        digest = self.request_digest(request, self.fingerprints.size)
+        if not self.fingerprints.add(digest):
+            return True
+        if self.file:
+            self.file.write(self.request_fingerprint(request) + os.linesep)
+        if self.fingerprints.nbytes != self._nbytes:
+            self._update_stats()
+
+    def close(self, reason):
+        self._update_stats()
+        super(CompactRFPDupeFilter, self).close(reason)
+
+    def _digest(self, fp):
+        return _fingerprint_digest(fp, self.fingerprints.size)
+
+    def _update_stats(self):
+        self._nbytes = self.fingerprints.nbytes
+        if self.stats is not None:
+            self.stats.set_value('dupefilter/memory', self._nbytes)
+            self.stats.set_value('dupefilter/fingerprints', len(self.fingerprints))
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter based on a scalable Bloom
+    filter (see :class:`~scrapy.utils.bloom.ScalableBloomFilter`).
+
+    It uses a small fraction of the memory of :class:`RFPDupeFilter`, but
+    with a (configurable) probability of filtering requests that were never
+    seen. When a job directory is used, the filter is stored in memory-mapped
+    files under ``requests.bloom``, so resuming a crawl does not need to read
+    any previous fingerprints.
+    """
+
+    def __init__(self, path=None, debug=False, capacity=1000000,
+                 error_rate=0.001, stats=None):
+        super(BloomDupeFilter, self).__init__(debug=debug)
+        if path:
+            path = os.path.join(path, 'requests.bloom')
+        self.fingerprints = ScalableBloomFilter(capacity, error_rate, path)
+        self.stats = stats
+        self._nstages = 0
+        self._update_stats()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                   settings.getint('DUPEFILTER_BLOOM_CAPACITY'),
+                   settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE'),
+                   crawler.stats)
+
+    def request_seen(self, request):
+        if not self.fingerprints.add(self.request_digest(request, 16)):
+            return True
+        if len(self.fingerprints.stages) != self._nstages:
+            self._update_stats()
+
+    def close(self, reason):
+        self._update_stats()
+        self.fingerprints.close()
+
+    def _update_stats(self):
+        self._nstages = len(self.fingerprints.stages)
+        if self.stats is not None:
+            self.stats.set_value('dupefilter/memory', self.fingerprints.nbytes)
+            self.stats.set_value('dupefilter/fingerprints', len(self.fingerprints))
+            self.stats.set_value('dupefilter/false_positive_probability',
+                                 self.fingerprints.false_positive_probability())
+
+
+class LSMDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter which keeps fingerprints on disk,
+    in a :class:`~scrapy.utils.lsm.LSMFingerprintSet`.
+
+    Only the last ``buffer_size`` new fingerprints are kept in memory, older
+    ones are stored in sorted, memory-mapped segments (each with its own
+    Bloom filter) which are merged in a thread as they pile up. This keeps
+    memory usage bounded for crawls of billions of requests, without false
+    positives. Fingerprints are stored under ``requests.lsm`` in the job
+    directory, or in a temporary directory removed on close if there isn't
+    one.
+    """
+
+    def __init__(self, path=None, debug=False, digest_size=20,
+                 buffer_size=1000000, stats=None, background=True):
+        super(LSMDupeFilter, self).__init__(debug=debug)
+        if path:
+            self.tmpdir = None
+            path = os.path.join(path, 'requests.lsm')
+        else:
+            self.tmpdir = path = tempfile.mkdtemp(prefix='scrapy-seen-')
+        # segment Bloom filters need digests of at least 16 bytes
+        self.fingerprints = LSMFingerprintSet(
+            path, max(digest_size, 16), buffer_size, background=background)
+        self.stats = stats
+        self._nsegments = None
+        self._update_stats()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                   settings.getint('DUPEFILTER_DIGEST_SIZE'),
+                   settings.getint('DUPEFILTER_LSM_BUFFER_SIZE'),
+                   crawler.stats)
+
+    def request_seen(self, request):
+        digest = self.request_digest(request, self.fingerprints.size)
+        if not self.fingerprints.add(digest):
+            return True
+        if len(self.fingerprints.segments) != self._nsegments:
+            self._update_stats()
+
+    def close(self, reason):
+        d = self.fingerprints.close()
+        if d is not None:
+            return d.addCallback(self._closed)
+        self._closed()
+
+    def _closed(self, _=None):
+        self._update_stats()
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _update_stats(self):
+        self._nsegments = len(self.fingerprints.segments)
+        if self.stats is not None:
+            self.stats.set_value('dupefilter/memory', self.fingerprints.nbytes)
+            self.stats.set_value('dupefilter/fingerprints', len(self.fingerprints))
+            self.stats.set_value('dupefilter/segments', self._nsegments)
+            self.stats.set_value('dupefilter/disk_usage',
+                                 self.fingerprints.disk_usage)
+
+
+class RecrawlDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter for incremental crawls.
+
+    It remembers when a response was last received for each request (as a
+    :class:`~scrapy.utils.datatypes.FingerprintTimestamps`) and only filters
+    requests fetched less than a recrawl interval ago. The interval comes
+    from the ``recrawl_interval`` request meta key, or from
+    ``domain_intervals`` (a dict mapping domains to intervals, which also
+    apply to their subdomains), or defaults to ``interval``; all in seconds.
+
+    Requests let through but not fetched yet are filtered too, for the same
+    interval since they were let through (their timestamps are kept in
+    another :class:`~scrapy.utils.datatypes.FingerprintTimestamps`). They
+    stop being filtered when their download fails or when they are dropped
+    by the scheduler.
+
+    Responses are recorded by :meth:`response_received`, except those with
+    a status in ``ignore_http_codes`` (transient errors, worth retrying
+    sooner). Built with :meth:`from_crawler`, the dupefilter is connected
+    to the :signal:`response_received`, :signal:`request_left_downloader`
+    and :signal:`request_dropped` signals, and ignores
+    :setting:`RETRY_HTTP_CODES`.
+
+    When a job directory is used, timestamps are stored in its
+    ``requests.fetched`` file, so subsequent runs skip pages fetched
+    recently.
+    """
+
+    record_format = '>I'
+
+    def __init__(self, path=None, debug=False, interval=86400,
+                 domain_intervals=None, digest_size=20, stats=None,
+                 ignore_http_codes=()):
+        super(RecrawlDupeFilter, self).__init__(debug=debug)
+        self.interval = interval
+        self.domain_intervals = dict((d.lower().lstrip('.'), i) for d, i in
+                                     six.iteritems(domain_intervals or {}))
+        self.ignore_http_codes = set(int(x) for x in ignore_http_codes)
+        self.fingerprints = FingerprintTimestamps(digest_size)
+        # time requests were let through, until they leave the downloader
+        self.pending = FingerprintTimestamps(digest_size)
+        self._filtered = None  # last request filtered, dropped afterwards
+        self.stats = stats
+        self.path = None
+        if path:
+            self.path = os.path.join(path, 'requests.fetched')
+            if os.path.exists(self.path):
+                self._load()
+            self.file = open(self.path, 'ab')
+        self._update_stats()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        dupefilter = cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                         settings.getfloat('DUPEFILTER_RECRAWL_INTERVAL'),
+                         settings.getdict('DUPEFILTER_RECRAWL_DOMAIN_INTERVALS'),
+                         settings.getint('DUPEFILTER_DIGEST_SIZE'), crawler.stats,
+                         settings.getlist('RETRY_HTTP_CODES'))
+        crawler.signals.connect(dupefilter.response_received,
+                                signal=signals.response_received)
+        crawler.signals.connect(dupefilter.request_left_downloader,
+                                signal=signals.request_left_downloader)
+        crawler.signals.connect(dupefilter.request_dropped,
+                                signal=signals.request_dropped)
+        return dupefilter
+
+    def request_seen(self, request):
+        digest = self.request_digest(request, self.fingerprints.size)
+        now = time()
+        last = self.pending.get(digest)
+        if last is None:
+            last = self.fingerprints.get(digest)
+        if last is not None:
+            if now - last < self.recrawl_interval(request):
+                self._filtered = request
+                return True
+            if self.stats is not None:
+                self.stats.inc_value('dupefilter/recrawled')
+        self.pending[digest] = now
+
+    def request_left_downloader(self, request, spider=None):
+        """Stop filtering ``request`` as pending: it was either fetched
+        (and :meth:`response_received` records it) or its download failed"""
+        self.pending.discard(
+            self.request_digest(request, self.fingerprints.size))
+
+    def request_dropped(self, request, spider=None):
+        """Stop filtering ``request`` as pending, unless it was dropped for
+        being filtered (the request let through before is still pending)"""
+        if request is self._filtered:
+            self._filtered = None
+            return
+        self.request_left_downloader(request, spider)
+
+    def response_received(self, response, request, spider=None):
+        """Record that ``request`` was fetched"""
+        digest = self.request_digest(request, self.fingerprints.size)
+        self.pending.discard(digest)
+        if response.status in self.ignore_http_codes:
+            return
+        now = time()
+        self.fingerprints[digest] = now
+        if self.file:
+            self.file.write(digest + struct.pack(self.record_format, int(now)))
+        if self.fingerprints.nbytes != self._nbytes:
+            self._update_stats()
+
+    def recrawl_interval(self, request):
+        """Return the minimum number of seconds between two fetches of
+        ``request``"""
+        if 'recrawl_interval' in request.meta:
+            return request.meta['recrawl_interval']
+        if self.domain_intervals:
+            host = (urlparse_cached(request).hostname or '').lower()
+            while host:
+                if host in self.domain_intervals:
+                    return self.domain_intervals[host]
+                host = host.partition('.')[2]
+        return self.interval
+
+    def close(self, reason):
+        self._update_stats()
+        if self.file:
+            self.file.close()
+            self._save()
+
+    def _load(self):
+        size = self.fingerprints.size
+        recsize = size + struct.calcsize(self.record_format)
+        with open(self.path, 'rb') as f:
+            while True:
+                data = f.read(recsize * 4096)
+                # ignore a truncated last record, from an interrupted run
+                for start in range(0, len(data) - recsize + 1, recsize):
+                    self.fingerprints[data[start:start + size]] = \
+                        struct.unpack_from(self.record_format, data, start + size)[0]
+                if len(data) < recsize * 4096:
+                    break
+
+    def _save(self):
+        # the file is an append-only log of updates, keep only the last ones
+        tmppath = self.path + '.tmp'
+        with open(tmppath, 'wb') as f:
+            for digest, timestamp in self.fingerprints.items():
+                f.write(digest + struct.pack(self.record_format, timestamp))
+        os.rename(tmppath, self.path)
+
+    def _update_stats(self):
+        self._nbytes = self.fingerprints.nbytes
+        if self.stats is not None:
+            self.stats.set_value('dupefilter/memory',
+                                 self._nbytes + self.pending.nbytes)
+            self.stats.set_value('dupefilter/fingerprints', len(self.fingerprints))
+
+
+def _fingerprint_digest(fp, size):
+    """Return ``size`` bytes of binary digest for the request fingerprint
+    ``fp``, which is usually a hexadecimal SHA1 hash"""
+    try:
+        digest = binascii.unhexlify(fp)
+    except (TypeError, ValueError):  # custom, non hexadecimal fingerprint
+        digest = b''
+    if len(digest) < size:
+        digest = hashlib.sha1(to_bytes(fp)).digest()
+    return digest[:size]
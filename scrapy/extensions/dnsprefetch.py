@@ -0,0 +1,119 @@
+"""
+DNS prefetching extension
+
+See documentation in docs/topics/extensions.rst
+"""
+
+import logging
+from collections import deque
+
+from twisted.internet import reactor, task
+from twisted.internet.abstract import isIPAddress, isIPv6Address
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.resolver import dnscache
+from scrapy.utils.datatypes import LocalCache
+from scrapy.utils.httpobj import urlparse_cached
+
+logger = logging.getLogger(__name__)
+
+
+class DNSPrefetch(object):
+    """Resolve the host names of scheduled requests before they are
+    downloaded, so that the DNS cache already has them"""
+
+    def __init__(self, stats, lookahead=100, rate=20.0, clock=None):
+        self.stats = stats
+        self.lookahead = lookahead
+        self.interval = 1.0 / rate
+        self.queue = deque()
+        self.queued = {}  # host name -> request which queued it
+        # names looked up already, which may not be in the DNS cache
+        self.seen = LocalCache(10000)
+        self.resolve = reactor.resolve
+        self.clock = clock or reactor
+        self.task = None
+        self.running = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DNS_PREFETCH_ENABLED') or \
+                not settings.getbool('DNSCACHE_ENABLED'):
+            raise NotConfigured
+        rate = settings.getfloat('DNS_PREFETCH_RATE')
+        if rate <= 0:
+            raise NotConfigured("DNS_PREFETCH_RATE must be positive")
+        o = cls(crawler.stats, settings.getint('DNS_PREFETCH_LOOKAHEAD'), rate)
+        crawler.signals.connect(o.request_scheduled,
+                                signal=signals.request_scheduled)
+        crawler.signals.connect(o.request_dropped,
+                                signal=signals.request_dropped)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_opened(self, spider):
+        self.running = True
+        if self.queue:
+            self._start()
+
+    def spider_closed(self, spider, reason):
+        self.running = False
+        self._stop()
+        self.queue.clear()
+        self.queued.clear()
+
+    def request_scheduled(self, request, spider):
+        if request.meta.get('proxy'):
+            return
+        host = urlparse_cached(request).hostname
+        if not host or host in self.queued or host in self.seen \
+                or host in dnscache or isIPAddress(host) or isIPv6Address(host):
+            return
+        if len(self.queue) >= self.lookahead:
+            self.stats.inc_value('dnsprefetch/dropped')
+            return
+        self.queue.append(host)
+        self.queued[host] = request
+        self._start()
+
+    def request_dropped(self, request, spider):
+        # e.g. filtered out by the dupefilter: it won't be downloaded
+        host = urlparse_cached(request).hostname
+        if self.queued.get(host) is request:
+            del self.queued[host]
+            self.queue.remove(host)
+
+    def prefetch(self):
+        """Look up the next queued host name"""
+        while self.queue:
+            host = self.queue.popleft()
+            del self.queued[host]
+            if host not in dnscache:
+                break
+        else:
+            # nothing left to look up, until more requests are scheduled
+            self._stop()
+            return
+        self.seen[host] = True
+        self.stats.inc_value('dnsprefetch/queries')
+        d = self.resolve(host)
+        d.addErrback(self._failed, host)
+
+    def _start(self):
+        if not self.running or (self.task and self.task.running):
+            return
+        self.task = task.LoopingCall(self.prefetch)
+        self.task.clock = self.clock
+        self.task.start(self.interval, now=False)
+
+    def _stop(self):
+        if self.task and self.task.running:
+            self.task.stop()
+
+    def _failed(self, failure, host):
+        self.stats.inc_value('dnsprefetch/failed')
+        logger.debug("DNS prefetch for %(host)s failed: %(error)s",
+                     {'host': host, 'error': failure.value})
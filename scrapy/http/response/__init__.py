@@ -16,10 +16,19 @@ from scrapy.exceptions import NotSupported
 
 class Response(object_ref):
 
-    def __init__(self, url, status=200, headers=None, body=b'', flags=None, request=None):
+    # size of the body as received, if the download handler decoded it
+    encoded_size = None
+
+    def __init__(self, url, status=200, headers=None, body=b'', flags=None,
+                 request=None, body_file=None):
         self.headers = Headers(headers or {})
         self.status = int(status)
-        self._set_body(body)
+        self.body_file = body_file
+        if body_file is None:
+            self._set_body(body)
+        else:
+            # read on first access, see _get_body()
+            self._body = None
         self._set_url(url)
         self.request = request
         self.flags = [] if flags is None else list(flags)
@@ -47,6 +56,9 @@ class Response(object_ref):
     url = property(_get_url, obsolete_setter(_set_url, 'url'))
 
     def _get_body(self):
+        if self._body is None:
+            self.body_file.seek(0)
+            self._body = self.body_file.read()
         return self._body
 
     def _set_body(self, body):
@@ -75,8 +87,12 @@ class Response(object_ref):
         """Create a new Response with the same attributes except for those
         given new values.
         """
-        for x in ['url', 'status', 'headers', 'body', 'request', 'flags']:
+        for x in ['url', 'status', 'headers', 'request', 'flags']:
             kwargs.setdefault(x, getattr(self, x))
+        if 'body' not in kwargs and self._body is None:
+            kwargs.setdefault('body_file', self.body_file)
+        elif 'body_file' not in kwargs:
+            kwargs.setdefault('body', self.body)
         cls = kwargs.pop('cls', self.__class__)
         return cls(*args, **kwargs)
 
@@ -0,0 +1,228 @@
+"""
+Scheduler priority queues
+"""
+
+import heapq
+import itertools
+from time import time
+
+import six
+from queuelib import PriorityQueue
+from twisted.internet import reactor
+
+from scrapy import signals
+from scrapy.http import Request
+from scrapy.utils.httpobj import urlparse_cached
+
+
+class DownloaderAwarePriorityQueue(object):
+    """A priority queue which keeps one :class:`queuelib.PriorityQueue` per
+    download slot and only hands out requests whose download slot can start a
+    new transfer right away, i.e. it has free concurrency and its download
+    delay has passed.
+
+    Requests for busy slots stay in the scheduler instead of waiting inside the
+    downloader, so they don't hold the global ``CONCURRENT_REQUESTS`` budget
+    while other slots are idle.
+
+    ``qfactory`` is called with the priority and the download slot name as
+    arguments. ``startprios`` is the value returned by :meth:`close` on a
+    previous run (a dict mapping slot names to priorities).
+    """
+
+    def __init__(self, qfactory, startprios=(), downloader=None, wakeup=None):
+        if startprios and not isinstance(startprios, dict):
+            raise ValueError("DownloaderAwarePriorityQueue cannot resume a "
+                             "queue created with a different "
+                             "SCHEDULER_PRIORITY_QUEUE")
+        self.qfactory = qfactory
+        self.downloader = downloader
+        self.wakeup = wakeup
+        self.pqueues = {}
+        self._wakeupcall = None
+        self._len = 0
+        # every slot with queued requests is either ready (in a heap of
+        # [priority, active requests, counter, slot] entries, invalidated by
+        # setting their slot to None), busy (waiting for one of its requests
+        # to leave the downloader) or delayed (in a heap of (time, slot)
+        # entries), so that pop() doesn't need to look at every slot
+        self._ready = []
+        self._entries = {}
+        self._busy = set()
+        self._delayed = []
+        self._counter = itertools.count()
+        for slot, prios in six.iteritems(startprios or {}):
+            self.pqueues[slot] = pq = self._newpq(slot, prios)
+            self._len += len(pq)
+            if len(pq):
+                self._mark_ready(slot)
+
+    @classmethod
+    def from_crawler(cls, crawler, qfactory, startprios=()):
+        def wakeup():
+            if crawler.engine.slot:
+                crawler.engine.slot.nextcall.schedule()
+        pq = cls(qfactory, startprios, downloader=crawler.engine.downloader,
+                 wakeup=wakeup)
+        crawler.signals.connect(pq.request_left_downloader,
+                                signal=signals.request_left_downloader)
+        return pq
+
+    def push(self, obj, priority=0):
+        slot = self._slot_key(obj)
+        new = slot not in self.pqueues
+        if new:
+            self.pqueues[slot] = self._newpq(slot)
+        self.pqueues[slot].push(obj, priority)
+        self._len += 1
+        entry = self._entries.get(slot)
+        if entry is not None and priority < entry[0]:
+            # move the ready slot up to its new priority
+            entry[-1] = None
+            del self._entries[slot]
+            self._mark_ready(slot)
+        elif new:
+            self._mark_ready(slot)
+
+    def pop(self):
+        now = time()
+        while self._delayed and self._delayed[0][0] <= now:
+            slot = heapq.heappop(self._delayed)[1]
+            if slot in self.pqueues:  # may have been emptied by pop_lowest()
+                self._mark_ready(slot)
+        while self._ready:
+            slot = heapq.heappop(self._ready)[-1]
+            if slot is None:
+                continue
+            del self._entries[slot]
+            dslot = self.downloader.slots.get(slot) if self.downloader else None
+            if dslot is not None:
+                if len(dslot.active) >= dslot.concurrency:
+                    self._busy.add(slot)
+                    continue
+                penalty = dslot.lastseen + dslot.delay - now
+                if penalty > 0:
+                    heapq.heappush(self._delayed, (now + penalty, slot))
+                    continue
+            pq = self.pqueues[slot]
+            obj = pq.pop()
+            self._len -= 1
+            if len(pq):
+                self._mark_ready(slot)
+            else:
+                del self.pqueues[slot]
+                pq.close()
+            return obj
+        if self._delayed:
+            self._schedule_wakeup(self._delayed[0][0] - now)
+
+    def pop_lowest(self):
+        """Pop one of the requests with the lowest priority, from any slot"""
+        lowest = None
+        for slot, pq in six.iteritems(self.pqueues):
+            prio = _lowest_priority(pq)
+            if prio is not None and (lowest is None or prio > lowest[0]):
+                lowest = prio, slot
+        if lowest is None:
+            return
+        slot = lowest[1]
+        pq = self.pqueues[slot]
+        obj = pop_lowest(pq)
+        self._len -= 1
+        if not len(pq):
+            del self.pqueues[slot]
+            pq.close()
+            entry = self._entries.pop(slot, None)
+            if entry is not None:
+                entry[-1] = None
+            self._busy.discard(slot)
+        return obj
+
+    def request_left_downloader(self, request, spider=None):
+        """Make the download slot of ``request`` ready again if it was busy,
+        connected to the :signal:`request_left_downloader` signal"""
+        slot = request.meta.get('download_slot')
+        if slot in self._busy:
+            self._busy.discard(slot)
+            self._mark_ready(slot)
+
+    def close(self):
+        if self._wakeupcall and self._wakeupcall.active():
+            self._wakeupcall.cancel()
+        active = {}
+        for slot, pq in six.iteritems(self.pqueues):
+            prios = pq.close()
+            if prios:
+                active[slot] = prios
+        return active
+
+    def __len__(self):
+        return self._len
+
+    def _mark_ready(self, slot):
+        # among slots with the same priority, prefer the least active ones
+        if slot in self._entries:
+            return
+        dslot = self.downloader.slots.get(slot) if self.downloader else None
+        active = len(dslot.active) if dslot is not None else 0
+        entry = [self.pqueues[slot].curprio, active, next(self._counter), slot]
+        self._entries[slot] = entry
+        heapq.heappush(self._ready, entry)
+
+    def _newpq(self, slot, startprios=()):
+        return PriorityQueue(lambda priority: self.qfactory(priority, slot),
+                             startprios)
+
+    def _slot_key(self, obj):
+        if isinstance(obj, dict):  # serialized request, see scrapy.utils.reqser
+            obj = Request(obj['url'], meta=obj.get('meta'))
+        if self.downloader is None:
+            return obj.meta.get('download_slot',
+                                urlparse_cached(obj).hostname or '')
+        return self.downloader._get_slot_key(obj, None)
+
+    def _schedule_wakeup(self, delay):
+        # all pending slots are waiting for their download delay: make sure
+        # somebody asks for a new request once the first of them is ready
+        if self.wakeup is None:
+            return
+        if self._wakeupcall and self._wakeupcall.active():
+            if self._wakeupcall.getTime() - time() > delay:
+                self._wakeupcall.reset(delay)
+        else:
+            self._wakeupcall = reactor.callLater(delay, self.wakeup)
+
+
+def pop_lowest(pq):
+    """Pop one of the objects with the lowest priority (i.e. the highest
+    priority number) from ``pq``, a :class:`queuelib.PriorityQueue` or a
+    queue with a ``pop_lowest()`` method like
+    :class:`DownloaderAwarePriorityQueue`.
+
+    Return ``None`` if ``pq`` is empty or doesn't support it.
+    """
+    if hasattr(pq, 'pop_lowest'):
+        return pq.pop_lowest()
+    if not isinstance(pq, PriorityQueue):
+        return
+    prio = _lowest_priority(pq)
+    if prio is None:
+        return
+    q = pq.queues[prio]
+    obj = q.pop()
+    if not len(q):
+        del pq.queues[prio]
+        q.close()
+        if pq.curprio == prio:
+            pq.curprio = _highest_priority(pq)
+    return obj
+
+
+def _lowest_priority(pq):
+    prios = [p for p, q in six.iteritems(pq.queues) if len(q)]
+    return max(prios) if prios else None
+
+
+def _highest_priority(pq):
+    prios = [p for p, q in six.iteritems(pq.queues) if len(q)]
+    return min(prios) if prios else None
@@ -1,9 +1,21 @@
+import logging
+from time import time
+
 from twisted.internet import defer
+from twisted.internet.abstract import isIPAddress, isIPv6Address
 from twisted.internet.base import ThreadedResolver
+from twisted.internet.error import DNSLookupError
+from twisted.internet.interfaces import IResolverSimple
+from twisted.names import client, dns, error as dns_error
+from twisted.names.hosts import searchFileForAll
+from twisted.python.filepath import FilePath
+from zope.interface import implementer
 
 from scrapy.utils.datatypes import LocalCache
+from scrapy.utils.log import failure_to_exc_info
+from scrapy.utils.python import to_bytes
 
-# TODO: cache misses
+logger = logging.getLogger(__name__)
 
 dnscache = LocalCache(10000)
 
@@ -13,6 +25,14 @@ class CachingThreadedResolver(ThreadedResolver):
         dnscache.limit = cache_size
         self.timeout = timeout
 
+    @classmethod
+    def from_settings(cls, settings, reactor):
+        if settings.getbool('DNSCACHE_ENABLED'):
+            cache_size = settings.getint('DNSCACHE_SIZE')
+        else:
+            cache_size = 0
+        return cls(reactor, cache_size, settings.getfloat('DNS_TIMEOUT'))
+
     def getHostByName(self, name, timeout=None):
         if name in dnscache:
             return defer.succeed(dnscache[name])
@@ -29,3 +49,151 @@ class CachingThreadedResolver(ThreadedResolver):
     def _cache_result(self, result, name):
         dnscache[name] = result
         return result
+
+
+@implementer(IResolverSimple)
+class CachingDNSResolver(object):
+    """Resolver sending DNS queries over UDP from the reactor thread, instead
+    of calling the system resolver in the reactor thread pool.
+
+    Addresses are cached for the TTL of their records. Names which don't
+    exist (NXDOMAIN) or whose name server failed (SERVFAIL) are cached too,
+    for ``negative_ttl`` seconds at most. Concurrent lookups for the same
+    name share a single query, and at most ``concurrency`` queries are
+    pending at any time.
+
+    Name servers are read from ``resolv`` (a resolv.conf file) unless a
+    list of ``(host, port)`` ``servers`` is given. Names found in the
+    ``hosts`` file are not looked up.
+    """
+
+    hosts_ttl = 300
+    max_cnames = 10
+
+    def __init__(self, reactor, cache_size, timeout, concurrency=100,
+                 negative_ttl=60, servers=None, resolv='/etc/resolv.conf',
+                 hosts='/etc/hosts'):
+        self.reactor = reactor
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self._timeouts = self._retry_timeouts(timeout)
+        self._cache = LocalCache(cache_size)  # name -> (expiry, address or error)
+        self._pending = {}  # name -> deferreds waiting for a lookup
+        self._semaphore = defer.DeferredSemaphore(concurrency)
+        self._hosts = FilePath(hosts) if hosts else None
+        self._resolver = client.Resolver(resolv=resolv, servers=servers,
+                                         reactor=reactor)
+        dnscache.limit = cache_size
+
+    @classmethod
+    def from_settings(cls, settings, reactor):
+        if settings.getbool('DNSCACHE_ENABLED'):
+            cache_size = settings.getint('DNSCACHE_SIZE')
+        else:
+            cache_size = 0
+        return cls(reactor, cache_size, settings.getfloat('DNS_TIMEOUT'),
+                   concurrency=settings.getint('DNS_CONCURRENCY'),
+                   negative_ttl=settings.getfloat('DNSCACHE_NEGATIVE_TTL'))
+
+    @staticmethod
+    def _retry_timeouts(timeout):
+        # resend lost queries after growing delays, like twisted.names does
+        timeouts, total = [], 0
+        for t in (1, 3, 11, 45):
+            t = min(t, timeout - total)
+            if t <= 0:
+                break
+            timeouts.append(t)
+            total += t
+        return tuple(timeouts)
+
+    def getHostByName(self, name, timeout=None):
+        if isIPAddress(name) or isIPv6Address(name):
+            return defer.succeed(name)
+        cached = self._cache.get(name)
+        if cached is not None:
+            expiry, result = cached
+            if expiry > time():
+                if isinstance(result, Exception):
+                    return defer.fail(result)
+                return defer.succeed(result)
+            del self._cache[name]
+        d = defer.Deferred()
+        if name in self._pending:
+            self._pending[name].append(d)
+            return d
+        self._pending[name] = [d]
+        address = self._search_hosts(name)
+        if address is not None:
+            self._resolved((address, self.hosts_ttl), name)
+        else:
+            self._semaphore.run(self._resolver.lookupAddress, name,
+                                self._timeouts).addCallbacks(
+                self._get_address, self._failed, callbackArgs=(name,),
+                errbackArgs=(name,)).addErrback(
+                self._unexpected_error, name).addCallback(self._resolved, name)
+        return d
+
+    def _search_hosts(self, name):
+        if self._hosts is None:
+            return
+        for address in searchFileForAll(self._hosts, to_bytes(name)):
+            if isIPAddress(address):
+                return address
+
+    def _get_address(self, result, name):
+        answers, authority, _ = result
+        target, ttl = to_bytes(name).lower(), None
+        # follow CNAME records to the A record
+        for _ in range(self.max_cnames):
+            for record in answers:
+                if record.name.name.lower() != target:
+                    continue
+                ttl = record.ttl if ttl is None else min(ttl, record.ttl)
+                if record.type == dns.A:
+                    return record.payload.dottedQuad(), ttl
+                if record.type == dns.CNAME:
+                    target = record.payload.name.name.lower()
+                    break
+            else:
+                break
+        return DNSLookupError(name), self._negative_ttl(authority)
+
+    def _failed(self, failure, name):
+        if failure.check(dns_error.DNSNameError):
+            # the exception has the response, with its SOA record
+            return DNSLookupError(name), \
+                self._negative_ttl(failure.value.args[0].authority)
+        if failure.check(dns_error.DNSServerError):
+            return DNSLookupError(name), self.negative_ttl
+        # timeouts and network errors are not cached
+        logger.debug("DNS lookup for %(name)s failed: %(error)s",
+                     {'name': name, 'error': failure.value})
+        return DNSLookupError(name), 0
+
+    def _unexpected_error(self, failure, name):
+        # e.g. a malformed answer: fail the lookup, without caching it
+        logger.error("Error resolving %(name)s", {'name': name},
+                     exc_info=failure_to_exc_info(failure))
+        return DNSLookupError(name), 0
+
+    def _negative_ttl(self, authority):
+        # RFC 2308: the lower of the SOA TTL and its MINIMUM field
+        for record in authority:
+            if record.type == dns.SOA:
+                return min(self.negative_ttl, record.ttl,
+                           record.payload.minimum)
+        return self.negative_ttl
+
+    def _resolved(self, result, name):
+        address, ttl = result
+        if self._cache.limit and ttl > 0:
+            self._cache[name] = (time() + ttl, address)
+            if not isinstance(address, Exception):
+                # used by the downloader for CONCURRENT_REQUESTS_PER_IP
+                dnscache[name] = address
+        for d in self._pending.pop(name):
+            if isinstance(address, Exception):
+                d.errback(address)
+            else:
+                d.callback(address)
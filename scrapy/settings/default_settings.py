@@ -19,6 +19,16 @@ from os.path import join, abspath, dirname
 
 import six
 
+ADAPTIVE_CONCURRENCY_ENABLED = False
+ADAPTIVE_CONCURRENCY_DEBUG = False
+ADAPTIVE_CONCURRENCY_DECREASE_FACTOR = 0.5
+ADAPTIVE_CONCURRENCY_HTTP_CODES = [429, 503]
+ADAPTIVE_CONCURRENCY_LATENCY_FACTOR = 3.0
+ADAPTIVE_CONCURRENCY_MAX = 32
+ADAPTIVE_CONCURRENCY_MAX_RETRY_AFTER = 600
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_WINDOW = 20
+
 AJAXCRAWL_ENABLED = False
 
 AUTOTHROTTLE_ENABLED = False
@@ -47,6 +57,8 @@ CONCURRENT_REQUESTS_PER_IP = 0
 COOKIES_ENABLED = True
 COOKIES_DEBUG = False
 
+DECOMPRESSION_MAXSIZE = 1024*1024*1024   # 1024m
+
 DEFAULT_ITEM_CLASS = 'scrapy.item.Item'
 
 DEFAULT_REQUEST_HEADERS = {
@@ -59,9 +71,18 @@ DEPTH_STATS = True
 DEPTH_PRIORITY = 0
 
 DNSCACHE_ENABLED = True
+DNSCACHE_NEGATIVE_TTL = 60
 DNSCACHE_SIZE = 10000
+DNS_CONCURRENCY = 100
+DNS_PREFETCH_ENABLED = False
+DNS_PREFETCH_LOOKAHEAD = 100
+DNS_PREFETCH_RATE = 20
+DNS_RESOLVER = 'scrapy.resolver.CachingThreadedResolver'
 DNS_TIMEOUT = 60
 
+DOWNLOAD_BANDWIDTH = 0
+DOWNLOAD_SLOT_BANDWIDTH = 0
+
 DOWNLOAD_DELAY = 0
 
 DOWNLOAD_HANDLERS = {}
@@ -75,9 +96,11 @@ DOWNLOAD_HANDLERS_BASE = {
 }
 
 DOWNLOAD_TIMEOUT = 180      # 3mins
+DOWNLOAD_POOL_IDLE_TIMEOUT = 240
 
 DOWNLOAD_MAXSIZE = 1024*1024*1024   # 1024m
 DOWNLOAD_WARNSIZE = 32*1024*1024    # 32m
+DOWNLOAD_SPOOLSIZE = 0
 
 DOWNLOAD_FAIL_ON_DATALOSS = True
 
@@ -87,6 +110,7 @@ DOWNLOADER_HTTPCLIENTFACTORY = 'scrapy.core.downloader.webclient.ScrapyHTTPClien
 DOWNLOADER_CLIENTCONTEXTFACTORY = 'scrapy.core.downloader.contextfactory.ScrapyClientContextFactory'
 DOWNLOADER_CLIENT_TLS_METHOD = 'TLS' # Use highest TLS/SSL protocol version supported by the platform,
                                      # also allowing negotiation
+DOWNLOADER_TLS_SESSION_RESUMPTION = True
 
 DOWNLOADER_MIDDLEWARES = {}
 
@@ -105,13 +129,20 @@ DOWNLOADER_MIDDLEWARES_BASE = {
     'scrapy.downloadermiddlewares.cookies.CookiesMiddleware': 700,
     'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': 750,
     'scrapy.downloadermiddlewares.stats.DownloaderStats': 850,
+    'scrapy.downloadermiddlewares.adaptiveconcurrency.AdaptiveConcurrencyMiddleware': 875,
     'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': 900,
     # Downloader side
 }
 
 DOWNLOADER_STATS = True
 
+DUPEFILTER_BLOOM_CAPACITY = 1000000
+DUPEFILTER_BLOOM_ERROR_RATE = 0.001
 DUPEFILTER_CLASS = 'scrapy.dupefilters.RFPDupeFilter'
+DUPEFILTER_DIGEST_SIZE = 20
+DUPEFILTER_LSM_BUFFER_SIZE = 1000000
+DUPEFILTER_RECRAWL_DOMAIN_INTERVALS = {}
+DUPEFILTER_RECRAWL_INTERVAL = 86400  # 1 day
 
 EDITOR = 'vi'
 if sys.platform == 'win32':
@@ -129,6 +160,7 @@ EXTENSIONS_BASE = {
     'scrapy.extensions.logstats.LogStats': 0,
     'scrapy.extensions.spiderstate.SpiderState': 0,
     'scrapy.extensions.throttle.AutoThrottle': 0,
+    'scrapy.extensions.dnsprefetch.DNSPrefetch': 0,
 }
 
 FEED_TEMPDIR = None
@@ -163,6 +195,8 @@ FILES_STORE_S3_ACL = 'private'
 FTP_USER = 'anonymous'
 FTP_PASSWORD = 'guest'
 FTP_PASSIVE_MODE = True
+FTP_POOL_SIZE = 8
+FTP_POOL_IDLE_TIMEOUT = 60
 
 HTTPCACHE_ENABLED = False
 HTTPCACHE_DIR = 'httpcache'
@@ -242,6 +276,7 @@ ROBOTSTXT_OBEY = False
 SCHEDULER = 'scrapy.core.scheduler.Scheduler'
 SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleLifoDiskQueue'
 SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.LifoMemoryQueue'
+SCHEDULER_MEMORY_QUEUE_LIMIT = 0
 SCHEDULER_PRIORITY_QUEUE = 'queuelib.PriorityQueue'
 
 SPIDER_LOADER_CLASS = 'scrapy.spiderloader.SpiderLoader'
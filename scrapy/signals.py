@@ -13,6 +13,7 @@ spider_closed = object()
 spider_error = object()
 request_scheduled = object()
 request_dropped = object()
+request_left_downloader = object()
 response_received = object()
 response_downloaded = object()
 item_scraped = object()
@@ -2,11 +2,19 @@
 Scheduler queues
 """
 
+import os
+import glob
+import heapq
+import struct
 import marshal
+from collections import deque
+
 from six.moves import cPickle as pickle
 
 from queuelib import queue
 
+from scrapy.utils import reqcodec
+
 def _serializable_queue(queue_class, serialize, deserialize):
 
     class SerializableQueue(queue_class):
@@ -22,6 +30,217 @@ def _serializable_queue(queue_class, serialize, deserialize):
 
     return SerializableQueue
 
+class SegmentedDiskPriorityQueue(object):
+    """Persistent priority queue keeping all priorities in a single log.
+
+    Records of every priority are appended to the same sequence of segment
+    files (``chunksize`` records each) while an in-memory index maps each
+    priority to the position of its records, so pushing and popping cost
+    O(log P) for P distinct priorities. Segments are removed as soon as all
+    their records have been popped. On close, the records left in segments
+    which are less than half full are moved to the newest segment, and the
+    index is saved to a single file, which is all that needs to be read to
+    resume. The index file is removed once loaded, so segments left by an
+    unclean shutdown are discarded instead of being read with a stale index.
+
+    Unlike :class:`queuelib.PriorityQueue` it is not built from one queue per
+    priority, so the scheduler uses it directly as its disk queue.
+
+    Only integer priorities should be used. Lower numbers are higher
+    priorities. Records of the same priority are popped in FIFO order, or in
+    LIFO order if the ``lifo`` class attribute is true.
+    """
+
+    lifo = False
+    szhdr_format = ">L"
+    szhdr_size = struct.calcsize(szhdr_format)
+    idxhdr_format = ">qQ"
+    idxhdr_size = struct.calcsize(idxhdr_format)
+    idxbatch = 4096
+
+    def __init__(self, path, chunksize=100000):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.chunksize = chunksize
+        self.index = {}  # priority -> deque of (segment, offset)
+        self.prios = []  # heap of the priorities in index
+        self.live = {}  # segment -> number of records not popped yet
+        self.readfs = {}
+        self.size = 0
+        self._loadindex()
+        self.headnum = max(self.live) + 1 if self.live else 0
+        self.headcnt = self.headpos = 0
+        self.headf = self._openchunk(self.headnum, 'ab')
+        self.live[self.headnum] = 0
+
+    def push(self, string, priority=0):
+        if not isinstance(string, bytes):
+            raise TypeError('Unsupported type: {}'.format(type(string).__name__))
+        q = self.index.get(priority)
+        if q is None:
+            q = self.index[priority] = deque()
+            heapq.heappush(self.prios, priority)
+        q.append(self._append(string))
+        self.size += 1
+
+    def pop(self):
+        if not self.prios:
+            return
+        priority = self.prios[0]
+        q = self.index[priority]
+        num, offset = q.pop() if self.lifo else q.popleft()
+        if not q:
+            heapq.heappop(self.prios)
+            del self.index[priority]
+        data = self._read(num, offset)
+        self.size -= 1
+        self.live[num] -= 1
+        if not self.live[num] and num != self.headnum:
+            self._removechunk(num)
+        return data
+
+    def close(self):
+        self._compact()
+        self.headf.close()
+        for f in self.readfs.values():
+            f.close()
+        self.readfs = {}
+        for num, live in list(self.live.items()):
+            if not live:
+                self._removechunk(num)
+        if len(self):
+            self._saveindex()
+        return sorted(self.index)
+
+    def __len__(self):
+        return self.size
+
+    def _append(self, string):
+        if self.headcnt == self.chunksize:
+            self.headf.close()
+            self.headnum += 1
+            self.headcnt = self.headpos = 0
+            self.headf = self._openchunk(self.headnum, 'ab')
+            self.live[self.headnum] = 0
+        szhdr = struct.pack(self.szhdr_format, len(string))
+        os.write(self.headf.fileno(), szhdr + string)
+        position = (self.headnum, self.headpos)
+        self.headpos += self.szhdr_size + len(string)
+        self.headcnt += 1
+        self.live[self.headnum] += 1
+        return position
+
+    def _read(self, num, offset):
+        fd = self._readf(num).fileno()
+        os.lseek(fd, offset, os.SEEK_SET)
+        size, = struct.unpack(self.szhdr_format, os.read(fd, self.szhdr_size))
+        return os.read(fd, size)
+
+    def _compact(self):
+        # move the records left in mostly consumed segments to the head
+        # segment, so a few of them don't keep whole segments on disk
+        sparse = set(num for num, live in self.live.items()
+                     if num != self.headnum and 0 < live * 2 < self.chunksize)
+        if not sparse:
+            return
+        for priority, q in list(self.index.items()):
+            self.index[priority] = deque(
+                self._move(num, offset) if num in sparse else (num, offset)
+                for num, offset in q)
+        for num in sparse:
+            self._removechunk(num)
+
+    def _move(self, num, offset):
+        self.live[num] -= 1
+        return self._append(self._read(num, offset))
+
+    def _openchunk(self, number, mode='rb'):
+        return open(os.path.join(self.path, 'q%05d' % number), mode)
+
+    def _readf(self, number):
+        f = self.readfs.get(number)
+        if f is None:
+            f = self.readfs[number] = self._openchunk(number)
+        return f
+
+    def _removechunk(self, number):
+        f = self.readfs.pop(number, None)
+        if f is not None:
+            f.close()
+        os.remove(os.path.join(self.path, 'q%05d' % number))
+        del self.live[number]
+
+    def _indexpath(self):
+        return os.path.join(self.path, 'index')
+
+    def _saveindex(self):
+        # written aside and renamed, so a partial index is never loaded
+        tmppath = self._indexpath() + '.tmp'
+        with open(tmppath, 'wb') as f:
+            for priority, q in self.index.items():
+                f.write(struct.pack(self.idxhdr_format, priority, len(q)))
+                q = list(q)
+                for i in range(0, len(q), self.idxbatch):
+                    batch = q[i:i + self.idxbatch]
+                    f.write(struct.pack('>%dQ' % (2 * len(batch)),
+                                        *[x for pos in batch for x in pos]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmppath, self._indexpath())
+
+    def _loadindex(self):
+        indexpath = self._indexpath()
+        if not os.path.exists(indexpath):
+            # segments without an index come from an unclean shutdown and
+            # can't be read back
+            for x in glob.glob(os.path.join(self.path, 'q*')) + \
+                    glob.glob(os.path.join(self.path, 'index.tmp')):
+                os.remove(x)
+            return
+        with open(indexpath, 'rb') as f:
+            while True:
+                idxhdr = f.read(self.idxhdr_size)
+                if not idxhdr:
+                    break
+                priority, count = struct.unpack(self.idxhdr_format, idxhdr)
+                q = self.index[priority] = deque()
+                for i in range(0, count, self.idxbatch):
+                    n = min(self.idxbatch, count - i)
+                    positions = struct.unpack('>%dQ' % (2 * n), f.read(16 * n))
+                    for j in range(0, len(positions), 2):
+                        num = positions[j]
+                        q.append((num, positions[j + 1]))
+                        self.live[num] = self.live.get(num, 0) + 1
+                self.size += count
+        self.prios = list(self.index)
+        heapq.heapify(self.prios)
+        # the index only describes the segments as they are now
+        os.remove(indexpath)
+
+
+class LifoSegmentedDiskPriorityQueue(SegmentedDiskPriorityQueue):
+    """Like :class:`SegmentedDiskPriorityQueue`, but records of the same
+    priority are popped in LIFO order"""
+
+    lifo = True
+
+
+def _serializable_priority_queue(queue_class, serialize, deserialize):
+
+    class SerializablePriorityQueue(queue_class):
+
+        def push(self, obj, priority=0):
+            s = serialize(obj)
+            super(SerializablePriorityQueue, self).push(s, priority)
+
+        def pop(self):
+            s = super(SerializablePriorityQueue, self).pop()
+            if s:
+                return deserialize(s)
+
+    return SerializablePriorityQueue
+
 def _pickle_serialize(obj):
     try:
         return pickle.dumps(obj, protocol=2)
@@ -39,5 +258,21 @@ MarshalFifoDiskQueue = _serializable_queue(queue.FifoDiskQueue, \
     marshal.dumps, marshal.loads)
 MarshalLifoDiskQueue = _serializable_queue(queue.LifoDiskQueue, \
     marshal.dumps, marshal.loads)
+CompactFifoDiskQueue = _serializable_queue(queue.FifoDiskQueue, \
+    reqcodec.dumps, reqcodec.loads)
+CompactLifoDiskQueue = _serializable_queue(queue.LifoDiskQueue, \
+    reqcodec.dumps, reqcodec.loads)
+PickleFifoSegmentedDiskQueue = _serializable_priority_queue( \
+    SegmentedDiskPriorityQueue, _pickle_serialize, pickle.loads)
+PickleLifoSegmentedDiskQueue = _serializable_priority_queue( \
+    LifoSegmentedDiskPriorityQueue, _pickle_serialize, pickle.loads)
+MarshalFifoSegmentedDiskQueue = _serializable_priority_queue( \
+    SegmentedDiskPriorityQueue, marshal.dumps, marshal.loads)
+MarshalLifoSegmentedDiskQueue = _serializable_priority_queue( \
+    LifoSegmentedDiskPriorityQueue, marshal.dumps, marshal.loads)
+CompactFifoSegmentedDiskQueue = _serializable_priority_queue( \
+    SegmentedDiskPriorityQueue, reqcodec.dumps, reqcodec.loads)
+CompactLifoSegmentedDiskQueue = _serializable_priority_queue( \
+    LifoSegmentedDiskPriorityQueue, reqcodec.dumps, reqcodec.loads)
 FifoMemoryQueue = queue.FifoMemoryQueue
 LifoMemoryQueue = queue.LifoMemoryQueue
@@ -0,0 +1,181 @@
+"""
+Bloom filters for very large sets of (binary) hash digests.
+
+Filters keep their bits in a memory map, backed by a file when a path is
+given, so they can be reopened without reading or rebuilding anything.
+"""
+
+import os
+import glob
+import math
+import mmap
+import struct
+
+import six
+
+if six.PY2:
+    _tobyte = six.int2byte
+else:
+    _tobyte = lambda b: b
+
+
+class BloomFilter(object):
+    """Fixed size Bloom filter for hash digests of at least 16 bytes.
+
+    The bit positions of a key are derived from its first 16 bytes (using
+    double hashing), so keys must be uniformly distributed, like the digests
+    of a cryptographic hash function.
+
+    If ``path`` is given the filter is stored in that file, and opening an
+    existing file reuses its filter (``capacity`` and ``error_rate`` are
+    ignored then).
+    """
+
+    header_format = '>4sIQQQ'  # magic, hashes, bits, capacity, count
+    header_size = struct.calcsize(header_format)
+    count_offset = header_size - 8
+    magic = b'SBF1'
+
+    def __init__(self, capacity, error_rate, path=None):
+        if path and os.path.exists(path):
+            self._file = open(path, 'r+b')
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            magic, self.nhashes, self.nbits, self.capacity, self.count = \
+                struct.unpack(self.header_format, self._map[:self.header_size])
+            if magic != self.magic:
+                raise ValueError("Not a Bloom filter file: %s" % path)
+            return
+        self.capacity = capacity
+        self.count = 0
+        # optimal number of bits and hashes for the wanted error rate
+        self.nbits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nbits = (self.nbits + 7) // 8 * 8
+        self.nhashes = max(1, int(round(self.nbits / float(capacity) * math.log(2))))
+        size = self.header_size + self.nbits // 8
+        if path:
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        else:
+            self._file = None
+            self._map = mmap.mmap(-1, size)
+        self._map[:self.header_size] = struct.pack(
+            self.header_format, self.magic, self.nhashes, self.nbits,
+            self.capacity, self.count)
+
+    def _positions(self, key):
+        h1, h2 = struct.unpack('<QQ', key[:16])
+        nbits = self.nbits
+        for i in range(self.nhashes):
+            yield (h1 + i * h2) % nbits
+
+    def add(self, key):
+        """Add ``key`` to the filter. Return ``True`` if it was not in the
+        filter already (which may be a false negative), ``False`` otherwise."""
+        m, offset, added = self._map, self.header_size, False
+        for pos in self._positions(key):
+            i, bit = offset + (pos >> 3), 1 << (pos & 7)
+            byte = six.indexbytes(m, i)
+            if not byte & bit:
+                m[i] = _tobyte(byte | bit)
+                added = True
+        if added:
+            self.count += 1
+            m[self.count_offset:self.header_size] = struct.pack('>Q', self.count)
+        return added
+
+    def __contains__(self, key):
+        m, offset = self._map, self.header_size
+        for pos in self._positions(key):
+            if not six.indexbytes(m, offset + (pos >> 3)) & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.header_size + self.nbits // 8
+
+    def false_positive_probability(self):
+        """Estimated probability of a key not in the filter being reported
+        as present, given the number of keys added"""
+        return (1 - math.exp(-self.nhashes * self.count / float(self.nbits))) \
+            ** self.nhashes
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        if self._file:
+            self._file.close()
+
+
+class ScalableBloomFilter(object):
+    """Bloom filter which grows to keep its error rate as keys are added.
+
+    Keys go to a series of :class:`BloomFilter` stages: when the last one is
+    full a new one is added, ``growth`` times bigger and with an error rate
+    ``tightening`` times smaller, so the overall false positive probability
+    stays below ``error_rate``.
+
+    If ``path`` is given, stages are stored as files in that directory and
+    reopened when the filter is created again with the same path.
+    """
+
+    growth = 2
+    tightening = 0.5
+
+    def __init__(self, capacity, error_rate, path=None):
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.path = path
+        self.stages = []
+        if path:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            for stagepath in sorted(glob.glob(os.path.join(path, 'b*'))):
+                self.stages.append(BloomFilter(None, None, stagepath))
+        if not self.stages:
+            self._add_stage()
+
+    def _add_stage(self):
+        n = len(self.stages)
+        capacity = self.initial_capacity * self.growth ** n
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** n
+        path = os.path.join(self.path, 'b%05d' % n) if self.path else None
+        self.stages.append(BloomFilter(capacity, error_rate, path))
+
+    def add(self, key):
+        """Add ``key`` to the filter. Return ``False`` if it was (probably)
+        in the filter already, ``True`` otherwise."""
+        if key in self:
+            return False
+        stage = self.stages[-1]
+        if stage.count >= stage.capacity:
+            self._add_stage()
+            stage = self.stages[-1]
+        stage.add(key)
+        return True
+
+    def __contains__(self, key):
+        return any(key in stage for stage in reversed(self.stages))
+
+    def __len__(self):
+        return sum(len(stage) for stage in self.stages)
+
+    @property
+    def nbytes(self):
+        return sum(stage.nbytes for stage in self.stages)
+
+    def false_positive_probability(self):
+        """Estimated probability of a key not in the filter being reported
+        as present"""
+        p = 1.0
+        for stage in self.stages:
+            p *= 1 - stage.false_positive_probability()
+        return 1 - p
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
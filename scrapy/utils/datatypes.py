@@ -7,6 +7,7 @@ This module must not depend on any module outside the Standard Library.
 
 import copy
 import six
+import struct
 import warnings
 from collections import OrderedDict, Mapping
 
@@ -306,6 +307,29 @@ class LocalCache(OrderedDict):
         super(LocalCache, self).__setitem__(key, value)
 
 
+class LRUCache(LocalCache):
+    """Dictionary with a finite number of keys.
+
+    Least recently used items expire first.
+
+    """
+
+    def __getitem__(self, key):
+        value = super(LRUCache, self).__getitem__(key)
+        if six.PY2:
+            OrderedDict.__delitem__(self, key)
+            OrderedDict.__setitem__(self, key, value)
+        else:
+            self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        # popitem() would use __getitem__ on subclasses, refreshing the key
+        while len(self) >= self.limit:
+            del self[next(iter(self))]
+        OrderedDict.__setitem__(self, key, value)
+
+
 class SequenceExclude(object):
     """Object to test if an item is NOT within some sequence."""
 
@@ -314,3 +338,186 @@ class SequenceExclude(object):
 
     def __contains__(self, item):
         return item not in self.seq
+
+
+class FingerprintSet(object):
+    """Set of fixed-size binary strings, like hash digests.
+
+    Keys are stored back to back in a single ``bytearray`` used as an open
+    addressing hash table (with linear probing), which takes a small fraction
+    of the memory of a regular ``set`` of ``bytes`` objects.
+
+    >>> fps = FingerprintSet(4)
+    >>> fps.add(b'abcd')
+    True
+    >>> fps.add(b'abcd')
+    False
+    >>> b'abcd' in fps, b'dcba' in fps
+    (True, False)
+    """
+
+    max_load = 0.66
+    value_size = 0  # bytes stored after each key, see FingerprintTimestamps
+
+    def __init__(self, size, capacity=1024):
+        self.size = size
+        self._stride = size + self.value_size
+        self._empty = b'\0' * size
+        self._has_empty = False  # the all-zeros key is kept out of the table
+        self._len = 0
+        self._resize(max(capacity, 8))
+
+    def add(self, key):
+        """Add ``key`` to the set. Return ``True`` if it was not in the set
+        already, ``False`` otherwise."""
+        return self._add(key)[1]
+
+    def _add(self, key):
+        """Add ``key``, return its offset in the table (``None`` for the
+        all-zeros key) and whether it was added"""
+        if key == self._empty:
+            added, self._has_empty = not self._has_empty, True
+            self._len += added
+            return None, added
+        if self._len >= self._limit:
+            self._resize(self._capacity * 2)
+        start, found = self._find(key)
+        if not found:
+            self._table[start:start + self.size] = key
+            self._len += 1
+        return start, not found
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def discard(self, key):
+        """Remove ``key`` from the set. Return ``True`` if it was in the
+        set, ``False`` otherwise."""
+        if key == self._empty:
+            found, self._has_empty = self._has_empty, False
+            self._len -= found
+            return found
+        start, found = self._find(key)
+        if not found:
+            return False
+        # shift back the following keys of the probe sequence which would
+        # not be found anymore (no tombstones, lookups stay fast)
+        size, stride, table, mask, empty = \
+            self.size, self._stride, self._table, self._mask, self._empty
+        hole = i = start // stride
+        while True:
+            i = (i + 1) & mask
+            key = bytes(table[i * stride:i * stride + size])
+            if key == empty:
+                break
+            home = hash(key) & mask
+            # keys whose home is cyclically in (hole, i] stay where they are
+            if (hole < home <= i) if hole <= i else (home > hole or home <= i):
+                continue
+            table[hole * stride:(hole + 1) * stride] = \
+                table[i * stride:(i + 1) * stride]
+            hole = i
+        table[hole * stride:(hole + 1) * stride] = b'\0' * stride
+        self._len -= 1
+        return True
+
+    @property
+    def nbytes(self):
+        """Memory used by the hash table, in bytes"""
+        return len(self._table)
+
+    def __contains__(self, key):
+        if key == self._empty:
+            return self._has_empty
+        return self._find(key)[1]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        if self._has_empty:
+            yield self._empty
+        size, stride, table, empty = self.size, self._stride, self._table, self._empty
+        for start in range(0, len(table), stride):
+            key = bytes(table[start:start + size])
+            if key != empty:
+                yield key
+
+    def _find(self, key):
+        """Return the table offset where ``key`` is (or should be inserted),
+        and whether it was found"""
+        if len(key) != self.size:
+            raise ValueError("Expected a key of %d bytes, got %r" %
+                             (self.size, key))
+        size, stride, table, mask, empty = \
+            self.size, self._stride, self._table, self._mask, self._empty
+        i = hash(key) & mask
+        while True:
+            start = i * stride
+            slot = table[start:start + size]
+            if slot == key:
+                return start, True
+            if slot == empty:
+                return start, False
+            i = (i + 1) & mask
+
+    def _resize(self, capacity):
+        capacity = 1 << (capacity - 1).bit_length()  # power of 2
+        size, stride, empty = self.size, self._stride, self._empty
+        old = getattr(self, '_table', bytearray())
+        self._capacity = capacity
+        self._mask = capacity - 1
+        self._limit = int(capacity * self.max_load)
+        self._table = bytearray(capacity * stride)
+        for oldstart in range(0, len(old), stride):
+            key = bytes(old[oldstart:oldstart + size])
+            if key != empty:
+                start, _ = self._find(key)
+                self._table[start:start + stride] = old[oldstart:oldstart + stride]
+
+
+class FingerprintTimestamps(FingerprintSet):
+    """Mapping of fixed-size binary strings to timestamps, stored like a
+    :class:`FingerprintSet` with 4 more bytes per key.
+
+    Timestamps are kept as whole seconds since the epoch (up to year 2106).
+
+    >>> fpt = FingerprintTimestamps(4)
+    >>> fpt[b'abcd'] = 1500000000.5
+    >>> fpt[b'abcd'], fpt.get(b'dcba')
+    (1500000000, None)
+    """
+
+    value_size = 4
+
+    def __init__(self, size, capacity=1024):
+        super(FingerprintTimestamps, self).__init__(size, capacity)
+        self._empty_value = 0
+
+    def __getitem__(self, key):
+        if key == self._empty:
+            if not self._has_empty:
+                raise KeyError(key)
+            return self._empty_value
+        start, found = self._find(key)
+        if not found:
+            raise KeyError(key)
+        return struct.unpack_from('>I', self._table, start + self.size)[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, timestamp):
+        start, _ = self._add(key)
+        if start is None:
+            self._empty_value = int(timestamp)
+        else:
+            struct.pack_into('>I', self._table, start + self.size, int(timestamp))
+
+    def items(self):
+        for key in self:
+            yield key, self[key]
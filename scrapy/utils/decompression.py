@@ -0,0 +1,232 @@
+"""
+Incremental decoding of HTTP content codings (Content-Encoding)
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+ACCEPTED_ENCODINGS = [b'gzip', b'deflate']
+if brotli is not None:
+    ACCEPTED_ENCODINGS.append(b'br')
+if zstandard is not None:
+    ACCEPTED_ENCODINGS.append(b'zstd')
+
+# the window size HTTP clients must support, larger ones may be refused
+# (RFC 8878, section 7.2), as decoding takes as much memory
+ZSTD_MAX_WINDOW_SIZE = 8 * 1024 * 1024
+
+
+class DecompressionMaxSizeExceeded(ValueError):
+    """The decoded data is larger than the maximum size allowed"""
+
+
+class _GzipDecoder(object):
+
+    def __init__(self):
+        self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._output = False
+        self._failed = False
+
+    def decompress(self, data, max_length=0):
+        if self._failed:
+            return b''
+        obj = self._obj.copy()
+        try:
+            output = self._obj.decompress(data, max_length)
+        except zlib.error as e:
+            # like gunzip(), resilient to checksum errors and trailing
+            # garbage: keep the data decoded before the error
+            output = self._salvage(obj, data, max_length)
+            if not (self._output or output):
+                raise IOError("Invalid gzip data: %s" % e)
+            self._failed = True
+            return output
+        if self._obj.unused_data and not self._obj.unconsumed_tail:
+            # concatenated gzip members
+            data, self._obj = self._obj.unused_data, \
+                zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if max_length:
+                max_length = max(max_length - len(output), 1)
+            output += self.decompress(data, max_length)
+        self._output = self._output or bool(output)
+        return output
+
+    def _salvage(self, obj, data, max_length):
+        output = []
+        for i in range(len(data)):
+            try:
+                output.append(obj.decompress(data[i:i + 1], max_length))
+            except zlib.error:
+                break
+        return b''.join(output)
+
+    def flush(self):
+        if self._failed:
+            return b''
+        try:
+            return self._obj.flush()
+        except zlib.error as e:
+            if not self._output:
+                raise IOError("Invalid gzip data: %s" % e)
+            return b''
+
+
+class _DeflateDecoder(object):
+
+    def __init__(self):
+        self._obj = zlib.decompressobj()
+        # input seen before the 2 bytes of the zlib header were checked
+        self._head = b''
+
+    def decompress(self, data, max_length=0):
+        if self._head is None:
+            return self._obj.decompress(data, max_length)
+        try:
+            output = self._obj.decompress(data, max_length)
+        except zlib.error:
+            # ugly hack to work with raw deflate content that may
+            # be sent by microsoft servers. For more information, see:
+            # http://carsten.codimi.de/gzip.yaws/
+            # http://www.port80software.com/200ok/archive/2005/10/31/868.aspx
+            # http://www.gzip.org/zlib/zlib_faq.html#faq38
+            self._obj = zlib.decompressobj(-15)
+            data, self._head = self._head + data, None
+            return self._obj.decompress(data, max_length)
+        self._head += data[:2]
+        if len(self._head) >= 2:
+            self._head = None
+        return output
+
+    def flush(self):
+        return self._obj.flush()
+
+
+class _BrotliDecoder(object):
+
+    # the bindings can't stop decoding at a given output size, so input is
+    # fed in slices this small when there is a limit (a single byte of a
+    # brotli bomb can still decode to a few MB)
+    slice_size = 64
+
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+        # brotlipy and Google's brotli bindings name it differently
+        self._process = getattr(self._obj, 'process', None) or \
+            self._obj.decompress
+
+    def decompress(self, data, max_length=0):
+        if not max_length:
+            return self._process(data)
+        output, size = [], 0
+        for i in range(0, len(data), self.slice_size):
+            output.append(self._process(data[i:i + self.slice_size]))
+            size += len(output[-1])
+            if size >= max_length:
+                break  # the rest of the input is dropped
+        return b''.join(output)
+
+    def flush(self):
+        return b''
+
+
+class _ZstdDecoder(object):
+
+    # a block decodes to 128 KB at most, and takes 4 bytes at least (RLE)
+    max_ratio = 32 * 1024
+
+    def __init__(self):
+        # unlike decompressobj() (before zstandard 0.16, it drops the data
+        # after the first frame), stream_writer() decodes multiple frames
+        decompressor = zstandard.ZstdDecompressor(
+            max_window_size=ZSTD_MAX_WINDOW_SIZE)
+        self._writer = decompressor.stream_writer(self)
+        self._output = []
+        self._size = 0
+
+    def write(self, data):
+        # called by the stream writer with the decoded data
+        self._output.append(data)
+        self._size += len(data)
+        return len(data)
+
+    def decompress(self, data, max_length=0):
+        self._size = 0
+        if not max_length:
+            self._writer.write(data)
+        # Output can't be bounded once input is passed to the stream writer
+        # (and raising from write() to stop it turns into a SystemError
+        # with zstandard < 0.15), so input is fed in slices which can't
+        # decode to much more than what is left below the limit. The rest
+        # of the input is dropped once the limit is reached.
+        i = 0
+        while max_length and i < len(data) and self._size < max_length:
+            size = max(4, (max_length - self._size) // self.max_ratio)
+            self._writer.write(data[i:i + size])
+            i += size
+        output, self._output = b''.join(self._output), []
+        return output
+
+    def flush(self):
+        return b''
+
+
+_DECODERS = {
+    b'gzip': _GzipDecoder,
+    b'x-gzip': _GzipDecoder,
+    b'deflate': _DeflateDecoder,
+}
+if brotli is not None:
+    _DECODERS[b'br'] = _BrotliDecoder
+if zstandard is not None:
+    _DECODERS[b'zstd'] = _ZstdDecoder
+
+
+class Decompressor(object):
+    """Decode data of the given content ``encoding`` as it arrives, raising
+    :exc:`DecompressionMaxSizeExceeded` as soon as the decoded data gets
+    larger than ``maxsize`` (if non-zero).
+
+    The ``size`` and ``encoded_size`` attributes hold the amounts of data
+    decoded so far, after and before decoding.
+    """
+
+    def __init__(self, encoding, maxsize=0):
+        self.encoding = encoding
+        self.maxsize = maxsize
+        self.size = 0
+        self.encoded_size = 0
+        self._decoder = _DECODERS[encoding]()
+
+    @classmethod
+    def for_encoding(cls, encoding, maxsize=0):
+        """Return a decompressor for ``encoding``, or ``None`` if it is not
+        supported"""
+        encoding = encoding.strip().lower()
+        if encoding not in _DECODERS:
+            return None
+        return cls(encoding, maxsize)
+
+    def decompress(self, data):
+        self.encoded_size += len(data)
+        # decode at most one byte over the limit, to tell it was exceeded
+        max_length = self.maxsize - self.size + 1 if self.maxsize else 0
+        return self._check(self._decoder.decompress(data, max_length))
+
+    def flush(self):
+        return self._check(self._decoder.flush())
+
+    def _check(self, output):
+        self.size += len(output)
+        if self.maxsize and self.size > self.maxsize:
+            raise DecompressionMaxSizeExceeded(
+                "Decompressed size larger than %d bytes" % self.maxsize)
+        return output
@@ -0,0 +1,314 @@
+"""
+Disk-backed set of fixed size hash digests, for sets too big to keep in
+memory (like the fingerprints of a billion requests).
+
+It's a log-structured merge tree without deletions: new keys go to a small
+in-memory write buffer, which is written to disk as a sorted, immutable
+segment once it's full. Segments are memory-mapped and looked up by binary
+search, after checking their own Bloom filter, so most lookups for new keys
+don't touch the segment data at all. To keep the number of segments (and so
+the cost of lookups) low, segments of similar size are merged together.
+When running in the Twisted reactor, full buffers are sorted and written, and
+segments are merged, in threads, so they don't block the reactor.
+"""
+
+import os
+import glob
+import heapq
+import mmap
+import struct
+import logging
+
+from twisted.internet import defer, threads
+
+from scrapy.utils.bloom import BloomFilter
+from scrapy.utils.datatypes import FingerprintSet
+from scrapy.utils.log import failure_to_exc_info
+
+logger = logging.getLogger(__name__)
+
+
+class Segment(object):
+    """Sorted, immutable array of keys stored in the file at ``path``, along
+    with a Bloom filter of its keys in ``path + '.bloom'``"""
+
+    header_format = '>4sIQ'  # magic, key size, number of keys
+    header_size = struct.calcsize(header_format)
+    magic = b'SLS1'
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError("Not a segment file: %s" % path)
+        if len(self._map) < self.header_size:
+            self.close()
+            raise ValueError("Not a segment file: %s" % path)
+        magic, self.size, self.count = \
+            struct.unpack(self.header_format, self._map[:self.header_size])
+        if magic != self.magic or \
+                len(self._map) != self.header_size + self.size * self.count:
+            self.close()
+            raise ValueError("Not a segment file: %s" % path)
+        self.bloom = BloomFilter(None, None, path + '.bloom')
+
+    @classmethod
+    def write(cls, path, keys, count, size, error_rate):
+        """Write ``count`` sorted, unique ``keys`` of ``size`` bytes to a new
+        segment at ``path`` and return it"""
+        bloom = BloomFilter(max(count, 1), error_rate, path + '.bloom')
+        tmppath = path + '.tmp'
+        with open(tmppath, 'wb') as f:
+            f.write(struct.pack(cls.header_format, cls.magic, size, count))
+            batch = []
+            for key in keys:
+                bloom.add(key)
+                batch.append(key)
+                if len(batch) >= 4096:
+                    f.write(b''.join(batch))
+                    batch = []
+            f.write(b''.join(batch))
+        bloom.close()
+        # the segment only exists once it's complete
+        os.rename(tmppath, path)
+        return cls(path)
+
+    def __contains__(self, key):
+        if key not in self.bloom:
+            return False
+        m, size, offset = self._map, self.size, self.header_size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * size
+            k = m[start:start + size]
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __iter__(self):
+        m, size = self._map, self.size
+        chunk = size * 4096
+        end = self.header_size + self.count * size
+        for start in range(self.header_size, end, chunk):
+            data = m[start:min(start + chunk, end)]
+            for i in range(0, len(data), size):
+                yield data[i:i + size]
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        """Size of the segment data and Bloom filter"""
+        return self.header_size + self.count * self.size + self.bloom.nbytes
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+        if getattr(self, 'bloom', None) is not None:
+            self.bloom.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+        os.remove(self.path + '.bloom')
+
+
+class LSMFingerprintSet(object):
+    """Set of binary keys of ``size`` bytes (at least 16), stored in the
+    directory ``path``.
+
+    At most ``buffer_size`` keys are kept in memory. Whenever ``fanout``
+    segments of a similar size (within a factor of ``fanout``) exist they
+    are merged into one, so there are ``O(fanout * log(n / buffer_size))``
+    segments for ``n`` keys. ``error_rate`` is the false positive rate of
+    the segment Bloom filters, which only affects the lookup speed.
+
+    Full buffers are written and merges run in a thread if ``background``
+    is true, in which case the Twisted reactor must be running; :meth:`close`
+    returns a deferred then.
+    """
+
+    def __init__(self, path, size=20, buffer_size=1000000, fanout=4,
+                 error_rate=0.01, background=False):
+        if size < 16:
+            raise ValueError("LSMFingerprintSet keys must be at least 16 bytes")
+        self.path = path
+        self.size = size
+        self.buffer_size = buffer_size
+        self.fanout = fanout
+        self.error_rate = error_rate
+        self.background = background
+        self.buffer = FingerprintSet(size)
+        # full buffers being written to segments, still used for lookups
+        self._frozen = []
+        self.segments = []
+        self._merging = set()
+        self._jobs = []
+        self._next = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+        # remove incomplete segments, from an interrupted run
+        for fpath in glob.glob(os.path.join(path, 's*.tmp')):
+            os.remove(fpath)
+        for fpath in glob.glob(os.path.join(path, 's*.bloom')):
+            if not os.path.exists(fpath[:-len('.bloom')]):
+                os.remove(fpath)
+        for fpath in sorted(glob.glob(os.path.join(path, 's*[0-9]'))):
+            self.segments.append(Segment(fpath))
+            self._next = int(os.path.basename(fpath)[1:]) + 1
+        self._maybe_merge()
+
+    def add(self, key):
+        """Add ``key`` to the set. Return ``True`` if it was not in the set
+        already, ``False`` otherwise."""
+        if len(key) != self.size:
+            raise ValueError("Keys must be %d bytes long" % self.size)
+        if key in self:
+            return False
+        self.buffer.add(key)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return True
+
+    def __contains__(self, key):
+        return key in self.buffer or any(key in b for b in self._frozen) or \
+            any(key in s for s in self.segments)
+
+    def __len__(self):
+        return len(self.buffer) + sum(len(b) for b in self._frozen) + \
+            sum(len(s) for s in self.segments)
+
+    @property
+    def nbytes(self):
+        """Memory used by the write buffers"""
+        return self.buffer.nbytes + sum(b.nbytes for b in self._frozen)
+
+    @property
+    def disk_usage(self):
+        return sum(s.nbytes for s in self.segments)
+
+    def flush(self):
+        """Write the keys in the buffer to a new segment"""
+        self._flush(self.background)
+
+    def _flush(self, background):
+        if not len(self.buffer):
+            return
+        buffer, self.buffer = self.buffer, FingerprintSet(self.size)
+        path = self._newpath()
+        if not background:
+            self._flushed(self._write(path, buffer), buffer)
+            return
+        self._frozen.append(buffer)
+        d = threads.deferToThread(self._write, path, buffer)
+        d.addCallback(self._flushed, buffer)
+        d.addErrback(self._flush_failed)
+        self._jobs.append(d)
+        d.addBoth(self._job_done, d)
+
+    def _write(self, path, buffer):
+        # a single sort would hold the GIL, blocking the reactor thread, for
+        # its whole duration: sort chunks of keys and merge them lazily
+        keys = list(buffer)
+        chunks = [sorted(keys[i:i + 65536])
+                  for i in range(0, len(keys), 65536)]
+        return Segment.write(path, heapq.merge(*chunks), len(keys),
+                             self.size, self.error_rate)
+
+    def _flushed(self, segment, buffer):
+        if buffer in self._frozen:
+            self._frozen.remove(buffer)
+        self.segments.append(segment)
+        self._maybe_merge()
+
+    def _flush_failed(self, failure):
+        # the keys stay in memory, see close()
+        logger.error("Error writing fingerprint segment in %(path)s",
+                     {'path': self.path}, exc_info=failure_to_exc_info(failure))
+
+    def _newpath(self):
+        path = os.path.join(self.path, 's%08d' % self._next)
+        self._next += 1
+        return path
+
+    def _level(self, segment):
+        level, count = 0, len(segment)
+        while count > self.buffer_size:
+            count //= self.fanout
+            level += 1
+        return level
+
+    def _merge_candidates(self):
+        levels = {}
+        for segment in self.segments:
+            if segment not in self._merging:
+                levels.setdefault(self._level(segment), []).append(segment)
+        for level in sorted(levels):
+            if len(levels[level]) >= self.fanout:
+                return levels[level]
+        return []
+
+    def _maybe_merge(self):
+        while True:
+            segments = self._merge_candidates()
+            if not segments:
+                return
+            path = self._newpath()
+            if not self.background:
+                self._replace(segments, self._merge(path, segments))
+                continue
+            self._merging.update(segments)
+            d = threads.deferToThread(self._merge, path, segments)
+            d.addCallback(lambda merged, s=segments: self._replace(s, merged))
+            d.addErrback(self._merge_failed, segments)
+            self._jobs.append(d)
+            d.addBoth(self._job_done, d)
+
+    def _merge(self, path, segments):
+        # segments are immutable and keys are never in more than one
+        # segment, so this is safe to run in a thread during lookups
+        return Segment.write(path, heapq.merge(*segments),
+                             sum(len(s) for s in segments), self.size,
+                             self.error_rate)
+
+    def _replace(self, segments, merged):
+        self._merging.difference_update(segments)
+        self.segments = [s for s in self.segments if s not in segments]
+        self.segments.append(merged)
+        for segment in segments:
+            segment.remove()
+        self._maybe_merge()
+
+    def _merge_failed(self, failure, segments):
+        self._merging.difference_update(segments)
+        logger.error("Error merging fingerprint segments in %(path)s",
+                     {'path': self.path}, exc_info=failure_to_exc_info(failure))
+
+    def _job_done(self, result, d):
+        self._jobs.remove(d)
+        return result
+
+    def close(self):
+        """Flush the buffer and close all segments. Return a deferred if a
+        write or a merge is running in the background."""
+        if self._jobs:
+            return defer.DeferredList(list(self._jobs)).addBoth(
+                lambda _: self.close())
+        # buffers which failed to be written are retried here
+        for buffer in self._frozen:
+            self.buffer.update(buffer)
+        self._frozen = []
+        self._flush(False)
+        if self._jobs:
+            return self.close()
+        for segment in self.segments:
+            segment.close()
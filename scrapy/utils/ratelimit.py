@@ -0,0 +1,51 @@
+"""
+Rate limiting helpers
+"""
+
+
+class TokenBucket(object):
+    """Token bucket allowing ``rate`` tokens (bytes, for example) per second
+    on average, in bursts of up to ``burst`` tokens (``rate`` by default).
+
+    Taking more tokens than available is allowed: the bucket then owes them,
+    and :meth:`delay` is the time until the debt is paid off. This suits
+    limiting data which is counted once received, like response bodies.
+
+    The measured consumption rate, in tokens per second over the last
+    ``window`` seconds at least, is kept in ``current_rate``.
+    """
+
+    def __init__(self, rate, burst=None, clock=None, window=1.0):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.rate = float(rate)
+        self.burst = float(rate if burst is None else burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self.current_rate = 0.0
+        self.window = window
+        self._updated = self._window_start = clock.seconds()
+        self._window_tokens = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, tokens):
+        """Take ``tokens`` from the bucket and return :meth:`delay`"""
+        now = self.clock.seconds()
+        self._refill(now)
+        self.tokens -= tokens
+        self._window_tokens += tokens
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.current_rate = self._window_tokens / elapsed
+            self._window_start = now
+            self._window_tokens = 0
+        return max(0.0, -self.tokens / self.rate)
+
+    def delay(self):
+        """Return the time (in seconds) until the bucket is not in debt"""
+        self._refill(self.clock.seconds())
+        return max(0.0, -self.tokens / self.rate)
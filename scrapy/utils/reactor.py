@@ -1,5 +1,11 @@
+import heapq
+import logging
+import itertools
+
 from twisted.internet import reactor, error
 
+logger = logging.getLogger(__name__)
+
 def listen_tcp(portrange, host, factory):
     """Like reactor.listenTCP but tries different ports in a range."""
     assert len(portrange) <= 2, "invalid portrange: %s" % portrange
@@ -39,3 +45,108 @@ class CallLaterOnce(object):
     def __call__(self):
         self._call = None
         return self._func(*self._a, **self._kw)
+
+
+class DelayedCallHeap(object):
+    """Schedule many delayed calls using a single reactor delayed call.
+
+    Calls are kept in a heap, so scheduling and running them is O(log n)
+    instead of adding one entry per call to the reactor's own delayed calls.
+    :meth:`callLater` returns an object with the ``active``, ``cancel`` and
+    ``getTime`` methods of Twisted's ``IDelayedCall``.
+
+    If ``stats`` is given, the number of calls and the lag between their
+    scheduled time and the time they actually ran are kept in
+    ``<stats_prefix>/dispatches``, ``<stats_prefix>/dispatch_lag_max`` and
+    ``<stats_prefix>/dispatch_lag_avg`` (in seconds).
+    """
+
+    def __init__(self, clock=None, stats=None, stats_prefix='timer'):
+        self.clock = clock or reactor
+        self.stats = stats
+        self.stats_prefix = stats_prefix
+        self._heap = []
+        self._counter = itertools.count()
+        self._call = None
+        self._dispatches = 0
+        self._total_lag = 0.0
+
+    def callLater(self, delay, func, *a, **kw):
+        call = _HeapDelayedCall(self.clock.seconds() + delay, func, a, kw)
+        heapq.heappush(self._heap, (call.time, next(self._counter), call))
+        self._schedule()
+        return call
+
+    def __len__(self):
+        return sum(1 for _, _, call in self._heap if call.active())
+
+    def close(self):
+        for _, _, call in self._heap:
+            call.cancel()
+        self._heap = []
+        if self._call and self._call.active():
+            self._call.cancel()
+
+    def _schedule(self):
+        heap = self._heap
+        while heap and not heap[0][2].active():
+            heapq.heappop(heap)
+        if not heap:
+            return
+        when = heap[0][0]
+        if self._call and self._call.active():
+            if self._call.getTime() > when:
+                self._call.reset(max(0, when - self.clock.seconds()))
+        else:
+            self._call = self.clock.callLater(
+                max(0, when - self.clock.seconds()), self._run)
+
+    def _run(self):
+        now = self.clock.seconds()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            call = heapq.heappop(heap)[2]
+            if call.active():
+                self._record_lag(now - call.time)
+                try:
+                    call()
+                except Exception:
+                    logger.error("Error running delayed call %(call)r",
+                                 {'call': call.func}, exc_info=True)
+        self._schedule()
+
+    def _record_lag(self, lag):
+        if self.stats is None:
+            return
+        self._dispatches += 1
+        self._total_lag += lag
+        prefix = self.stats_prefix
+        self.stats.set_value('%s/dispatches' % prefix, self._dispatches)
+        self.stats.max_value('%s/dispatch_lag_max' % prefix, lag)
+        self.stats.set_value('%s/dispatch_lag_avg' % prefix,
+                             self._total_lag / self._dispatches)
+
+
+class _HeapDelayedCall(object):
+
+    def __init__(self, time, func, a, kw):
+        self.time = time
+        self.func = func
+        self.a = a
+        self.kw = kw
+        self.called = False
+        self.cancelled = False
+
+    def getTime(self):
+        return self.time
+
+    def active(self):
+        return not (self.called or self.cancelled)
+
+    def cancel(self):
+        # the call stays in the heap until it reaches the top
+        self.cancelled = True
+
+    def __call__(self):
+        self.called = True
+        return self.func(*self.a, **self.kw)
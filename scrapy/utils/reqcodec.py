@@ -0,0 +1,63 @@
+"""
+Compact binary serialization for the scheduler disk queues.
+
+This is a smaller, faster and pickle-free alternative for storing the dicts
+returned by :func:`scrapy.utils.reqser.request_to_dict`. Request dicts are
+stored as a tuple of their values in a fixed field order (so field names are
+not repeated in every record) and encoded with :mod:`marshal`, which supports
+``None``, booleans, numbers, bytes, text, lists, tuples and dicts. Like with
+the marshal queues, unsupported types (in request meta, for example) raise
+``ValueError``.
+
+Every serialized object starts with a version byte, so the format can evolve
+without misreading queues written by older Scrapy versions.
+"""
+
+import marshal
+
+import six
+from six.moves import intern
+
+VERSION = 1
+
+# field order of serialized requests, do not change without bumping VERSION
+_REQUEST_FIELDS = ('url', 'callback', 'errback', 'method', 'headers', 'body',
+                   'cookies', 'meta', '_encoding', 'priority', 'dont_filter',
+                   'flags')
+_REQUEST_KEYS = frozenset(_REQUEST_FIELDS)
+
+_MARSHAL_VERSION = 2
+_REQUEST_PREFIX = six.int2byte(VERSION) + b'R'
+_VALUE_PREFIX = six.int2byte(VERSION) + b'V'
+
+
+def dumps(obj):
+    """Serialize ``obj`` to bytes"""
+    if type(obj) is dict and _REQUEST_KEYS.issubset(obj) and \
+            len(obj) - len(_REQUEST_KEYS) == ('_class' in obj):
+        record = [obj[field] for field in _REQUEST_FIELDS]
+        if '_class' in obj:
+            record.append(obj['_class'])
+        return _REQUEST_PREFIX + marshal.dumps(tuple(record), _MARSHAL_VERSION)
+    return _VALUE_PREFIX + marshal.dumps(obj, _MARSHAL_VERSION)
+
+
+def loads(data):
+    """Deserialize an object serialized with :func:`dumps`"""
+    prefix = data[:2]
+    if prefix not in (_REQUEST_PREFIX, _VALUE_PREFIX):
+        raise ValueError("Unsupported serialization format")
+    try:
+        obj = marshal.loads(data[2:])
+    except (EOFError, TypeError) as e:
+        raise ValueError("Invalid serialized data: %s" % e)
+    if prefix == _VALUE_PREFIX:
+        return obj
+    d = dict(zip(_REQUEST_FIELDS, obj))
+    if len(obj) > len(_REQUEST_FIELDS):
+        d['_class'] = obj[-1]
+    # callback, errback and method names repeat a lot, intern them
+    for key in ('callback', 'errback', 'method'):
+        if isinstance(d[key], str):
+            d[key] = intern(d[key])
+    return d
@@ -6,9 +6,11 @@ scrapy.http.Request objects
 from __future__ import print_function
 import hashlib
 import weakref
+import binascii
 from six.moves.urllib.parse import urlunparse
 
 from w3lib.http import basic_auth_header
+from scrapy.utils.datatypes import LRUCache
 from scrapy.utils.python import to_bytes, to_native_str
 
 from w3lib.url import canonicalize_url
@@ -16,6 +18,11 @@ from scrapy.utils.httpobj import urlparse_cached
 
 
 _fingerprint_cache = weakref.WeakKeyDictionary()
+# canonicalizing URLs is the slowest part of fingerprinting, and the same URL
+# is often found (and turned into a new Request) many times during a crawl
+_canonical_url_cache = LRUCache(10000)
+
+
 def request_fingerprint(request, include_headers=None):
     """
     Return the request fingerprint.
@@ -42,15 +49,44 @@ def request_fingerprint(request, include_headers=None):
     the fingeprint. If you want to include specific headers use the
     include_headers argument, which is a list of Request headers to include.
 
+    The fingerprint is returned as a hexadecimal string, see
+    :func:`request_fingerprint_digest` to get it as bytes.
+
     """
     if include_headers:
         include_headers = tuple(to_bytes(h.lower())
                                  for h in sorted(include_headers))
     cache = _fingerprint_cache.setdefault(request, {})
     if include_headers not in cache:
-        fp = hashlib.sha1()
+        digest = _fingerprint_digest(request, include_headers, hashlib.sha1,
+                                     cache)
+        cache[include_headers] = to_native_str(binascii.hexlify(digest))
+    return cache[include_headers]
+
+
+def request_fingerprint_digest(request, include_headers=None,
+                               hash_function=hashlib.sha1):
+    """
+    Return the request fingerprint as bytes.
+
+    It's computed like :func:`request_fingerprint` (and for the default
+    ``hash_function`` it's the binary form of the same fingerprint), but
+    ``hash_function`` can be any constructor of :mod:`hashlib`-like hash
+    objects, with ``update`` and ``digest`` methods.
+    """
+    if include_headers:
+        include_headers = tuple(to_bytes(h.lower())
+                                 for h in sorted(include_headers))
+    cache = _fingerprint_cache.setdefault(request, {})
+    return _fingerprint_digest(request, include_headers, hash_function, cache)
+
+
+def _fingerprint_digest(request, include_headers, hash_function, cache):
+    key = (include_headers, hash_function)
+    if key not in cache:
+        fp = hash_function()
         fp.update(to_bytes(request.method))
-        fp.update(to_bytes(canonicalize_url(request.url)))
+        fp.update(_canonical_url(request.url))
         fp.update(request.body or b'')
         if include_headers:
             for hdr in include_headers:
@@ -58,8 +94,15 @@ def request_fingerprint(request, include_headers=None):
                     fp.update(hdr)
                     for v in request.headers.getlist(hdr):
                         fp.update(v)
-        cache[include_headers] = fp.hexdigest()
-    return cache[include_headers]
+        cache[key] = fp.digest()
+    return cache[key]
+
+
+def _canonical_url(url):
+    if url in _canonical_url_cache:
+        return _canonical_url_cache[url]
+    curl = _canonical_url_cache[url] = to_bytes(canonicalize_url(url))
+    return curl
 
 
 def request_authenticate(request, username, password):
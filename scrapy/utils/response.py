@@ -47,6 +47,15 @@ def response_status_message(status):
     return '%s %s' % (status, to_native_str(message))
 
 
+def response_body_size(response):
+    """Return the length of the body of ``response``, without reading it
+    into memory if it was spooled to a file (see
+    :attr:`~scrapy.http.Response.body_file`)"""
+    if response.body_file is not None:
+        return os.fstat(response.body_file.fileno()).st_size
+    return len(response.body)
+
+
 def response_httprepr(response):
     """Return raw HTTP representation (as bytes) of the given response. This
     is provided only for reference, since it's not the exact stream of bytes
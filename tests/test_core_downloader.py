@@ -0,0 +1,226 @@
+from time import time
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from scrapy.core.downloader import Downloader
+from scrapy.core.downloader.contextfactory import ScrapyClientContextFactory
+from scrapy.core.downloader.tls import SSL_CB_ALERT
+from scrapy.http import Request, Response
+from scrapy.spiders import Spider
+from scrapy.utils.ratelimit import TokenBucket
+from scrapy.utils.reactor import DelayedCallHeap
+from scrapy.utils.request import request_fingerprint
+from scrapy.utils.test import get_crawler
+
+
+class SlotGCTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.spider = Spider('foo')
+        self.downloader = Downloader(get_crawler(Spider))
+        self.downloader._timer = DelayedCallHeap(self.clock)
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def test_idle_slot_is_removed(self):
+        key, slot = self.downloader._get_slot(Request('http://a.example'),
+                                              self.spider)
+        self.downloader._schedule_slot_gc(key, slot, age=0)
+        self.clock.advance(0)
+        self.assertNotIn(key, self.downloader.slots)
+        self.assertFalse(slot.gccall.active())
+
+    def test_active_slot_is_kept(self):
+        request = Request('http://a.example')
+        key, slot = self.downloader._get_slot(request, self.spider)
+        slot.active.add(request)
+        self.downloader._schedule_slot_gc(key, slot, age=0)
+        self.clock.advance(0)
+        self.assertIn(key, self.downloader.slots)
+
+    def test_recently_used_slot_is_rescheduled(self):
+        key, slot = self.downloader._get_slot(Request('http://a.example'),
+                                              self.spider)
+        slot.lastseen = time()
+        slot.delay = 3600
+        self.downloader._schedule_slot_gc(key, slot, age=0)
+        first = slot.gccall
+        self.clock.advance(3600)
+        self.assertIn(key, self.downloader.slots)
+        self.assertIsNot(slot.gccall, first)
+        self.assertTrue(slot.gccall.active())
+
+
+class BandwidthTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.spider = Spider('foo')
+        self.crawler = get_crawler(Spider, {'DOWNLOAD_BANDWIDTH': 1000,
+                                            'DOWNLOAD_SLOT_BANDWIDTH': 100})
+        self.downloader = Downloader(self.crawler)
+        self.downloader._timer = DelayedCallHeap(self.clock)
+        self.downloader.bandwidth = TokenBucket(1000, clock=self.clock)
+        self.downloader.handlers.download_request = self.download_request
+        self.downloaded = []
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def download_request(self, request, spider):
+        # what the download handler does with the received bytes
+        self.assertNotIn('_bandwidth_buckets', request.meta)
+        for bucket in self.downloader.bandwidth_buckets(
+                request.meta['download_slot']):
+            bucket.consume(150)
+        self.downloaded.append(request.url)
+        return defer.succeed(Response(request.url))
+
+    def enqueue(self, url):
+        request = Request(url)
+        new = self.downloader._get_slot_key(request, self.spider) \
+            not in self.downloader.slots
+        key, slot = self.downloader._get_slot(request, self.spider)
+        if new:
+            slot.bandwidth = TokenBucket(100, clock=self.clock)
+        return self.downloader._enqueue_request(request, self.spider)
+
+    def test_slot_bandwidth(self):
+        self.enqueue('http://a.example/1')
+        self.enqueue('http://a.example/2')
+        self.enqueue('http://b.example/1')
+        self.assertEqual(self.downloaded, ['http://a.example/1',
+                                           'http://b.example/1'])
+        self.clock.advance(0.4)
+        self.assertEqual(len(self.downloaded), 2)
+        self.clock.advance(0.1)
+        self.assertEqual(self.downloaded[2:], ['http://a.example/2'])
+        self.assertEqual(self.crawler.stats.get_value(
+            'downloader/bandwidth/slot/a.example'), 0)
+
+    def test_global_bandwidth(self):
+        self.downloader.bandwidth = TokenBucket(100, clock=self.clock)
+        self.enqueue('http://a.example')
+        self.enqueue('http://b.example')
+        self.assertEqual(self.downloaded, ['http://a.example'])
+        self.clock.advance(0.5)
+        self.assertEqual(self.downloaded, ['http://a.example',
+                                           'http://b.example'])
+
+
+class CoalesceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = Spider('foo')
+        self.crawler = get_crawler(Spider)
+        self.downloader = Downloader(self.crawler)
+        self.downloader.handlers.download_request = self.download_request
+        self.downloads = []
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def download_request(self, request, spider):
+        d = defer.Deferred()
+        self.downloads.append(d)
+        return d
+
+    def enqueue(self, url, coalesce=True):
+        request = Request(url, meta={'download_coalesce': coalesce})
+        results = []
+        d = self.downloader._enqueue_request(request, self.spider)
+        d.addBoth(results.append)
+        return results
+
+    def test_coalesce(self):
+        first = self.enqueue('http://a.example/')
+        second = self.enqueue('http://a.example/')
+        other = self.enqueue('http://a.example/other')
+        self.assertEqual(len(self.downloads), 2)
+        self.downloads[0].callback(Response('http://a.example/', body=b'a'))
+        self.assertEqual(second[0].body, b'a')
+        self.assertIsNot(second[0], first[0])
+        self.assertEqual(other, [])
+        self.assertEqual(self.downloader.inflight, {
+            request_fingerprint(Request('http://a.example/other')): []})
+        self.assertEqual(self.crawler.stats.get_value('downloader/coalesced'), 1)
+        # not in flight anymore
+        self.enqueue('http://a.example/')
+        self.assertEqual(len(self.downloads), 3)
+
+    def test_waiter_meta(self):
+        first = Request('http://a.example/', meta={'download_coalesce': True})
+        second = first.replace(meta={'download_coalesce': True})
+        self.downloader._enqueue_request(first, self.spider)
+        self.downloader._enqueue_request(second, self.spider)
+        first.meta['download_latency'] = 0.5
+        self.downloads[0].callback(Response('http://a.example/'))
+        self.assertEqual(second.meta['download_slot'], 'a.example')
+        self.assertEqual(second.meta['download_latency'], 0.5)
+
+    def test_not_coalesced(self):
+        self.enqueue('http://a.example/', coalesce=False)
+        self.enqueue('http://a.example/')
+        self.enqueue('http://a.example/', coalesce=False)
+        self.assertEqual(len(self.downloads), 3)
+
+    def test_failure(self):
+        first = self.enqueue('http://a.example/')
+        second = self.enqueue('http://a.example/')
+        self.downloads[0].errback(ValueError())
+        self.assertTrue(first[0].check(ValueError))
+        self.assertTrue(second[0].check(ValueError))
+
+
+class ContextFactoryTest(unittest.TestCase):
+
+    def test_creator_reused_per_netloc(self):
+        factory = ScrapyClientContextFactory()
+        creator = factory.creatorForNetloc(b'example.com', 443)
+        self.assertIs(factory.creatorForNetloc(b'example.com', 443), creator)
+        self.assertIsNot(factory.creatorForNetloc(b'example.com', 8443), creator)
+        self.assertIsNot(factory.creatorForNetloc(b'example.org', 443), creator)
+
+    def test_session_resumption_disabled(self):
+        factory = ScrapyClientContextFactory()
+        factory.resume_sessions = False
+        creator = factory.creatorForNetloc(b'example.com', 443)
+        self.assertFalse(creator._resume_sessions)
+
+    def test_session_resumption_unsupported(self):
+        factory = ScrapyClientContextFactory()
+        with mock.patch('scrapy.core.downloader.tls.'
+                        'SESSION_RESUMPTION_SUPPORTED', False):
+            creator = factory.creatorForNetloc(b'example.com', 443)
+        self.assertFalse(creator._resume_sessions)
+
+    def test_session_kept_on_close_notify_only(self):
+        creator = ScrapyClientContextFactory().creatorForNetloc(
+            b'example.com', 443)
+        connection = mock.Mock()
+        connection.get_session.return_value = 'session'
+        # fatal handshake_failure alert
+        creator._identityVerifyingInfoCallback(connection, SSL_CB_ALERT,
+                                               2 << 8 | 40)
+        self.assertIsNone(creator._session)
+        creator._identityVerifyingInfoCallback(connection, SSL_CB_ALERT,
+                                               1 << 8)
+        self.assertEqual(creator._session, 'session')
+
+    def test_creator_cache_size(self):
+        factory = ScrapyClientContextFactory()
+        factory.tls_cache_size = 2
+        first = factory.creatorForNetloc(b'a.example', 443)
+        factory.creatorForNetloc(b'b.example', 443)
+        factory.creatorForNetloc(b'a.example', 443)
+        factory.creatorForNetloc(b'c.example', 443)
+        self.assertIs(factory.creatorForNetloc(b'a.example', 443), first)
+        self.assertEqual(len(factory._creators), 2)
+        self.assertNotIn((b'b.example', 443), factory._creators)
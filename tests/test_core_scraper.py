@@ -0,0 +1,25 @@
+import tempfile
+
+from twisted.trial import unittest
+
+from scrapy.core.scraper import Slot
+from scrapy.http import Request, Response
+
+
+class SlotTest(unittest.TestCase):
+
+    def test_spooled_body_size_and_close(self):
+        slot = Slot()
+        request = Request('http://example.com')
+        body_file = tempfile.TemporaryFile()
+        body_file.write(b'x' * 4096)
+        body_file.flush()
+        response = Response('http://example.com', body_file=body_file)
+        slot.add_response_request(response, request)
+        self.assertEqual(slot.active_size, 4096)
+        slot.next_response_request_deferred()
+        slot.finish_response(response, request)
+        self.assertEqual(slot.active_size, 0)
+        self.assertTrue(body_file.closed)
+        # the body was never read into memory
+        self.assertIsNone(response._body)
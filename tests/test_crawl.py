@@ -29,6 +29,14 @@ class CrawlTestCase(TestCase):
         yield crawler.crawl()
         self.assertEqual(len(crawler.spider.urls_visited), 11)  # 10 + start_url
 
+    @defer.inlineCallbacks
+    def test_follow_all_downloader_aware_pqueue(self):
+        settings = {'SCHEDULER_PRIORITY_QUEUE':
+                    'scrapy.pqueues.DownloaderAwarePriorityQueue'}
+        crawler = CrawlerRunner(settings).create_crawler(FollowAllSpider)
+        yield crawler.crawl()
+        self.assertEqual(len(crawler.spider.urls_visited), 11)  # 10 + start_url
+
     @defer.inlineCallbacks
     def test_delay(self):
         # short to long delays
@@ -39,8 +47,16 @@ class CrawlTestCase(TestCase):
         yield self._test_delay(1, True)
 
     @defer.inlineCallbacks
-    def _test_delay(self, delay, randomize):
-        settings = {"DOWNLOAD_DELAY": delay, 'RANDOMIZE_DOWNLOAD_DELAY': randomize}
+    def test_delay_downloader_aware_pqueue(self):
+        pqueue = 'scrapy.pqueues.DownloaderAwarePriorityQueue'
+        yield self._test_delay(0.2, False, pqueue)
+        yield self._test_delay(0.2, True, pqueue)
+
+    @defer.inlineCallbacks
+    def _test_delay(self, delay, randomize,
+                    pqueue='queuelib.PriorityQueue'):
+        settings = {"DOWNLOAD_DELAY": delay, 'RANDOMIZE_DOWNLOAD_DELAY': randomize,
+                    'SCHEDULER_PRIORITY_QUEUE': pqueue}
         crawler = CrawlerRunner(settings).create_crawler(FollowAllSpider)
         yield crawler.crawl(maxlatency=delay * 2)
         t = crawler.spider.times
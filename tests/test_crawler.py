@@ -181,3 +181,17 @@ class CrawlerProcessTest(BaseCrawlerTest):
     def test_crawler_process_accepts_None(self):
         runner = CrawlerProcess()
         self.assertOptionIsDefault(runner.settings, 'RETRY_ENABLED')
+
+    def test_dns_resolver(self):
+        from scrapy.resolver import CachingThreadedResolver, CachingDNSResolver
+        runner = CrawlerProcess()
+        self.assertIsInstance(runner._get_dns_resolver(), CachingThreadedResolver)
+        runner = CrawlerProcess({
+            'DNS_RESOLVER': 'scrapy.resolver.CachingDNSResolver',
+            'DNS_CONCURRENCY': 5,
+        })
+        resolver = runner._get_dns_resolver()
+        # stop checking /etc/resolv.conf for changes
+        self.addCleanup(resolver._resolver._parseCall.cancel)
+        self.assertIsInstance(resolver, CachingDNSResolver)
+        self.assertEqual(resolver._semaphore.limit, 5)
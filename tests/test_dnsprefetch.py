@@ -0,0 +1,122 @@
+from twisted.internet import defer, task
+from twisted.internet.error import DNSLookupError
+from twisted.trial import unittest
+
+from scrapy.exceptions import NotConfigured
+from scrapy.extensions.dnsprefetch import DNSPrefetch
+from scrapy.http import Request
+from scrapy.resolver import dnscache
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+
+
+class DNSPrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = get_crawler(Spider, {'DNS_PREFETCH_ENABLED': True,
+                                            'DNS_PREFETCH_LOOKAHEAD': 3,
+                                            'DNS_PREFETCH_RATE': 10})
+        self.spider = self.crawler._create_spider('foo')
+        self.ext = DNSPrefetch.from_crawler(self.crawler)
+        self.resolved = []
+        self.ext.resolve = self.resolve
+        self.clock = task.Clock()
+        self.ext.clock = self.clock
+        self.ext.spider_opened(self.spider)
+        dnscache.clear()
+        self.addCleanup(dnscache.clear)
+
+    def tearDown(self):
+        self.ext.spider_closed(self.spider, 'finished')
+
+    def resolve(self, host):
+        self.resolved.append(host)
+        if host.startswith('bad.'):
+            return defer.fail(DNSLookupError(host))
+        dnscache[host] = '10.0.0.1'
+        return defer.succeed('10.0.0.1')
+
+    def schedule(self, *urls, **meta):
+        for url in urls:
+            self.ext.request_scheduled(Request(url, meta=meta), self.spider)
+
+    def test_disabled(self):
+        crawler = get_crawler(Spider)
+        self.assertRaises(NotConfigured, DNSPrefetch.from_crawler, crawler)
+        crawler = get_crawler(Spider, {'DNS_PREFETCH_ENABLED': True,
+                                       'DNSCACHE_ENABLED': False})
+        self.assertRaises(NotConfigured, DNSPrefetch.from_crawler, crawler)
+
+    def test_invalid_rate(self):
+        for rate in (0, -1):
+            crawler = get_crawler(Spider, {'DNS_PREFETCH_ENABLED': True,
+                                           'DNS_PREFETCH_RATE': rate})
+            self.assertRaises(NotConfigured, DNSPrefetch.from_crawler, crawler)
+
+    def test_idle(self):
+        self.assertIsNone(self.ext.task)
+        self.schedule('http://a.example')
+        self.assertTrue(self.ext.task.running)
+        self.clock.advance(0.1)
+        self.assertTrue(self.ext.task.running)
+        self.clock.advance(0.1)
+        # stopped once the queue is empty, started again on demand
+        self.assertFalse(self.ext.task.running)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.schedule('http://b.example')
+        self.assertTrue(self.ext.task.running)
+        self.clock.advance(0.1)
+        self.assertEqual(self.resolved, ['a.example', 'b.example'])
+
+    def test_dropped(self):
+        request = Request('http://a.example/1')
+        self.ext.request_scheduled(request, self.spider)
+        self.ext.request_dropped(request, self.spider)
+        # dropped requests for a queued host don't unqueue it
+        self.schedule('http://b.example/1')
+        self.ext.request_dropped(Request('http://b.example/2'), self.spider)
+        self.clock.pump([0.1] * 3)
+        self.assertEqual(self.resolved, ['b.example'])
+
+    def test_prefetch(self):
+        self.schedule('http://a.example/1', 'http://a.example/2',
+                      'https://b.example/', 'http://127.0.0.1/')
+        self.assertEqual(self.resolved, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.resolved, ['a.example'])
+        self.clock.advance(0.1)
+        self.assertEqual(self.resolved, ['a.example', 'b.example'])
+        self.clock.advance(1)
+        self.assertEqual(self.resolved, ['a.example', 'b.example'])
+        # cached already
+        self.schedule('http://a.example/3')
+        self.clock.advance(0.1)
+        self.assertEqual(len(self.resolved), 2)
+        self.assertEqual(self.crawler.stats.get_value('dnsprefetch/queries'), 2)
+
+    def test_lookahead(self):
+        self.schedule('http://a.example', 'http://b.example',
+                      'http://c.example', 'http://d.example')
+        self.assertEqual(self.crawler.stats.get_value('dnsprefetch/dropped'), 1)
+        self.clock.pump([0.1] * 5)
+        self.assertEqual(self.resolved, ['a.example', 'b.example', 'c.example'])
+
+    def test_failed(self):
+        self.schedule('http://bad.example/1')
+        self.clock.advance(0.1)
+        # not retried
+        self.schedule('http://bad.example/2')
+        self.clock.advance(0.1)
+        self.assertEqual(self.resolved, ['bad.example'])
+        self.assertEqual(self.crawler.stats.get_value('dnsprefetch/failed'), 1)
+
+    def test_proxy(self):
+        self.schedule('http://a.example', proxy='http://proxy.example:8080')
+        self.clock.advance(0.1)
+        self.assertEqual(self.resolved, [])
+
+    def test_cached_while_queued(self):
+        self.schedule('http://a.example', 'http://b.example')
+        dnscache['a.example'] = '10.0.0.2'
+        self.clock.advance(0.1)
+        self.assertEqual(self.resolved, ['b.example'])
@@ -2,6 +2,9 @@ import os
 import six
 import contextlib
 import shutil
+import time
+from gzip import GzipFile
+from io import BytesIO
 try:
     from unittest import mock
 except ImportError:
@@ -10,7 +13,8 @@ except ImportError:
 from twisted.trial import unittest
 from twisted.protocols.policies import WrappingFactory
 from twisted.python.filepath import FilePath
-from twisted.internet import reactor, defer, error
+from twisted.internet import reactor, defer, error, ssl, protocol, task
+from twisted.protocols import portforward
 from twisted.web import server, static, util, resource
 from twisted.web._newclient import ResponseFailed
 from twisted.web.http import _DataLoss
@@ -20,12 +24,15 @@ from twisted.web.test.test_webclient import ForeverTakingResource, \
 from twisted.cred import portal, checkers, credentials
 from w3lib.url import path_to_file_uri
 
+from scrapy.core.downloader.contextfactory import ScrapyClientContextFactory
 from scrapy.core.downloader.handlers import DownloadHandlers
 from scrapy.core.downloader.handlers.datauri import DataURIDownloadHandler
 from scrapy.core.downloader.handlers.file import FileDownloadHandler
 from scrapy.core.downloader.handlers.http import HTTPDownloadHandler, HttpDownloadHandler
 from scrapy.core.downloader.handlers.http10 import HTTP10DownloadHandler
 from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.core.downloader.handlers.http2 import H2DownloadHandler, \
+    H2Connection, _Stream
 from scrapy.core.downloader.handlers.s3 import S3DownloadHandler
 
 from scrapy.spiders import Spider
@@ -34,7 +41,9 @@ from scrapy.http.response.text import TextResponse
 from scrapy.responsetypes import responsetypes
 from scrapy.settings import Settings
 from scrapy.utils.test import get_crawler, skip_if_no_boto
+from scrapy.utils.gz import gunzip
 from scrapy.utils.python import to_bytes
+from scrapy.utils.ratelimit import TokenBucket
 from scrapy.exceptions import NotConfigured
 
 from tests.mockserver import MockServer, ssl_context_factory, Echo
@@ -46,6 +55,16 @@ class DummyDH(object):
         pass
 
 
+class CrawlerDH(object):
+
+    def __init__(self, settings, crawler=None):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+
 class OffDH(object):
 
     def __init__(self, crawler):
@@ -64,6 +83,12 @@ class LoadTestCase(unittest.TestCase):
         self.assertIn('scheme', dh._handlers)
         self.assertNotIn('scheme', dh._notconfigured)
 
+    def test_from_crawler_handler(self):
+        handlers = {'scheme': 'tests.test_downloader_handlers.CrawlerDH'}
+        crawler = get_crawler(settings_dict={'DOWNLOAD_HANDLERS': handlers})
+        dh = DownloadHandlers(crawler)
+        self.assertIs(dh._get_handler('scheme').crawler, crawler)
+
     def test_not_configured_handler(self):
         handlers = {'scheme': 'tests.test_downloader_handlers.OffDH'}
         crawler = get_crawler(settings_dict={'DOWNLOAD_HANDLERS': handlers})
@@ -167,6 +192,25 @@ def closeConnection(request):
     request.finish()
 
 
+class GzipResource(resource.Resource):
+
+    body = to_bytes(''.join('%d\n' % i for i in range(100000)))
+
+    def render(self, request):
+        request.setHeader(b"Content-Encoding", b"gzip")
+        f = BytesIO()
+        with GzipFile(fileobj=f, mode='wb') as gz_file:
+            gz_file.write(self.body)
+        data = f.getvalue()
+
+        def response():
+            for i in range(0, len(data), 8192):
+                request.write(data[i:i + 8192])
+            request.finish()
+        reactor.callLater(0, response)
+        return server.NOT_DONE_YET
+
+
 class EmptyContentTypeHeaderResource(resource.Resource):
     """
     A testing resource which renders itself as the value of request body
@@ -178,10 +222,19 @@ class EmptyContentTypeHeaderResource(resource.Resource):
 
 
 class LargeChunkedFileResource(resource.Resource):
+
+    def __init__(self, content_type=None, chunk=b"x" * 1024):
+        resource.Resource.__init__(self)
+        self.content_type = content_type
+        self.chunk = chunk
+
     def render(self, request):
+        if self.content_type:
+            request.setHeader(b"content-type", self.content_type)
+
         def response():
             for i in range(1024):
-                request.write(b"x" * 1024)
+                request.write(self.chunk)
             request.finish()
         reactor.callLater(0, response)
         return server.NOT_DONE_YET
@@ -213,13 +266,17 @@ class HttpTestCase(unittest.TestCase):
         r.putChild(b"contentlength", ContentLengthHeaderResource())
         r.putChild(b"nocontenttype", EmptyContentTypeHeaderResource())
         r.putChild(b"largechunkedfile", LargeChunkedFileResource())
+        r.putChild(b"largebinaryfile",
+                   LargeChunkedFileResource(b"application/octet-stream",
+                                            b"\x01\x02" * 512))
         r.putChild(b"echo", Echo())
+        r.putChild(b"gzip", GzipResource())
         self.site = server.Site(r, timeout=None)
         self.wrapper = WrappingFactory(self.site)
         self.host = 'localhost'
         if self.scheme == 'https':
             self.port = reactor.listenSSL(
-                0, self.wrapper, ssl_context_factory(self.keyfile, self.certfile),
+                0, self.wrapper, self.server_context_factory(),
                 interface=self.host)
         else:
             self.port = reactor.listenTCP(0, self.wrapper, interface=self.host)
@@ -234,6 +291,9 @@ class HttpTestCase(unittest.TestCase):
             yield self.download_handler.close()
         shutil.rmtree(self.tmpname)
 
+    def server_context_factory(self):
+        return ssl_context_factory(self.keyfile, self.certfile)
+
     def getURL(self, path):
         return "%s://%s:%d/%s" % (self.scheme, self.host, self.portno, path)
 
@@ -359,6 +419,7 @@ class Https10TestCase(Http10TestCase):
 class Http11TestCase(HttpTestCase):
     """HTTP 1.1 test case"""
     download_handler_cls = HTTP11DownloadHandler
+    handler_logger = 'scrapy.core.downloader.handlers.http11.logger'
 
     def test_download_without_maxsize_limit(self):
         request = Request(self.getURL('file'))
@@ -397,7 +458,7 @@ class Http11TestCase(HttpTestCase):
 
     @defer.inlineCallbacks
     def test_download_with_maxsize_very_large_file(self):
-        with mock.patch('scrapy.core.downloader.handlers.http11.logger') as logger:
+        with mock.patch(self.handler_logger) as logger:
             request = Request(self.getURL('largechunkedfile'))
 
             def check(logger):
@@ -434,6 +495,125 @@ class Http11TestCase(HttpTestCase):
         d.addCallback(self.assertEqual, b"0123456789")
         return d
 
+    @defer.inlineCallbacks
+    def test_download_decompressed(self):
+        request = Request(self.getURL('gzip'),
+                          meta={'decompression_maxsize': 0})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEqual(response.body, GzipResource.body)
+        self.assertNotIn(b'Content-Encoding', response.headers)
+        encoded_size = response.encoded_size
+
+        # left to HttpCompressionMiddleware
+        request = Request(self.getURL('gzip'))
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEqual(gunzip(response.body), GzipResource.body)
+        self.assertEqual(response.headers[b'Content-Encoding'], b'gzip')
+        self.assertIsNone(response.encoded_size)
+        self.assertEqual(encoded_size, len(response.body))
+
+    @defer.inlineCallbacks
+    def test_download_decompressed_maxsize(self):
+        request = Request(self.getURL('gzip'),
+                          meta={'decompression_maxsize': 100000})
+        with mock.patch(self.handler_logger) as logger:
+            d = self.download_request(request, Spider('foo'))
+            yield self.assertFailure(d, defer.CancelledError,
+                                     error.ConnectionAborted)
+        logger.error.assert_called_once_with(mock.ANY, mock.ANY)
+
+    @defer.inlineCallbacks
+    def test_download_bandwidth(self):
+        # 1 MiB at 1 MiB/s, the first 256 KiB being a burst
+        bucket = TokenBucket(1024 * 1024, burst=256 * 1024)
+        crawler = get_crawler()
+        crawler.engine = mock.Mock()
+        crawler.engine.downloader.bandwidth_buckets.return_value = [bucket]
+        handler = self.download_handler_cls.from_crawler(crawler)
+        self.addCleanup(handler.close)
+        request = Request(self.getURL('largechunkedfile'),
+                          meta={'download_slot': 'example.com'})
+        start = time.time()
+        response = yield handler.download_request(request, Spider('foo'))
+        crawler.engine.downloader.bandwidth_buckets.assert_called_with(
+            'example.com')
+        self.assertEqual(len(response.body), 1024 * 1024)
+        self.assertGreater(time.time() - start, 0.6)
+        self.assertLess(bucket.tokens, 256 * 1024)
+
+    @defer.inlineCallbacks
+    def test_download_spooled_body(self):
+        meta = {'download_spoolsize': 1000}
+        request = Request(self.getURL('largebinaryfile'), meta=meta)
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertIsNotNone(response.body_file)
+        self.assertEqual(response.body_file.read(4), b"\x01\x02\x01\x02")
+        self.assertIsInstance(response.body, bytes)
+        self.assertEqual(len(response.body), 1024 * 1024)
+        response.body_file.close()
+
+        # text responses are spooled too
+        request = Request(self.getURL('largechunkedfile'), meta=meta)
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertIsInstance(response, TextResponse)
+        self.assertIsNotNone(response.body_file)
+        self.assertEqual(response.body, b"x" * 1024 * 1024)
+        response.body_file.close()
+
+        # small bodies stay in memory
+        request = Request(self.getURL('file'), meta=meta)
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertIsNone(response.body_file)
+        self.assertEqual(response.body, b"0123456789")
+
+    @defer.inlineCallbacks
+    def test_download_chunk_callback(self):
+        chunks = []
+
+        def chunk_callback(response, chunk):
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.body, b'')
+            chunks.append(chunk)
+
+        meta = {'download_chunk_callback': chunk_callback}
+        request = Request(self.getURL('largechunkedfile'), meta=meta)
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEqual(response.body, b'')
+        self.assertIn('streamed', response.flags)
+        self.assertEqual(b''.join(chunks), b"x" * 1024 * 1024)
+
+    @defer.inlineCallbacks
+    def test_download_chunk_callback_backpressure(self):
+        chunks = []
+        pending = []
+
+        def chunk_callback(response, chunk):
+            # only one chunk is processed at a time
+            self.assertFalse(pending)
+            chunks.append(chunk)
+            d = defer.Deferred()
+            d.addCallback(lambda _: pending.remove(d))
+            pending.append(d)
+            reactor.callLater(0.001, d.callback, None)
+            return d
+
+        meta = {'download_chunk_callback': chunk_callback}
+        request = Request(self.getURL('largechunkedfile'), meta=meta)
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertFalse(pending)
+        self.assertEqual(b''.join(chunks), b"x" * 1024 * 1024)
+        self.assertIn('streamed', response.flags)
+
+    @defer.inlineCallbacks
+    def test_download_chunk_callback_error(self):
+        def chunk_callback(response, chunk):
+            raise ValueError("stop")
+
+        meta = {'download_chunk_callback': chunk_callback}
+        request = Request(self.getURL('largechunkedfile'), meta=meta)
+        d = self.download_request(request, Spider('foo'))
+        yield self.assertFailure(d, ValueError)
+
     def test_download_chunked_content(self):
         request = Request(self.getURL('chunked'))
         d = self.download_request(request, Spider('foo'))
@@ -482,9 +662,116 @@ class Http11TestCase(HttpTestCase):
         return self.test_download_broken_content_allow_data_loss_via_setting('broken-chunked')
 
 
+class TunnelProxy(portforward.Proxy):
+    """An HTTP proxy which only opens CONNECT tunnels, counted by its
+    factory"""
+
+    def connectionMade(self):
+        self.buffer = b''
+
+    def dataReceived(self, data):
+        if self.peer is not None:
+            return portforward.Proxy.dataReceived(self, data)
+        self.buffer += data
+        if b'\r\n\r\n' not in self.buffer:
+            return
+        host, port = self.buffer.split()[1].rsplit(b':', 1)
+        self.factory.tunnels += 1
+        # resumed once connected to the target
+        self.transport.pauseProducing()
+        client = portforward.ProxyClientFactory()
+        client.setServer(self)
+        reactor.connectTCP(host.decode('ascii'), int(port), client)
+        self.transport.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+
+
 class Https11TestCase(Http11TestCase):
     scheme = 'https'
 
+    @defer.inlineCallbacks
+    def test_tls_session_resumption(self):
+        crawler = get_crawler()
+        handler = self.download_handler_cls.from_crawler(crawler)
+        self.addCleanup(handler.close)
+        request = Request(self.getURL('file'))
+        yield handler.download_request(request, Spider('foo'))
+        # a new connection resumes the session of the previous one
+        yield handler._pool.closeCachedConnections()
+        response = yield handler.download_request(request, Spider('foo'))
+        self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(crawler.stats.get_value('tls/handshakes'), 2)
+        self.assertEqual(crawler.stats.get_value('tls/sessions_resumed'), 1)
+        self.assertEqual(
+            crawler.stats.get_value('tls/session_resumption_rate'), 0.5)
+
+    @defer.inlineCallbacks
+    def test_tls_session_resumption_undetectable(self):
+        crawler = get_crawler()
+        handler = self.download_handler_cls.from_crawler(crawler)
+        self.addCleanup(handler.close)
+        request = Request(self.getURL('file'))
+        with mock.patch('scrapy.core.downloader.tls._SSL_session_reused', None):
+            yield handler.download_request(request, Spider('foo'))
+            yield handler._pool.closeCachedConnections()
+            response = yield handler.download_request(request, Spider('foo'))
+        self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(crawler.stats.get_value('tls/handshakes'), 2)
+        self.assertIsNone(crawler.stats.get_value('tls/sessions_resumed'))
+        self.assertIsNone(
+            crawler.stats.get_value('tls/session_resumption_rate'))
+
+    @defer.inlineCallbacks
+    def test_tls_session_resumption_disabled(self):
+        crawler = get_crawler(settings_dict={
+            'DOWNLOADER_TLS_SESSION_RESUMPTION': False})
+        handler = self.download_handler_cls.from_crawler(crawler)
+        self.addCleanup(handler.close)
+        request = Request(self.getURL('file'))
+        yield handler.download_request(request, Spider('foo'))
+        yield handler._pool.closeCachedConnections()
+        yield handler.download_request(request, Spider('foo'))
+        self.assertIsNone(crawler.stats.get_value('tls/handshakes'))
+        self.assertIsNone(crawler.stats.get_value('tls/sessions_resumed'))
+
+    @defer.inlineCallbacks
+    def test_tls_session_resumption_stats_error(self):
+        crawler = get_crawler()
+        handler = self.download_handler_cls.from_crawler(crawler)
+        self.addCleanup(handler.close)
+        request = Request(self.getURL('file'))
+        with mock.patch('scrapy.core.downloader.tls.session_reused',
+                        side_effect=AttributeError):
+            response = yield handler.download_request(request, Spider('foo'))
+        self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(crawler.stats.get_value('tls/handshakes'), 1)
+
+    @defer.inlineCallbacks
+    def test_download_with_proxy_tunnel_reuse(self):
+        factory = protocol.ServerFactory.forProtocol(TunnelProxy)
+        factory.tunnels = 0
+        port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        self.addCleanup(port.stopListening)
+        crawler = get_crawler()
+        handler = self.download_handler_cls.from_crawler(crawler)
+        self.addCleanup(handler.close)
+        proxy = 'http://127.0.0.1:%d' % port.getHost().port
+        # tunnels are not shared between different proxy credentials
+        for auth in [b'Basic dXNlcjpwYXNz', b'Basic dXNlcjpwYXNz',
+                     b'Basic b3RoZXI6cGFzcw==']:
+            request = Request(self.getURL('file'), meta={'proxy': proxy},
+                              headers={'Proxy-Authorization': auth})
+            response = yield handler.download_request(request, Spider('foo'))
+            self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(factory.tunnels, 2)
+        self.assertEqual(crawler.stats.get_value('downloader/tunnel/opened'), 2)
+        self.assertEqual(crawler.stats.get_value('downloader/tunnel/reused'), 1)
+
+        # a tunnel closed while idle is replaced by a new one
+        yield handler._pool.closeCachedConnections()
+        response = yield handler.download_request(request, Spider('foo'))
+        self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(factory.tunnels, 3)
+
 
 class Https11WrongHostnameTestCase(Http11TestCase):
     scheme = 'https'
@@ -506,6 +793,126 @@ class Https11InvalidDNSId(Https11TestCase):
         self.host = '127.0.0.1'
 
 
+class Https2TestCase(Http11TestCase):
+    """HTTP/2 test case, negotiated through ALPN"""
+    scheme = 'https'
+    download_handler_cls = H2DownloadHandler
+    handler_logger = 'scrapy.core.downloader.handlers.http2.logger'
+    protocols = [b'h2', b'http/1.1']
+
+    def setUp(self):
+        if H2Connection is None:
+            raise unittest.SkipTest("h2 is not installed")
+        super(Https2TestCase, self).setUp()
+
+    def server_context_factory(self):
+        def read(path):
+            with open(os.path.join(os.path.dirname(__file__), path), 'rb') as f:
+                return f.read()
+        cert = ssl.PrivateCertificate.loadPEM(
+            read(self.certfile) + read(self.keyfile))
+        return ssl.CertificateOptions(
+            privateKey=cert.privateKey.original, certificate=cert.original,
+            acceptableProtocols=self.protocols)
+
+    def test_download_broken_chunked_content_cause_data_loss(self):
+        raise unittest.SkipTest("HTTP/2 has no chunked transfer encoding")
+
+    def test_download_broken_chunked_content_allow_data_loss(self):
+        raise unittest.SkipTest("HTTP/2 has no chunked transfer encoding")
+
+    def test_download_broken_chunked_content_allow_data_loss_via_setting(self):
+        raise unittest.SkipTest("HTTP/2 has no chunked transfer encoding")
+
+    def test_download_decompressed(self):
+        raise unittest.SkipTest("Decoded by HttpCompressionMiddleware")
+
+    def test_download_decompressed_maxsize(self):
+        raise unittest.SkipTest("Decoded by HttpCompressionMiddleware")
+
+    @defer.inlineCallbacks
+    def test_download_multiplexed(self):
+        spider = Spider('foo')
+        responses = yield defer.gatherResults([
+            self.download_request(Request(self.getURL('file')), spider)
+            for _ in range(5)])
+        self.assertEqual([r.body for r in responses], [b"0123456789"] * 5)
+        self.assertEqual(len(self.wrapper.protocols), 1)
+        self.assertEqual(len(self.download_handler._pool._connections), 1)
+
+    @defer.inlineCallbacks
+    def test_download_plain_http_falls_back(self):
+        port = reactor.listenTCP(0, self.wrapper, interface=self.host)
+        self.addCleanup(port.stopListening)
+        url = "http://%s:%d/file" % (self.host, port.getHost().port)
+        response = yield self.download_request(Request(url), Spider('foo'))
+        self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(len(self.download_handler._pool._connections), 0)
+
+
+class Https2FallbackTestCase(Https2TestCase):
+    """HTTP/2 handler downloading from a server without HTTP/2 support"""
+    handler_logger = 'scrapy.core.downloader.handlers.http11.logger'
+    protocols = [b'http/1.1']
+
+    test_download_broken_chunked_content_cause_data_loss = \
+        Http11TestCase.test_download_broken_chunked_content_cause_data_loss
+    test_download_broken_chunked_content_allow_data_loss = \
+        Http11TestCase.test_download_broken_chunked_content_allow_data_loss
+    test_download_broken_chunked_content_allow_data_loss_via_setting = \
+        Http11TestCase.test_download_broken_chunked_content_allow_data_loss_via_setting
+    test_download_decompressed = Http11TestCase.test_download_decompressed
+    test_download_decompressed_maxsize = \
+        Http11TestCase.test_download_decompressed_maxsize
+
+    @defer.inlineCallbacks
+    def test_download_multiplexed(self):
+        spider = Spider('foo')
+        response = yield self.download_request(Request(self.getURL('file')),
+                                               spider)
+        self.assertEqual(response.body, b"0123456789")
+        self.assertIn((self.host, self.portno, None),
+                      self.download_handler._pool.http11_keys)
+        self.assertEqual(len(self.download_handler._pool._connections), 0)
+
+
+class LegacyContextFactory(ScrapyClientContextFactory):
+
+    def __init__(self, method):
+        super(LegacyContextFactory, self).__init__(method)
+
+
+class H2DownloadHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        if H2Connection is None:
+            raise unittest.SkipTest("h2 is not installed")
+
+    def test_alpn_offered(self):
+        handler = H2DownloadHandler(Settings())
+        self.addCleanup(handler.close)
+        self.assertTrue(handler._enabled)
+        creator = handler._contextFactory.creatorForNetloc(b'example.com', 443)
+        self.assertIsNot(creator, handler._http11._contextFactory.creatorForNetloc(
+            b'example.com', 443))
+
+    def test_context_factory_without_alpn(self):
+        settings = Settings({'DOWNLOADER_CLIENTCONTEXTFACTORY':
+                             'tests.test_downloader_handlers.LegacyContextFactory'})
+        with mock.patch('scrapy.core.downloader.handlers.http2.logger') as logger:
+            handler = H2DownloadHandler(settings)
+        self.addCleanup(handler.close)
+        self.assertFalse(handler._enabled)
+        self.assertTrue(logger.warning.called)
+
+    def test_ipv6_authority(self):
+        request = Request('https://[::1]:8443/path?q=1')
+        stream = _Stream(None, request, request.url, 0, 0, 0, 0, True)
+        headers = dict(stream.request_headers())
+        self.assertEqual(headers[b':authority'], b'[::1]:8443')
+        self.assertEqual(headers[b':path'], b'/path?q=1')
+
+
 class Http11MockServerTestCase(unittest.TestCase):
     """HTTP 1.1 test case with MockServer"""
 
@@ -648,6 +1055,25 @@ class Http11ProxyTestCase(HttpProxyTestCase):
         timeout = yield self.assertFailure(d, error.TimeoutError)
         self.assertIn(domain, timeout.osError)
 
+    @defer.inlineCallbacks
+    def test_agents_reused(self):
+        spider = Spider('foo')
+        agents = self.download_handler._agents
+        for _ in range(2):
+            yield self.download_request(Request(self.getURL('path')), spider)
+            request = Request('http://example.com',
+                              meta={'proxy': self.getURL('')})
+            yield self.download_request(request, spider)
+        self.assertEqual(len(agents), 2)
+        request = Request(self.getURL('path'), meta={'download_timeout': 60})
+        yield self.download_request(request, spider)
+        self.assertEqual(len(agents), 3)
+
+        self.download_handler._agents = None
+        response = yield self.download_request(Request(self.getURL('path')),
+                                               spider)
+        self.assertEqual(response.body, b'/path')
+
 
 class HttpDownloadHandlerMock(object):
     def __init__(self, settings):
@@ -916,6 +1342,44 @@ class BaseFTPTestCase(unittest.TestCase):
             os.remove(local_fname)
         return self._add_test_callbacks(d, _test)
 
+    @defer.inlineCallbacks
+    def test_ftp_connection_reuse(self):
+        self.addCleanup(self.download_handler.close)
+        url = "ftp://127.0.0.1:%s/" % self.portNum
+        clients = set()
+        for path, status in [('file.txt', 200), ('notexist.txt', 404),
+                             ('file with spaces.txt', 200)]:
+            request = Request(url + path, meta=self.req_meta)
+            r = yield self.download_handler.download_request(request, None)
+            self.assertEqual(r.status, status)
+            clients.add(self.download_handler.client)
+        self.assertEqual(len(clients), 1)
+
+        # idle connections are closed after a timeout
+        pool = self.download_handler._pool
+        pool.clock = task.Clock()
+        yield self.download_handler.download_request(request, None)
+        self.assertIn(self.download_handler.client, clients)
+        pool.clock.advance(pool.timeout)
+        client = self.download_handler.client
+        self.assertIsNone(pool.get(client.key))
+        r = yield self.download_handler.download_request(request, None)
+        self.assertEqual(r.body, b'Moooooooooo power!')
+        self.assertNotIn(self.download_handler.client, clients)
+
+    @defer.inlineCallbacks
+    def test_ftp_connection_pool_disabled(self):
+        from scrapy.core.downloader.handlers.ftp import FTPDownloadHandler
+        handler = FTPDownloadHandler(Settings({'FTP_POOL_SIZE': 0}))
+        request = Request(url="ftp://127.0.0.1:%s/file.txt" % self.portNum,
+                          meta=self.req_meta)
+        clients = set()
+        for _ in range(2):
+            r = yield handler.download_request(request, None)
+            self.assertEqual(r.body, b'I have the power!')
+            clients.add(handler.client)
+        self.assertEqual(len(clients), 2)
+
 
 class FTPTestCase(BaseFTPTestCase):
 
@@ -0,0 +1,172 @@
+import gc
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from twisted.internet.error import TimeoutError, ConnectionRefusedError
+
+from scrapy.core.downloader import Slot
+from scrapy.downloadermiddlewares.adaptiveconcurrency import \
+    AdaptiveConcurrencyMiddleware, percentile
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, Response
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+
+
+class AdaptiveConcurrencyMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.crawler = get_crawler(Spider, {
+            'ADAPTIVE_CONCURRENCY_ENABLED': True,
+            'ADAPTIVE_CONCURRENCY_MAX': 6,
+            'ADAPTIVE_CONCURRENCY_WINDOW': 4,
+        })
+        self.spider = self.crawler._create_spider('foo')
+        self.slot = Slot(2, 0, False)
+        self.crawler.engine = mock.Mock()
+        self.crawler.engine.downloader.slots = {'example.com': self.slot}
+        self.mw = AdaptiveConcurrencyMiddleware.from_crawler(self.crawler)
+        self.now = 1000.0
+        patcher = mock.patch(
+            'scrapy.downloadermiddlewares.adaptiveconcurrency.time',
+            lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, latency=0.1, **meta):
+        meta.setdefault('download_slot', 'example.com')
+        meta.setdefault('download_latency', latency)
+        return Request('http://example.com', meta=meta)
+
+    def respond(self, latency=0.1, status=200, headers=None, flags=None,
+                elapsed=None):
+        self.now += latency if elapsed is None else elapsed
+        response = Response('http://example.com', status=status,
+                            headers=headers, flags=flags)
+        return self.mw.process_response(self.request(latency), response,
+                                        self.spider)
+
+    def test_disabled(self):
+        crawler = get_crawler(Spider)
+        self.assertRaises(NotConfigured,
+                          AdaptiveConcurrencyMiddleware.from_crawler, crawler)
+
+    def test_additive_increase(self):
+        self.respond()
+        self.assertEqual(self.slot.concurrency, 2)
+        self.respond()
+        self.assertEqual(self.slot.concurrency, 3)
+        for _ in range(3):
+            self.respond()
+        self.assertEqual(self.slot.concurrency, 4)
+        self.assertEqual(self.crawler.stats.get_value(
+            'adaptive_concurrency/max_slot_concurrency'), 4)
+        for _ in range(20):
+            self.respond()
+        self.assertEqual(self.slot.concurrency, 6)
+        self.assertEqual(self.crawler.stats.get_value(
+            'adaptive_concurrency/increases'), 4)
+
+    def test_slots_stat(self):
+        self.respond()
+        self.respond()
+        self.assertEqual(self.crawler.stats.get_value(
+            'adaptive_concurrency/slots'), {'example.com': 3})
+        other = Slot(1, 0, False)
+        self.crawler.engine.downloader.slots = {'example.org': other}
+        self.mw.process_response(
+            self.request(download_slot='example.org'),
+            Response('http://example.org', status=503), self.spider)
+        self.mw.process_response(
+            self.request(download_slot='example.org'),
+            Response('http://example.org'), self.spider)
+        self.assertEqual(self.crawler.stats.get_value(
+            'adaptive_concurrency/slots'), {'example.org': 2})
+
+    def test_state_dropped_with_slot(self):
+        self.respond()
+        self.assertEqual(len(self.mw._states), 1)
+        self.crawler.engine.downloader.slots.clear()
+        del self.slot
+        gc.collect()
+        self.assertEqual(len(self.mw._states), 0)
+        self.assertEqual(
+            [k for k in self.crawler.stats.get_stats()
+             if 'example.com' in k], [])
+
+    def test_decrease_on_http_codes(self):
+        self.slot.concurrency = 6
+        self.respond(status=503)
+        self.assertEqual(self.slot.concurrency, 3)
+        # responses to requests sent before the decrease are ignored
+        self.respond(latency=1, status=429, elapsed=0.5)
+        self.assertEqual(self.slot.concurrency, 3)
+        self.now += 1
+        self.respond(status=429)
+        self.assertEqual(self.slot.concurrency, 1)
+        self.now += 1
+        self.respond(status=429)
+        self.assertEqual(self.slot.concurrency, 1)
+        self.assertEqual(self.crawler.stats.get_value(
+            'adaptive_concurrency/decreases'), 3)
+
+    def test_decrease_on_timeout(self):
+        self.slot.concurrency = 4
+        request = self.request(download_timeout=180)
+        self.mw.process_exception(request, TimeoutError(), self.spider)
+        self.assertEqual(self.slot.concurrency, 2)
+        self.now += 10
+        self.mw.process_exception(request, ConnectionRefusedError(),
+                                  self.spider)
+        self.assertEqual(self.slot.concurrency, 2)
+
+    def test_decrease_on_latency(self):
+        self.slot.concurrency = 6
+        for _ in range(3):
+            self.respond(latency=0.1)
+        self.respond(latency=0.5)
+        self.assertEqual(self.slot.concurrency, 3)
+
+    def test_retry_after(self):
+        self.slot.concurrency = 4
+        self.respond(status=503, headers={'Retry-After': '30'})
+        self.assertEqual(self.slot.concurrency, 2)
+        for _ in range(5):
+            self.respond()
+        self.assertEqual(self.slot.concurrency, 2)
+        self.now += 30
+        for _ in range(2):
+            self.respond()
+        self.assertEqual(self.slot.concurrency, 3)
+
+    def test_retry_after_date(self):
+        self.now = 784111777  # Sun, 06 Nov 1994 08:49:37 GMT
+        response = Response('http://example.com', status=503, headers={
+            'Retry-After': 'Sun, 06 Nov 1994 08:50:37 GMT'})
+        self.assertEqual(self.mw._retry_after(response, self.now), 60)
+        response.headers['Retry-After'] = 'Sun, 06 Nov 1994 10:49:37 GMT'
+        self.assertEqual(self.mw._retry_after(response, self.now), 600)
+        response.headers['Retry-After'] = 'soon'
+        self.assertEqual(self.mw._retry_after(response, self.now), 0)
+
+    def test_ignored_responses(self):
+        self.respond(flags=['cached'])
+        self.respond(flags=['cached'])
+        response = Response('http://example.com')
+        self.mw.process_response(self.request(download_slot='other'),
+                                 response, self.spider)
+        self.assertEqual(self.slot.concurrency, 2)
+
+
+class PercentileTest(TestCase):
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 90), 5)
+        self.assertEqual(percentile(values, 100), 5)
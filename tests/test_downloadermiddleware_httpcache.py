@@ -101,6 +101,23 @@ class _BaseTest(unittest.TestCase):
             if mw.policy.should_cache_response(self.response, self.request):
                 self.assertIsInstance(mw.storage.retrieve_response(self.spider, self.request), self.response.__class__)
 
+    def test_streamed_response_not_cached(self):
+        with self._middleware() as mw:
+            response = self.response.replace(body=b'', flags=['streamed'])
+            mw.process_response(self.request, response, self.spider)
+            self.assertEqual(mw.storage.retrieve_response(self.spider, self.request), None)
+            self.assertEqual(self.crawler.stats.get_value('httpcache/uncacheable'), 1)
+
+    def test_chunk_callback_request_skips_cache(self):
+        with self._middleware() as mw:
+            mw.storage.store_response(self.spider, self.request, self.response)
+            request = self.request.replace(
+                meta={'download_chunk_callback': lambda response, data: None})
+            self.assertIsNone(mw.process_request(request, self.spider))
+            self.assertIs(mw.process_response(request, self.response, self.spider),
+                          self.response)
+            self.assertNotIn('_dont_cache', request.meta)
+
 
 class DefaultStorageTest(_BaseTest):
 
@@ -7,8 +7,10 @@ from scrapy.spiders import Spider
 from scrapy.http import Response, Request, HtmlResponse
 from scrapy.downloadermiddlewares.httpcompression import HttpCompressionMiddleware, \
     ACCEPTED_ENCODINGS
+from scrapy.exceptions import IgnoreRequest
 from scrapy.responsetypes import responsetypes
 from scrapy.utils.gz import gunzip
+from scrapy.utils.test import get_crawler
 from tests import tests_datadir
 from w3lib.encoding import resolve_encoding
 
@@ -20,7 +22,8 @@ FORMAT = {
         'x-gzip': ('html-gzip.bin', 'gzip'),
         'rawdeflate': ('html-rawdeflate.bin', 'deflate'),
         'zlibdeflate': ('html-zlibdeflate.bin', 'deflate'),
-        'br': ('html-br.bin', 'br')
+        'br': ('html-br.bin', 'br'),
+        'zstd': ('html-zstd.bin', 'zstd'),
         }
 
 
@@ -58,6 +61,25 @@ class HttpCompressionTest(TestCase):
         self.assertEqual(request.headers.get('Accept-Encoding'),
                          b','.join(ACCEPTED_ENCODINGS))
 
+    def test_process_request_decompression_maxsize(self):
+        request = Request('http://scrapytest.org')
+        HttpCompressionMiddleware(maxsize=1000).process_request(request,
+                                                                self.spider)
+        self.assertEqual(request.meta['decompression_maxsize'], 1000)
+
+    def test_process_request_streamed(self):
+        request = Request('http://scrapytest.org',
+                          meta={'download_chunk_callback': lambda r, c: None})
+        self.mw.process_request(request, self.spider)
+        assert 'Accept-Encoding' not in request.headers
+
+    def test_process_response_streamed(self):
+        response = self._getresponse('gzip')
+        response = response.replace(body=b'', flags=['streamed'])
+        newresponse = self.mw.process_response(response.request, response,
+                                               self.spider)
+        self.assertIs(newresponse, response)
+
     def test_process_response_gzip(self):
         response = self._getresponse('gzip')
         request = response.request
@@ -68,6 +90,29 @@ class HttpCompressionTest(TestCase):
         assert newresponse.body.startswith(b'<!DOCTYPE')
         assert 'Content-Encoding' not in newresponse.headers
 
+    def test_process_response_stats(self):
+        crawler = get_crawler(Spider)
+        mw = HttpCompressionMiddleware.from_crawler(crawler)
+        response = self._getresponse('gzip')
+        newresponse = mw.process_response(response.request, response,
+                                          self.spider)
+        self.assertEqual(crawler.stats.get_value(
+            'httpcompression/response_count', spider=self.spider), 1)
+        self.assertEqual(crawler.stats.get_value(
+            'httpcompression/response_bytes', spider=self.spider),
+            len(newresponse.body))
+
+    def test_process_response_maxsize(self):
+        response = self._getresponse('gzip')
+        request = response.request
+        request.meta['decompression_maxsize'] = 1000
+        self.assertRaises(IgnoreRequest, self.mw.process_response,
+                          request, response, self.spider)
+        mw = HttpCompressionMiddleware(maxsize=1000)
+        self.assertRaises(IgnoreRequest, mw.process_response,
+                          Request('http://scrapytest.org'),
+                          self._getresponse('gzip'), self.spider)
+
     def test_process_response_br(self):
         try:
             import brotli
@@ -81,6 +126,19 @@ class HttpCompressionTest(TestCase):
         assert newresponse.body.startswith(b"<!DOCTYPE")
         assert 'Content-Encoding' not in newresponse.headers
 
+    def test_process_response_zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise SkipTest("no zstandard")
+        response = self._getresponse('zstd')
+        request = response.request
+        self.assertEqual(response.headers['Content-Encoding'], b'zstd')
+        newresponse = self.mw.process_response(request, response, self.spider)
+        assert newresponse is not response
+        assert newresponse.body.startswith(b"<!DOCTYPE")
+        assert 'Content-Encoding' not in newresponse.headers
+
     def test_process_response_rawdeflate(self):
         response = self._getresponse('rawdeflate')
         request = response.request
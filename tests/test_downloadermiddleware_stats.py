@@ -1,8 +1,11 @@
 from unittest import TestCase
 
-from scrapy.downloadermiddlewares.stats import DownloaderStats
+from scrapy.downloadermiddlewares.stats import DownloaderStats, \
+    get_request_size, get_response_size
 from scrapy.http import Request, Response
 from scrapy.spiders import Spider
+from scrapy.utils.request import request_httprepr
+from scrapy.utils.response import response_httprepr
 from scrapy.utils.test import get_crawler
 
 
@@ -37,6 +40,39 @@ class TestDownloaderStats(TestCase):
         self.mw.process_response(self.req, self.res, self.spider)
         self.assertStatsEqual('downloader/response_count', 1)
 
+    def test_request_bytes(self):
+        for request in [
+            self.req,
+            Request('http://scrapytest.org/a;b?c=d', method='POST', body=b'x',
+                    headers={'A': ['1', '22'], 'Bb': 'x'}),
+            Request('data:,foo'),
+        ]:
+            self.assertEqual(get_request_size(request),
+                             len(request_httprepr(request)))
+        self.mw.process_request(self.req, self.spider)
+        self.assertStatsEqual('downloader/request_bytes',
+                              len(request_httprepr(self.req)))
+
+    def test_response_bytes(self):
+        for response in [
+            self.res,
+            Response('http://scrapytest.org', status=999, body=b'abc',
+                     headers={'A': ['1', '22'], 'Bb': 'x'}),
+            Response('http://scrapytest.org', headers={'A': []}),
+        ]:
+            self.assertEqual(get_response_size(response),
+                             len(response_httprepr(response)))
+        self.mw.process_response(self.req, self.res, self.spider)
+        self.assertStatsEqual('downloader/response_bytes',
+                              len(response_httprepr(self.res)))
+
+    def test_response_bytes_decoded(self):
+        response = Response('http://scrapytest.org', body=b'decoded body')
+        response.encoded_size = 5
+        self.mw.process_response(self.req, response, self.spider)
+        self.assertStatsEqual('downloader/response_bytes',
+                              len(response_httprepr(response)) - 7)
+
     def test_process_exception(self):
         self.mw.process_exception(self.req, MyException(), self.spider)
         self.assertStatsEqual('downloader/exception_count', 1)
@@ -1,11 +1,23 @@
+import os
+import time
 import hashlib
 import tempfile
 import unittest
 import shutil
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
-from scrapy.dupefilters import RFPDupeFilter
-from scrapy.http import Request
+from scrapy.core.scheduler import Scheduler
+from scrapy.dupefilters import RFPDupeFilter, CompactRFPDupeFilter, \
+    BloomDupeFilter, LSMDupeFilter, RecrawlDupeFilter
+from scrapy import signals
+from scrapy.http import Request, Response
+from scrapy.spiders import Spider
 from scrapy.utils.python import to_bytes
+from scrapy.utils.request import request_fingerprint_digest
+from scrapy.utils.test import get_crawler
 
 
 class RFPDupeFilterTest(unittest.TestCase):
@@ -77,3 +89,347 @@ class RFPDupeFilterTest(unittest.TestCase):
         assert case_insensitive_dupefilter.request_seen(r2)
 
         case_insensitive_dupefilter.close('finished')
+
+
+class CompactRFPDupeFilterTest(unittest.TestCase):
+
+    def test_filter(self):
+        dupefilter = CompactRFPDupeFilter()
+        dupefilter.open()
+
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+        r3 = Request('http://scrapytest.org/2')
+
+        assert not dupefilter.request_seen(r1)
+        assert dupefilter.request_seen(r1)
+
+        assert not dupefilter.request_seen(r2)
+        assert dupefilter.request_seen(r3)
+
+        dupefilter.close('finished')
+
+    def test_many_requests(self):
+        dupefilter = CompactRFPDupeFilter(digest_size=8)
+        requests = [Request('http://scrapytest.org/%d' % i) for i in range(5000)]
+        for r in requests:
+            assert not dupefilter.request_seen(r)
+        for r in requests:
+            assert dupefilter.request_seen(r)
+        self.assertEqual(len(dupefilter.fingerprints), 5000)
+        self.assertLess(dupefilter.fingerprints.nbytes, 5000 * 8 * 4)
+
+    def test_dupefilter_path(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+
+        path = tempfile.mkdtemp()
+        try:
+            df = CompactRFPDupeFilter(path)
+            df.open()
+            assert not df.request_seen(r1)
+            assert df.request_seen(r1)
+            df.close('finished')
+
+            # requests.seen is compatible with RFPDupeFilter
+            df2 = RFPDupeFilter(path)
+            df2.open()
+            assert df2.request_seen(r1)
+            assert not df2.request_seen(r2)
+            df2.close('finished')
+
+            df3 = CompactRFPDupeFilter(path, digest_size=16)
+            df3.open()
+            assert df3.request_seen(r1)
+            assert df3.request_seen(r2)
+            df3.close('finished')
+        finally:
+            shutil.rmtree(path)
+
+    def test_binary_fingerprint(self):
+        r1 = Request('http://scrapytest.org/1')
+        dupefilter = CompactRFPDupeFilter()
+        with mock.patch('scrapy.dupefilters.request_fingerprint') as hexfp:
+            assert not dupefilter.request_seen(r1)
+        self.assertFalse(hexfp.called)
+        self.assertIn(request_fingerprint_digest(r1), dupefilter.fingerprints)
+
+    def test_custom_request_fingerprint(self):
+        class CaseInsensitiveDupeFilter(CompactRFPDupeFilter):
+
+            def request_fingerprint(self, request):
+                return request.url.lower()
+
+            def request_digest(self, request, size=20):
+                return hashlib.sha1(to_bytes(request.url.lower())).digest()[:size]
+
+        dupefilter = CaseInsensitiveDupeFilter()
+        assert not dupefilter.request_seen(Request('http://scrapytest.org/index.html'))
+        assert dupefilter.request_seen(Request('http://scrapytest.org/INDEX.html'))
+
+    def test_stats(self):
+        crawler = get_crawler(Spider, {'DUPEFILTER_DIGEST_SIZE': 8})
+        dupefilter = CompactRFPDupeFilter.from_crawler(crawler)
+        dupefilter.open()
+        self.assertEqual(dupefilter.fingerprints.size, 8)
+        for i in range(2000):
+            dupefilter.request_seen(Request('http://scrapytest.org/%d' % i))
+        dupefilter.close('finished')
+        self.assertEqual(crawler.stats.get_value('dupefilter/fingerprints'), 2000)
+        self.assertEqual(crawler.stats.get_value('dupefilter/memory'),
+                         dupefilter.fingerprints.nbytes)
+
+    def test_scheduler_uses_from_crawler(self):
+        crawler = get_crawler(Spider, {
+            'DUPEFILTER_CLASS': 'scrapy.dupefilters.CompactRFPDupeFilter'})
+        scheduler = Scheduler.from_crawler(crawler)
+        self.assertIs(scheduler.df.stats, crawler.stats)
+
+
+class BloomDupeFilterTest(unittest.TestCase):
+
+    def test_filter(self):
+        dupefilter = BloomDupeFilter(capacity=100)
+        dupefilter.open()
+
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+        r3 = Request('http://scrapytest.org/2')
+
+        assert not dupefilter.request_seen(r1)
+        assert dupefilter.request_seen(r1)
+
+        assert not dupefilter.request_seen(r2)
+        assert dupefilter.request_seen(r3)
+
+        dupefilter.close('finished')
+
+    def test_dupefilter_path(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+
+        path = tempfile.mkdtemp()
+        try:
+            df = BloomDupeFilter(path, capacity=100)
+            df.open()
+            assert not df.request_seen(r1)
+            assert df.request_seen(r1)
+            df.close('finished')
+            assert os.path.isdir(os.path.join(path, 'requests.bloom'))
+
+            df2 = BloomDupeFilter(path, capacity=100)
+            df2.open()
+            assert df2.request_seen(r1)
+            assert not df2.request_seen(r2)
+            assert df2.request_seen(r2)
+            df2.close('finished')
+        finally:
+            shutil.rmtree(path)
+
+    def test_stats(self):
+        crawler = get_crawler(Spider, {'DUPEFILTER_BLOOM_CAPACITY': 100,
+                                       'DUPEFILTER_BLOOM_ERROR_RATE': 0.01})
+        dupefilter = BloomDupeFilter.from_crawler(crawler)
+        dupefilter.open()
+        for i in range(150):
+            dupefilter.request_seen(Request('http://scrapytest.org/%d' % i))
+        dupefilter.close('finished')
+        stats = crawler.stats
+        self.assertEqual(stats.get_value('dupefilter/memory'),
+                         dupefilter.fingerprints.nbytes)
+        self.assertGreater(stats.get_value('dupefilter/fingerprints'), 140)
+        self.assertLess(stats.get_value('dupefilter/false_positive_probability'), 0.01)
+
+
+class LSMDupeFilterTest(unittest.TestCase):
+
+    def test_filter(self):
+        dupefilter = LSMDupeFilter(buffer_size=2, background=False)
+        dupefilter.open()
+        tmpdir = dupefilter.tmpdir
+
+        requests = [Request('http://scrapytest.org/%d' % i) for i in range(10)]
+        for r in requests:
+            assert not dupefilter.request_seen(r)
+        for r in requests:
+            assert dupefilter.request_seen(r)
+        assert dupefilter.request_seen(Request('http://scrapytest.org/2'))
+
+        dupefilter.close('finished')
+        assert not os.path.exists(tmpdir)
+
+    def test_dupefilter_path(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+
+        path = tempfile.mkdtemp()
+        try:
+            df = LSMDupeFilter(path, background=False)
+            df.open()
+            assert not df.request_seen(r1)
+            assert df.request_seen(r1)
+            df.close('finished')
+            assert os.path.isdir(os.path.join(path, 'requests.lsm'))
+
+            df2 = LSMDupeFilter(path, background=False)
+            df2.open()
+            assert df2.request_seen(r1)
+            assert not df2.request_seen(r2)
+            assert df2.request_seen(r2)
+            df2.close('finished')
+        finally:
+            shutil.rmtree(path)
+
+    def test_stats(self):
+        crawler = get_crawler(Spider, {'DUPEFILTER_LSM_BUFFER_SIZE': 10,
+                                       'DUPEFILTER_DIGEST_SIZE': 8})
+        dupefilter = LSMDupeFilter.from_crawler(crawler)
+        dupefilter.fingerprints.background = False
+        dupefilter.open()
+        self.assertEqual(dupefilter.fingerprints.size, 16)
+        for i in range(25):
+            dupefilter.request_seen(Request('http://scrapytest.org/%d' % i))
+        stats = crawler.stats
+        self.assertEqual(stats.get_value('dupefilter/segments'), 2)
+        self.assertEqual(stats.get_value('dupefilter/fingerprints'), 20)
+        dupefilter.close('finished')
+        self.assertEqual(stats.get_value('dupefilter/fingerprints'), 25)
+        self.assertEqual(stats.get_value('dupefilter/segments'), 3)
+        self.assertGreater(stats.get_value('dupefilter/disk_usage'), 25 * 16)
+
+
+class RecrawlDupeFilterTest(unittest.TestCase):
+
+    def test_filter(self):
+        dupefilter = RecrawlDupeFilter(interval=60)
+        dupefilter.open()
+
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/1', meta={'recrawl_interval': 0})
+        assert not dupefilter.request_seen(r1)
+        # not fetched yet
+        assert dupefilter.request_seen(r1)
+        assert not dupefilter.request_seen(r2)
+        dupefilter.response_received(Response(r1.url), r1)
+        assert dupefilter.request_seen(r1)
+
+        fp = dupefilter.request_digest(r1, dupefilter.fingerprints.size)
+        dupefilter.fingerprints[fp] = time.time() - 61
+        assert not dupefilter.request_seen(r1)
+        assert dupefilter.request_seen(r1)
+        dupefilter.close('finished')
+
+    def test_domain_intervals(self):
+        dupefilter = RecrawlDupeFilter(
+            interval=60, domain_intervals={'example.com': 10, 'a.example.com': 5})
+        interval = lambda url, **kw: dupefilter.recrawl_interval(Request(url, **kw))
+        self.assertEqual(interval('http://example.com/'), 10)
+        self.assertEqual(interval('http://www.example.com/'), 10)
+        self.assertEqual(interval('http://a.example.com/'), 5)
+        self.assertEqual(interval('http://b.a.example.com/'), 5)
+        self.assertEqual(interval('http://notexample.com/'), 60)
+        self.assertEqual(interval('http://example.com/',
+                                  meta={'recrawl_interval': 1}), 1)
+
+    def test_dupefilter_path(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+
+        path = tempfile.mkdtemp()
+        try:
+            df = RecrawlDupeFilter(path, interval=60)
+            df.open()
+            assert not df.request_seen(r1)
+            assert not df.request_seen(r2)
+            df.response_received(Response(r1.url), r1)
+            df.response_received(Response(r2.url), r2)
+            fp = df.request_digest(r2, df.fingerprints.size)
+            df.fingerprints[fp] = time.time() - 100
+            df.close('finished')
+
+            df2 = RecrawlDupeFilter(path, interval=60)
+            df2.open()
+            assert df2.request_seen(r1)
+            assert not df2.request_seen(r2)
+            assert df2.request_seen(r2)
+            df2.close('finished')
+            # updates are appended while crawling, and compacted on close
+            size = os.path.getsize(os.path.join(path, 'requests.fetched'))
+            self.assertEqual(size, 2 * 24)
+        finally:
+            shutil.rmtree(path)
+
+    def test_failed_requests_not_recorded(self):
+        r1 = Request('http://scrapytest.org/1')
+        path = tempfile.mkdtemp()
+        try:
+            df = RecrawlDupeFilter(path, interval=60, ignore_http_codes=[503])
+            df.open()
+            assert not df.request_seen(r1)
+            # not fetched yet
+            assert df.request_seen(r1)
+            # download failed
+            df.request_left_downloader(r1)
+            assert not df.request_seen(r1)
+            df.request_left_downloader(r1)
+            df.response_received(Response(r1.url, status=503), r1)
+            assert not df.request_seen(r1)
+            self.assertEqual(len(df.pending), 1)
+            df.close('finished')
+
+            df2 = RecrawlDupeFilter(path, interval=60)
+            df2.open()
+            assert not df2.request_seen(r1)
+            df2.close('finished')
+        finally:
+            shutil.rmtree(path)
+
+    def test_dropped(self):
+        crawler = get_crawler(Spider)
+        df = RecrawlDupeFilter.from_crawler(crawler)
+        df.open()
+        r1 = Request('http://scrapytest.org/1')
+        assert not df.request_seen(r1)
+        # a duplicate dropped by the scheduler
+        r2 = r1.copy()
+        assert df.request_seen(r2)
+        crawler.signals.send_catch_log(signal=signals.request_dropped,
+                                       request=r2, spider=None)
+        assert df.request_seen(r1.copy())
+        # the request let through, dropped by the scheduler for another reason
+        crawler.signals.send_catch_log(signal=signals.request_dropped,
+                                       request=r1, spider=None)
+        self.assertEqual(len(df.pending), 0)
+        assert not df.request_seen(r1.copy())
+        df.close('finished')
+
+    def test_retry_http_codes_not_recorded(self):
+        crawler = get_crawler(Spider, {'RETRY_HTTP_CODES': [500]})
+        df = RecrawlDupeFilter.from_crawler(crawler)
+        df.open()
+        r1 = Request('http://scrapytest.org/1')
+        for status in (500, 404):
+            assert not df.request_seen(r1)
+            crawler.signals.send_catch_log(signal=signals.request_left_downloader,
+                                           request=r1, spider=None)
+            crawler.signals.send_catch_log(
+                signal=signals.response_received, request=r1,
+                response=Response(r1.url, status=status), spider=None)
+        assert df.request_seen(r1)
+        self.assertEqual(len(df.fingerprints), 1)
+        df.close('finished')
+
+    def test_stats(self):
+        crawler = get_crawler(Spider, {'DUPEFILTER_RECRAWL_INTERVAL': 0})
+        dupefilter = RecrawlDupeFilter.from_crawler(crawler)
+        dupefilter.open()
+        for i in range(3):
+            request = Request('http://scrapytest.org/1')
+            dupefilter.request_seen(request)
+        crawler.signals.send_catch_log(
+            signal=signals.response_received, request=request,
+            response=Response(request.url), spider=None)
+        dupefilter.close('finished')
+        stats = crawler.stats
+        self.assertEqual(stats.get_value('dupefilter/recrawled'), 2)
+        self.assertEqual(stats.get_value('dupefilter/fingerprints'), 1)
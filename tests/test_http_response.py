@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import pickle
+import tempfile
 import unittest
 
 import six
@@ -125,6 +127,26 @@ class BaseResponseTest(unittest.TestCase):
         self.assertRaises(AttributeError, setattr, r, 'url', 'http://example2.com')
         self.assertRaises(AttributeError, setattr, r, 'body', 'xxx')
 
+    def test_body_file(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'<html><body>spooled</body></html>')
+            r = self.response_class("http://example.com", body_file=f)
+            self.assertIs(r.body_file, f)
+            r2 = r.replace()
+            if isinstance(r, TextResponse):
+                # the encoding is detected from the body
+                self.assertIsNone(r2.body_file)
+            else:
+                self.assertIs(r2.body_file, f)
+            self.assertIsInstance(r.body, bytes)
+            self.assertEqual(r.body, b'<html><body>spooled</body></html>')
+            self.assertTrue(r.body.startswith(b'<html>'))
+            self.assertEqual(r2.body, r.body)
+            self.assertEqual(pickle.loads(pickle.dumps(r.body)), r.body)
+            r3 = r.replace(body=b'other')
+            self.assertIsNone(r3.body_file)
+            self.assertEqual(r3.body, b'other')
+
     def test_urljoin(self):
         """Test urljoin shortcut (only for existence, since behavior equals urljoin)"""
         joined = self.response_class('http://www.example.com').urljoin('/test')
@@ -0,0 +1,196 @@
+import shutil
+import tempfile
+import unittest
+from time import time
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from queuelib import PriorityQueue
+
+from scrapy.core.downloader import Slot
+from scrapy.core.scheduler import Scheduler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.http import Request
+from scrapy.pqueues import DownloaderAwarePriorityQueue, pop_lowest
+from scrapy.spiders import Spider
+from scrapy.squeues import FifoMemoryQueue, PickleFifoDiskQueue
+from scrapy.utils.test import get_crawler
+
+
+class FakeDownloader(object):
+
+    def __init__(self):
+        self.slots = {}
+
+    def _get_slot_key(self, request, spider):
+        return request.meta.get('download_slot', request.url.split('/')[2])
+
+
+class PopLowestTest(unittest.TestCase):
+
+    def test_priority_queue(self):
+        q = PriorityQueue(lambda priority: FifoMemoryQueue())
+        q.push('a', 0)
+        q.push('b', 1)
+        q.push('c', 1)
+        self.assertEqual(pop_lowest(q), 'b')
+        self.assertEqual(pop_lowest(q), 'c')
+        self.assertEqual(q.pop(), 'a')
+        self.assertIsNone(pop_lowest(q))
+        q.push('d', 2)
+        self.assertEqual(pop_lowest(q), 'd')
+        self.assertIsNone(q.pop())
+
+    def test_unsupported(self):
+        self.assertIsNone(pop_lowest(FifoMemoryQueue()))
+
+
+class DownloaderAwarePriorityQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.downloader = FakeDownloader()
+        self.q = DownloaderAwarePriorityQueue(
+            lambda priority, slot: FifoMemoryQueue(),
+            downloader=self.downloader, wakeup=lambda: None)
+
+    def tearDown(self):
+        self.q.close()
+
+    def test_push_pop(self):
+        r1 = Request('http://a.example/1')
+        r2 = Request('http://b.example/1')
+        self.q.push(r1, 0)
+        self.q.push(r2, -1)
+        self.assertEqual(len(self.q), 2)
+        self.assertIs(self.q.pop(), r2)
+        self.assertIs(self.q.pop(), r1)
+        self.assertIsNone(self.q.pop())
+        self.assertEqual(len(self.q), 0)
+
+    def test_busy_slot_is_skipped(self):
+        busy = Slot(concurrency=1, delay=0, randomize_delay=False)
+        busy.active.add(Request('http://a.example/0'))
+        self.downloader.slots['a.example'] = busy
+        r1 = Request('http://a.example/1')
+        r2 = Request('http://b.example/1')
+        self.q.push(r1, -10)
+        self.q.push(r2, 0)
+        self.assertIs(self.q.pop(), r2)
+        self.assertIsNone(self.q.pop())
+        busy.active.clear()
+        # busy slots are only checked again once a request leaves them
+        self.assertIsNone(self.q.pop())
+        left = Request('http://a.example/0', meta={'download_slot': 'a.example'})
+        self.q.request_left_downloader(left, None)
+        self.assertIs(self.q.pop(), r1)
+
+    def test_busy_slots_are_not_scanned(self):
+        lookups = []
+
+        class Slots(dict):
+            def get(self, key, default=None):
+                lookups.append(key)
+                return dict.get(self, key, default)
+
+        self.downloader.slots = Slots()
+        for i in range(100):
+            busy = Slot(concurrency=1, delay=0, randomize_delay=False)
+            busy.active.add(Request('http://%d.example/0' % i))
+            self.downloader.slots['%d.example' % i] = busy
+            self.q.push(Request('http://%d.example/1' % i))
+        self.assertIsNone(self.q.pop())
+        del lookups[:]
+        self.q.push(Request('http://free.example/1'))
+        for _ in range(10):
+            self.q.pop()
+        self.assertLessEqual(len(lookups), 2)
+
+    def test_delayed_slot_is_skipped(self):
+        delayed = Slot(concurrency=8, delay=60, randomize_delay=False)
+        delayed.lastseen = time()
+        self.downloader.slots['a.example'] = delayed
+        self.q.push(Request('http://a.example/1'))
+        self.assertIsNone(self.q.pop())
+        self.assertEqual(len(self.q), 1)
+        self.assertTrue(self.q._wakeupcall.active())
+        with mock.patch('scrapy.pqueues.time', return_value=time() + 61):
+            self.assertIsNotNone(self.q.pop())
+
+    def test_least_active_slot_wins_ties(self):
+        slot = Slot(concurrency=8, delay=0, randomize_delay=False)
+        slot.active.add(Request('http://a.example/0'))
+        self.downloader.slots['a.example'] = slot
+        r1 = Request('http://a.example/1')
+        r2 = Request('http://b.example/1')
+        self.q.push(r1)
+        self.q.push(r2)
+        self.assertIs(self.q.pop(), r2)
+        self.assertIs(self.q.pop(), r1)
+
+    def test_download_slot_meta(self):
+        r1 = Request('http://a.example/1', meta={'download_slot': 'custom'})
+        self.q.push(r1)
+        self.assertEqual(list(self.q.pqueues), ['custom'])
+
+    def test_pop_lowest(self):
+        r1 = Request('http://a.example/1')
+        r2 = Request('http://b.example/1')
+        r3 = Request('http://a.example/2')
+        self.q.push(r1, 0)
+        self.q.push(r2, 2)
+        self.q.push(r3, 1)
+        self.assertIs(pop_lowest(self.q), r2)
+        self.assertEqual(list(self.q.pqueues), ['a.example'])
+        self.assertIs(pop_lowest(self.q), r3)
+        self.assertEqual(len(self.q), 1)
+        self.assertIs(self.q.pop(), r1)
+        self.assertIsNone(pop_lowest(self.q))
+
+    def test_close_returns_active_prios_per_slot(self):
+        self.q.push(Request('http://a.example/1'), 1)
+        self.q.push(Request('http://a.example/2'), 2)
+        self.q.push(Request('http://b.example/1'), 3)
+        active = self.q.close()
+        self.assertEqual(sorted(active['a.example']), [1, 2])
+        self.assertEqual(active['b.example'], [3])
+
+    def test_resume_different_pqclass(self):
+        self.assertRaises(ValueError, DownloaderAwarePriorityQueue,
+                          lambda priority, slot: FifoMemoryQueue(), [0, 1])
+
+
+class SchedulerDiskQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobdir = tempfile.mkdtemp()
+        self.spider = Spider('foo')
+
+    def tearDown(self):
+        shutil.rmtree(self.jobdir)
+
+    def _scheduler(self):
+        scheduler = Scheduler(BaseDupeFilter(), jobdir=self.jobdir,
+                              dqclass=PickleFifoDiskQueue,
+                              mqclass=FifoMemoryQueue,
+                              stats=get_crawler(Spider).stats,
+                              pqclass=DownloaderAwarePriorityQueue)
+        scheduler.open(self.spider)
+        return scheduler
+
+    def test_resume(self):
+        scheduler = self._scheduler()
+        urls = ['http://a.example/1', 'http://b.example/1',
+                'http://a.example/2']
+        for url in urls:
+            scheduler.enqueue_request(Request(url))
+        scheduler.close('finished')
+
+        scheduler = self._scheduler()
+        self.assertEqual(len(scheduler), 3)
+        popped = set()
+        while scheduler.has_pending_requests():
+            popped.add(scheduler.next_request().url)
+        self.assertEqual(popped, set(urls))
+        scheduler.close('finished')
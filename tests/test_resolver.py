@@ -0,0 +1,205 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from twisted.internet import defer, reactor
+from twisted.internet.error import DNSLookupError
+from twisted.names import common, dns, server
+from twisted.trial import unittest
+
+from scrapy.resolver import CachingDNSResolver
+
+
+class StubResolver(common.ResolverBase):
+    """Answer queries from a dict of names to A records (an address and
+    a TTL), CNAME records (a name) or exceptions"""
+
+    def __init__(self, records):
+        common.ResolverBase.__init__(self)
+        self.records = records
+        self.queries = []
+        self.paused = None
+
+    def _lookup(self, name, cls, type, timeout):
+        self.queries.append(name)
+        answers = []
+        while True:
+            record = self.records.get(name)
+            if isinstance(record, Exception):
+                return defer.fail(record)
+            elif isinstance(record, tuple):
+                answers.append(dns.RRHeader(name, dns.A, ttl=record[1],
+                    payload=dns.Record_A(record[0], ttl=record[1])))
+                break
+            elif record is not None:
+                answers.append(dns.RRHeader(name, dns.CNAME, ttl=30,
+                    payload=dns.Record_CNAME(record, ttl=30)))
+                name = record
+            else:
+                break
+        if self.paused is not None:
+            d = defer.Deferred()
+            self.paused.append((d, (answers, [], [])))
+            return d
+        return defer.succeed((answers, [], []))
+
+
+class CachingDNSResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubResolver({
+            b'example.com': ('10.0.0.1', 300),
+            b'example.org': ('10.0.0.2', 300),
+            b'www.example.com': b'example.com',
+            b'nxdomain.example': dns.DomainError(),
+            b'servfail.example': ValueError(),
+        })
+        factory = server.DNSServerFactory(clients=[self.stub])
+        self.port = reactor.listenUDP(0, dns.DNSDatagramProtocol(factory),
+                                      interface='127.0.0.1')
+        self.resolver = self.get_resolver()
+        self.now = 1000.0
+        patcher = mock.patch('scrapy.resolver.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    def get_resolver(self, **kwargs):
+        servers = [('127.0.0.1', self.port.getHost().port)]
+        kwargs.setdefault('hosts', None)
+        return CachingDNSResolver(reactor, 100, 5, servers=servers,
+                                  resolv=None, **kwargs)
+
+    @defer.inlineCallbacks
+    def test_resolve(self):
+        address = yield self.resolver.getHostByName('example.com')
+        self.assertEqual(address, '10.0.0.1')
+        address = yield self.resolver.getHostByName('example.com')
+        self.assertEqual(address, '10.0.0.1')
+        self.assertEqual(self.stub.queries, [b'example.com'])
+
+    @defer.inlineCallbacks
+    def test_ttl(self):
+        yield self.resolver.getHostByName('example.com')
+        self.now += 299
+        yield self.resolver.getHostByName('example.com')
+        self.assertEqual(len(self.stub.queries), 1)
+        self.now += 2
+        yield self.resolver.getHostByName('example.com')
+        self.assertEqual(len(self.stub.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_cname(self):
+        address = yield self.resolver.getHostByName('www.example.com')
+        self.assertEqual(address, '10.0.0.1')
+        # cached for the lowest TTL in the chain
+        self.now += 31
+        yield self.resolver.getHostByName('www.example.com')
+        self.assertEqual(len(self.stub.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_nxdomain(self):
+        for _ in range(2):
+            yield self.assertFailure(
+                self.resolver.getHostByName('nxdomain.example'),
+                DNSLookupError)
+        self.assertEqual(self.stub.queries, [b'nxdomain.example'])
+        self.now += 61
+        yield self.assertFailure(
+            self.resolver.getHostByName('nxdomain.example'), DNSLookupError)
+        self.assertEqual(len(self.stub.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_servfail(self):
+        resolver = self.get_resolver(negative_ttl=10)
+        for _ in range(2):
+            yield self.assertFailure(
+                resolver.getHostByName('servfail.example'), DNSLookupError)
+        self.assertEqual(self.stub.queries, [b'servfail.example'])
+        self.now += 11
+        yield self.assertFailure(
+            resolver.getHostByName('servfail.example'), DNSLookupError)
+        self.assertEqual(len(self.stub.queries), 2)
+        self.flushLoggedErrors(ValueError)
+
+    @defer.inlineCallbacks
+    def test_unexpected_error(self):
+        with mock.patch.object(self.resolver, '_get_address',
+                               side_effect=ValueError):
+            for _ in range(2):
+                lookups = [self.resolver.getHostByName('example.com')
+                           for _ in range(2)]
+                for d in lookups:
+                    yield self.assertFailure(d, DNSLookupError)
+        # not cached
+        self.assertEqual(len(self.stub.queries), 2)
+        self.assertEqual(self.resolver._pending, {})
+        address = yield self.resolver.getHostByName('example.com')
+        self.assertEqual(address, '10.0.0.1')
+
+    @defer.inlineCallbacks
+    def test_no_cache(self):
+        resolver = CachingDNSResolver(
+            reactor, 0, 5, servers=[('127.0.0.1', self.port.getHost().port)],
+            resolv=None, hosts=None)
+        yield resolver.getHostByName('example.com')
+        yield resolver.getHostByName('example.com')
+        self.assertEqual(len(self.stub.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_coalesce(self):
+        addresses = yield defer.gatherResults([
+            self.resolver.getHostByName('example.com') for _ in range(3)])
+        self.assertEqual(addresses, ['10.0.0.1'] * 3)
+        self.assertEqual(self.stub.queries, [b'example.com'])
+
+    @defer.inlineCallbacks
+    def test_concurrency(self):
+        self.stub.paused = []
+        resolver = self.get_resolver(concurrency=1)
+        d = defer.gatherResults([resolver.getHostByName('example.com'),
+                                 resolver.getHostByName('example.org')])
+        while not self.stub.paused:
+            yield deferLater(0.01)
+        yield deferLater(0.1)
+        self.assertEqual(self.stub.queries, [b'example.com'])
+        d2, answer = self.stub.paused.pop()
+        d2.callback(answer)
+        while not self.stub.paused:
+            yield deferLater(0.01)
+        d2, answer = self.stub.paused.pop()
+        d2.callback(answer)
+        addresses = yield d
+        self.assertEqual(addresses, ['10.0.0.1', '10.0.0.2'])
+
+    @defer.inlineCallbacks
+    def test_hosts_file(self):
+        hosts = self.mktemp()
+        with open(hosts, 'w') as f:
+            f.write("# comment\n::1 myhost\n10.1.1.1 myhost other\n")
+        resolver = self.get_resolver(hosts=hosts)
+        address = yield resolver.getHostByName('myhost')
+        self.assertEqual(address, '10.1.1.1')
+        address = yield resolver.getHostByName('example.com')
+        self.assertEqual(address, '10.0.0.1')
+        self.assertEqual(self.stub.queries, [b'example.com'])
+
+    @defer.inlineCallbacks
+    def test_ip_address(self):
+        address = yield self.resolver.getHostByName('127.0.0.1')
+        self.assertEqual(address, '127.0.0.1')
+        self.assertEqual(self.stub.queries, [])
+
+    def test_retry_timeouts(self):
+        self.assertEqual(CachingDNSResolver._retry_timeouts(60), (1, 3, 11, 45))
+        self.assertEqual(CachingDNSResolver._retry_timeouts(5), (1, 3, 1))
+        self.assertEqual(CachingDNSResolver._retry_timeouts(0.5), (0.5,))
+
+
+def deferLater(delay):
+    d = defer.Deferred()
+    reactor.callLater(delay, d.callback, None)
+    return d
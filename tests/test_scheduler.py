@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from queuelib import PriorityQueue
+
+from scrapy.core.scheduler import Scheduler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.http import Request
+from scrapy.spiders import Spider
+from scrapy.squeues import LifoMemoryQueue, PickleLifoDiskQueue, \
+    PickleLifoSegmentedDiskQueue
+from scrapy.utils.test import get_crawler
+
+
+class MemoryLimitSchedulerTest(unittest.TestCase):
+
+    mqlimit = 4
+
+    def setUp(self):
+        self.crawler = get_crawler(Spider)
+        self.spider = self.crawler._create_spider('foo')
+        self.scheduler = Scheduler(BaseDupeFilter(),
+                                   dqclass=PickleLifoDiskQueue,
+                                   mqclass=LifoMemoryQueue,
+                                   pqclass=PriorityQueue,
+                                   stats=self.crawler.stats,
+                                   mqlimit=self.mqlimit)
+        self.scheduler.open(self.spider)
+
+    def tearDown(self):
+        if self.scheduler.dqs is not None:
+            self.scheduler.close('finished')
+
+    def test_spill_and_refill(self):
+        urls = ['http://example.com/%d' % i for i in range(10)]
+        for url in urls:
+            self.scheduler.enqueue_request(Request(url))
+        self.assertEqual(len(self.scheduler), 10)
+        self.assertEqual(len(self.scheduler.mqs), self.mqlimit)
+        self.assertEqual(len(self.scheduler.dqs), 6)
+        self.assertEqual(self.crawler.stats.get_value('scheduler/enqueued/disk'), 6)
+
+        popped = []
+        while self.scheduler.has_pending_requests():
+            popped.append(self.scheduler.next_request().url)
+            self.assertLessEqual(len(self.scheduler.mqs), self.mqlimit)
+        self.assertEqual(sorted(popped), sorted(urls))
+
+    def test_spill_lowest_priority(self):
+        for i in range(self.mqlimit):
+            self.scheduler.enqueue_request(
+                Request('http://example.com/%d' % i, priority=i))
+        self.scheduler.enqueue_request(
+            Request('http://example.com/low', priority=-1))
+        self.scheduler.enqueue_request(
+            Request('http://example.com/high', priority=10))
+        self.assertEqual(len(self.scheduler.mqs), self.mqlimit)
+        self.assertEqual(len(self.scheduler.dqs), 2)
+        # still ahead of the spilled requests
+        self.scheduler.enqueue_request(
+            Request('http://example.com/mid', priority=1))
+        popped = []
+        while self.scheduler.has_pending_requests():
+            popped.append(self.scheduler.next_request().url)
+        self.assertEqual(popped, ['http://example.com/high',
+                                  'http://example.com/3',
+                                  'http://example.com/2',
+                                  'http://example.com/mid',
+                                  'http://example.com/1',
+                                  'http://example.com/0',
+                                  'http://example.com/low'])
+
+    def test_stats_add_up(self):
+        for i in range(10):
+            self.scheduler.enqueue_request(
+                Request('http://example.com/%d' % i, priority=i % 3))
+        for _ in range(5):
+            self.scheduler.next_request()
+        stats = self.crawler.stats
+        get = lambda key: stats.get_value('scheduler/' + key, 0)
+        self.assertEqual(get('enqueued/memory') + get('moved/memory')
+                         - get('moved/disk') - get('dequeued/memory'),
+                         len(self.scheduler.mqs))
+        self.assertEqual(get('enqueued/disk') + get('moved/disk')
+                         - get('moved/memory') - get('dequeued/disk'),
+                         len(self.scheduler.dqs))
+        self.assertGreater(get('moved/disk'), 0)
+        self.assertGreater(get('moved/memory'), 0)
+
+    def test_refill_in_batches(self):
+        for i in range(10):
+            self.scheduler.enqueue_request(Request('http://example.com/%d' % i))
+        self.scheduler.next_request()
+        self.assertEqual(len(self.scheduler.mqs), 3)
+        self.scheduler.next_request()
+        # memory queue was half empty: refilled up to the limit
+        self.assertEqual(len(self.scheduler.mqs), self.mqlimit)
+        self.assertEqual(len(self.scheduler.dqs), 4)
+
+    def test_spill_directory_removed_on_close(self):
+        spilldir = self.scheduler.spilldir
+        self.assertTrue(os.path.isdir(spilldir))
+        for i in range(10):
+            self.scheduler.enqueue_request(Request('http://example.com/%d' % i))
+        self.scheduler.close('finished')
+        self.scheduler.dqs = None
+        self.assertFalse(os.path.exists(spilldir))
+
+    def test_spill_directory_removed_on_close_when_drained(self):
+        spilldir = self.scheduler.spilldir
+        for i in range(10):
+            self.scheduler.enqueue_request(Request('http://example.com/%d' % i))
+        while self.scheduler.has_pending_requests():
+            self.scheduler.next_request()
+        self.scheduler.close('finished')
+        self.scheduler.dqs = None
+        self.assertFalse(os.path.exists(spilldir))
+
+    def test_unserializable_request_stays_in_memory(self):
+        for i in range(self.mqlimit):
+            self.scheduler.enqueue_request(Request('http://example.com/%d' % i))
+        self.scheduler.enqueue_request(
+            Request('http://example.com/lambda', callback=lambda r: None))
+        self.assertEqual(len(self.scheduler.mqs), self.mqlimit + 1)
+        self.assertEqual(len(self.scheduler.dqs), 0)
+
+
+class NoMemoryLimitSchedulerTest(unittest.TestCase):
+
+    def test_no_spill_by_default(self):
+        crawler = get_crawler(Spider)
+        scheduler = Scheduler.from_crawler(crawler)
+        scheduler.open(crawler._create_spider('foo'))
+        for i in range(10):
+            scheduler.enqueue_request(Request('http://example.com/%d' % i))
+        self.assertIsNone(scheduler.dqs)
+        self.assertEqual(len(scheduler.mqs), 10)
+        scheduler.close('finished')
+
+
+class SegmentedDiskQueueSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.jobdir)
+
+    def _scheduler(self):
+        crawler = get_crawler(Spider, {
+            'JOBDIR': self.jobdir,
+            'SCHEDULER_DISK_QUEUE': 'scrapy.squeues.PickleLifoSegmentedDiskQueue',
+        })
+        scheduler = Scheduler.from_crawler(crawler)
+        scheduler.open(crawler._create_spider('foo'))
+        return scheduler
+
+    def test_single_queue_directory(self):
+        scheduler = self._scheduler()
+        for i in range(10):
+            scheduler.enqueue_request(Request('http://example.com/%d' % i,
+                                              priority=i % 4))
+        self.assertIsInstance(scheduler.dqs, PickleLifoSegmentedDiskQueue)
+        scheduler.close('finished')
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.jobdir, 'requests.queue'))),
+            ['active.json', 'index', 'q00000'])
+
+        scheduler = self._scheduler()
+        self.assertEqual(len(scheduler), 10)
+        priorities = [scheduler.next_request().priority for _ in range(10)]
+        self.assertEqual(priorities, sorted(priorities, reverse=True))
+        self.assertFalse(scheduler.has_pending_requests())
+        scheduler.close('finished')
+
+        # the drained queue is not resumed again
+        scheduler = self._scheduler()
+        self.assertFalse(scheduler.has_pending_requests())
+        self.assertIsNone(scheduler.next_request())
+        scheduler.close('finished')
@@ -1,7 +1,14 @@
+import os
 import pickle
+import shutil
+import tempfile
+import unittest
 
 from queuelib.tests import test_queue as t
-from scrapy.squeues import MarshalFifoDiskQueue, MarshalLifoDiskQueue, PickleFifoDiskQueue, PickleLifoDiskQueue
+from scrapy.squeues import MarshalFifoDiskQueue, MarshalLifoDiskQueue, PickleFifoDiskQueue, PickleLifoDiskQueue, \
+    CompactFifoDiskQueue, CompactLifoDiskQueue, SegmentedDiskPriorityQueue, \
+    LifoSegmentedDiskPriorityQueue, PickleLifoSegmentedDiskQueue, CompactFifoSegmentedDiskQueue
+from scrapy.utils.reqser import request_to_dict
 from scrapy.item import Item, Field
 from scrapy.http import Request
 from scrapy.loader import ItemLoader
@@ -113,6 +120,26 @@ class ChunkSize4PickleFifoDiskQueueTest(PickleFifoDiskQueueTest):
     chunksize = 4
 
 
+class CompactFifoDiskQueueTest(MarshalFifoDiskQueueTest):
+
+    chunksize = 100000
+
+    def queue(self):
+        return CompactFifoDiskQueue(self.qpath, chunksize=self.chunksize)
+
+    def test_serialize_request(self):
+        q = self.queue()
+        d = request_to_dict(Request('http://www.example.com', meta={'a': 1}))
+        q.push(d)
+        self.assertEqual(q.pop(), d)
+
+class ChunkSize1CompactFifoDiskQueueTest(CompactFifoDiskQueueTest):
+    chunksize = 1
+
+class ChunkSize2CompactFifoDiskQueueTest(CompactFifoDiskQueueTest):
+    chunksize = 2
+
+
 class MarshalLifoDiskQueueTest(t.LifoDiskQueueTest):
 
     def queue(self):
@@ -161,3 +188,174 @@ class PickleLifoDiskQueueTest(MarshalLifoDiskQueueTest):
         assert isinstance(r2, Request)
         self.assertEqual(r.url, r2.url)
         assert r2.meta['request'] is r2
+
+
+class CompactLifoDiskQueueTest(MarshalLifoDiskQueueTest):
+
+    def queue(self):
+        return CompactLifoDiskQueue(self.qpath)
+
+    def test_serialize_request(self):
+        q = self.queue()
+        d1 = request_to_dict(Request('http://www.example.com/1'))
+        d2 = request_to_dict(Request('http://www.example.com/2'))
+        q.push(d1)
+        q.push(d2)
+        self.assertEqual(q.pop(), d2)
+        self.assertEqual(q.pop(), d1)
+
+
+class SegmentedDiskPriorityQueueTest(unittest.TestCase):
+
+    chunksize = 3
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.qpath = os.path.join(self.tmpdir, 'queue')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def queue(self):
+        return SegmentedDiskPriorityQueue(self.qpath, chunksize=self.chunksize)
+
+    def test_empty(self):
+        q = self.queue()
+        self.assertIsNone(q.pop())
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.close(), [])
+
+    def test_push_pop_priorities(self):
+        q = self.queue()
+        q.push(b'a', 3)
+        q.push(b'b', -1)
+        q.push(b'c', 3)
+        q.push(b'd', 0)
+        q.push(b'e', -1)
+        self.assertEqual(len(q), 5)
+        self.assertEqual([q.pop() for _ in range(5)],
+                         [b'b', b'e', b'd', b'a', b'c'])
+        self.assertIsNone(q.pop())
+        self.assertEqual(len(q), 0)
+        q.close()
+
+    def test_push_non_bytes(self):
+        q = self.queue()
+        self.assertRaises(TypeError, q.push, u'text')
+        q.close()
+
+    def test_consumed_segments_removed(self):
+        q = self.queue()
+        for i in range(10):
+            q.push(str(i).encode())
+        self.assertEqual(len(os.listdir(self.qpath)), 4)
+        for _ in range(6):
+            q.pop()
+        self.assertLess(len(os.listdir(self.qpath)), 4)
+        while q.pop():
+            pass
+        q.close()
+        self.assertEqual(os.listdir(self.qpath), [])
+
+    def test_resume(self):
+        q = self.queue()
+        for i in range(10):
+            q.push(str(i).encode(), -(i % 3))
+        self.assertEqual(q.pop(), b'8' if q.lifo else b'2')
+        self.assertEqual(q.close(), [-2, -1, 0])
+        self.assertTrue(os.path.exists(os.path.join(self.qpath, 'index')))
+
+        q = self.queue()
+        self.assertEqual(len(q), 9)
+        q.push(b'new', -2)
+        popped = [q.pop() for _ in range(10)]
+        expected = [b'5', b'8', b'new', b'1', b'4', b'7', b'0', b'3', b'6', b'9']
+        if q.lifo:
+            expected = [b'new', b'5', b'2', b'7', b'4', b'1', b'9', b'6', b'3', b'0']
+        self.assertEqual(popped, expected)
+        q.close()
+        self.assertEqual(os.listdir(self.qpath), [])
+
+
+    def test_resume_drained(self):
+        q = self.queue()
+        for i in range(5):
+            q.push(str(i).encode())
+        q.close()
+        q = self.queue()
+        self.assertEqual(len(q), 5)
+        while q.pop():
+            pass
+        q.close()
+        q = self.queue()
+        self.assertEqual(len(q), 0)
+        self.assertIsNone(q.pop())
+        q.close()
+
+    def test_unclean_shutdown_after_resume(self):
+        q = self.queue()
+        for i in range(5):
+            q.push(str(i).encode())
+        q.close()
+        q = self.queue()
+        q.pop()
+        # not closed: the segments can't be trusted anymore
+        q = self.queue()
+        self.assertEqual(len(q), 0)
+        self.assertIsNone(q.pop())
+        q.close()
+
+    def test_sparse_segments_compacted_on_close(self):
+        q = self.queue()
+        for i in range(9):
+            q.push(str(i).encode(), 1 if i % 3 == 2 else 0)
+        for _ in range(6):
+            q.pop()
+        self.assertEqual(sorted(os.listdir(self.qpath)),
+                         ['q00000', 'q00001', 'q00002'])
+        q.close()
+        self.assertEqual(sorted(os.listdir(self.qpath)),
+                         ['index', 'q00002', 'q00003'])
+        q = self.queue()
+        popped = [q.pop() for _ in range(3)]
+        self.assertEqual(popped, [b'8', b'5', b'2'] if q.lifo else
+                         [b'2', b'5', b'8'])
+        self.assertIsNone(q.pop())
+        q.close()
+
+
+class LifoSegmentedDiskPriorityQueueTest(SegmentedDiskPriorityQueueTest):
+
+    def queue(self):
+        return LifoSegmentedDiskPriorityQueue(self.qpath, chunksize=self.chunksize)
+
+    def test_push_pop_priorities(self):
+        q = self.queue()
+        q.push(b'a', 3)
+        q.push(b'b', -1)
+        q.push(b'c', 3)
+        q.push(b'd', 0)
+        q.push(b'e', -1)
+        self.assertEqual([q.pop() for _ in range(5)],
+                         [b'e', b'b', b'd', b'c', b'a'])
+        q.close()
+
+
+class SerializableSegmentedDiskQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_serialize(self):
+        for qclass in (PickleLifoSegmentedDiskQueue, CompactFifoSegmentedDiskQueue):
+            q = qclass(os.path.join(self.tmpdir, qclass.__name__))
+            q.push({'a': 'dict'}, 1)
+            q.push(123, 0)
+            self.assertEqual(q.pop(), 123)
+            self.assertEqual(q.pop(), {'a': 'dict'})
+            self.assertRaises(ValueError, q.push, lambda x: x)
+            self.assertEqual(len(q), 0)
+            q.close()
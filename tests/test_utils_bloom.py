@@ -0,0 +1,92 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from scrapy.utils.bloom import BloomFilter, ScalableBloomFilter
+
+
+def _keys(start, stop):
+    return [hashlib.sha1(str(i).encode()).digest() for i in range(start, stop)]
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_add_contains(self):
+        bf = BloomFilter(1000, 0.01)
+        keys = _keys(0, 1000)
+        for key in keys:
+            bf.add(key)
+        for key in keys:
+            self.assertIn(key, bf)
+        false_positives = sum(1 for key in _keys(1000, 11000) if key in bf)
+        self.assertLess(false_positives, 10000 * 0.02)
+        self.assertAlmostEqual(bf.false_positive_probability(), 0.01, delta=0.005)
+        bf.close()
+
+    def test_sizing(self):
+        bf = BloomFilter(1000000, 0.001)
+        self.assertEqual(bf.nhashes, 10)
+        self.assertEqual(bf.nbits, 14377592)
+        self.assertEqual(bf.nbytes, bf.header_size + bf.nbits // 8)
+        bf.close()
+
+    def test_persistence(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'filter')
+            bf = BloomFilter(100, 0.01, path)
+            for key in _keys(0, 50):
+                bf.add(key)
+            bf.close()
+
+            bf = BloomFilter(None, None, path)
+            self.assertEqual(len(bf), 50)
+            self.assertEqual(bf.capacity, 100)
+            for key in _keys(0, 50):
+                self.assertIn(key, bf)
+            bf.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_invalid_file(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'\0' * 100)
+            f.flush()
+            self.assertRaises(ValueError, BloomFilter, None, None, f.name)
+
+
+class ScalableBloomFilterTest(unittest.TestCase):
+
+    def test_growth(self):
+        sbf = ScalableBloomFilter(100, 0.01)
+        keys = _keys(0, 1000)
+        added = sum(1 for key in keys if sbf.add(key))
+        self.assertGreater(added, 975)  # some false positives are expected
+        self.assertEqual(len(sbf.stages), 4)  # 100 + 200 + 400 + 800
+        for key in keys:
+            self.assertIn(key, sbf)
+            self.assertFalse(sbf.add(key))
+        self.assertLess(sbf.false_positive_probability(), 0.01)
+        false_positives = sum(1 for key in _keys(1000, 11000) if key in sbf)
+        self.assertLess(false_positives, 10000 * 0.02)
+        sbf.close()
+
+    def test_persistence(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            sbf = ScalableBloomFilter(100, 0.01, tmpdir)
+            for key in _keys(0, 350):
+                sbf.add(key)
+            sbf.close()
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             ['b00000', 'b00001', 'b00002'])
+
+            sbf = ScalableBloomFilter(100, 0.01, tmpdir)
+            self.assertEqual(len(sbf.stages), 3)
+            for key in _keys(0, 350):
+                self.assertIn(key, sbf)
+            sbf.close()
+        finally:
+            shutil.rmtree(tmpdir)
@@ -1,8 +1,10 @@
 import copy
+import hashlib
 import unittest
 from collections import Mapping, MutableMapping
 
-from scrapy.utils.datatypes import CaselessDict, SequenceExclude
+from scrapy.utils.datatypes import CaselessDict, SequenceExclude, \
+    FingerprintSet, FingerprintTimestamps, LocalCache, LRUCache
 
 __doctests__ = ['scrapy.utils.datatypes']
 
@@ -235,6 +237,121 @@ class SequenceExcludeTest(unittest.TestCase):
         for v in [-3, "test", 1.1]:
             self.assertNotIn(v, d)
 
+
+class LocalCacheTest(unittest.TestCase):
+
+    def test_expiration(self):
+        cache = LocalCache(limit=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'], 1)
+        cache['c'] = 3
+        self.assertEqual(list(cache), ['b', 'c'])
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_expiration(self):
+        cache = LRUCache(limit=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'], 1)
+        cache['c'] = 3
+        self.assertEqual(list(cache), ['a', 'c'])
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+
+class FingerprintSetTest(unittest.TestCase):
+
+    def test_add_contains(self):
+        fps = FingerprintSet(20)
+        keys = [hashlib.sha1(str(i).encode()).digest() for i in range(3000)]
+        for key in keys:
+            self.assertNotIn(key, fps)
+            self.assertTrue(fps.add(key))
+        for key in keys:
+            self.assertIn(key, fps)
+            self.assertFalse(fps.add(key))
+        self.assertEqual(len(fps), 3000)
+        self.assertGreaterEqual(fps.nbytes, 3000 * 20)
+
+    def test_empty_key(self):
+        fps = FingerprintSet(8)
+        self.assertNotIn(b'\0' * 8, fps)
+        self.assertTrue(fps.add(b'\0' * 8))
+        self.assertFalse(fps.add(b'\0' * 8))
+        self.assertIn(b'\0' * 8, fps)
+        self.assertEqual(len(fps), 1)
+
+    def test_update(self):
+        fps = FingerprintSet(2)
+        fps.update([b'ab', b'cd', b'ab'])
+        self.assertEqual(len(fps), 2)
+
+    def test_iter(self):
+        keys = set([b'ab', b'cd', b'\0\0'])
+        fps = FingerprintSet(2)
+        fps.update(keys)
+        self.assertEqual(set(fps), keys)
+
+    def test_discard(self):
+        fps = FingerprintSet(20, capacity=8)
+        keys = [hashlib.sha1(str(i).encode()).digest() for i in range(3000)]
+        fps.update(keys)
+        fps.add(b'\0' * 20)
+        self.assertTrue(fps.discard(b'\0' * 20))
+        self.assertFalse(fps.discard(b'\0' * 20))
+        for key in keys[::2]:
+            self.assertTrue(fps.discard(key))
+            self.assertFalse(fps.discard(key))
+        self.assertEqual(len(fps), 1500)
+        for i, key in enumerate(keys):
+            self.assertEqual(key in fps, bool(i % 2))
+        self.assertEqual(set(fps), set(keys[1::2]))
+
+    def test_wrong_size(self):
+        fps = FingerprintSet(8)
+        self.assertRaises(ValueError, fps.add, b'short')
+        self.assertRaises(ValueError, fps.__contains__, b'much too long key')
+
+
+class FingerprintTimestampsTest(unittest.TestCase):
+
+    def test_get_set(self):
+        fpt = FingerprintTimestamps(20)
+        keys = [hashlib.sha1(str(i).encode()).digest() for i in range(3000)]
+        for i, key in enumerate(keys):
+            self.assertIsNone(fpt.get(key))
+            fpt[key] = 1500000000 + i
+        for i, key in enumerate(keys):
+            self.assertEqual(fpt[key], 1500000000 + i)
+        fpt[keys[0]] = 1600000000.9
+        self.assertEqual(fpt[keys[0]], 1600000000)
+        self.assertEqual(len(fpt), 3000)
+        self.assertEqual(dict(fpt.items())[keys[1]], 1500000001)
+        self.assertRaises(KeyError, fpt.__getitem__, b'x' * 20)
+
+    def test_discard(self):
+        fpt = FingerprintTimestamps(20, capacity=8)
+        keys = [hashlib.sha1(str(i).encode()).digest() for i in range(1000)]
+        for i, key in enumerate(keys):
+            fpt[key] = i + 1
+        for key in keys[:500]:
+            fpt.discard(key)
+        self.assertEqual(dict(fpt.items()),
+                         dict((key, i + 1) for i, key in enumerate(keys)
+                              if i >= 500))
+
+    def test_empty_key(self):
+        fpt = FingerprintTimestamps(8)
+        self.assertRaises(KeyError, fpt.__getitem__, b'\0' * 8)
+        fpt[b'\0' * 8] = 10
+        self.assertEqual(fpt[b'\0' * 8], 10)
+        self.assertEqual(list(fpt.items()), [(b'\0' * 8, 10)])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,111 @@
+import unittest
+import zlib
+from gzip import GzipFile
+from io import BytesIO
+
+from scrapy.utils.decompression import Decompressor, \
+    DecompressionMaxSizeExceeded
+
+DATA = b''.join(b'line ' + str(i).encode('ascii') + b'\n'
+                for i in range(10000))
+
+
+def gzip(data):
+    f = BytesIO()
+    with GzipFile(fileobj=f, mode='wb') as gz_file:
+        gz_file.write(data)
+    return f.getvalue()
+
+
+def raw_deflate(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decode(decompressor, data, chunk_size=100):
+    chunks = [decompressor.decompress(data[i:i + chunk_size])
+              for i in range(0, len(data), chunk_size)]
+    return b''.join(chunks) + decompressor.flush()
+
+
+class DecompressorTest(unittest.TestCase):
+
+    def test_gzip(self):
+        decompressor = Decompressor.for_encoding(b'gzip')
+        self.assertEqual(decode(decompressor, gzip(DATA)), DATA)
+        self.assertEqual(decompressor.size, len(DATA))
+        self.assertEqual(decompressor.encoded_size, len(gzip(DATA)))
+
+    def test_gzip_members(self):
+        decompressor = Decompressor.for_encoding(b'x-gzip')
+        data = gzip(DATA) + gzip(b'last')
+        self.assertEqual(decode(decompressor, data, len(data)), DATA + b'last')
+
+    def test_gzip_bad_checksum(self):
+        data = bytearray(gzip(DATA))
+        data[-5] ^= 0xff
+        decompressor = Decompressor.for_encoding(b'gzip')
+        self.assertEqual(decode(decompressor, bytes(data)), DATA)
+
+    def test_gzip_invalid(self):
+        decompressor = Decompressor.for_encoding(b'gzip')
+        self.assertRaises(IOError, decode, decompressor, b'not gzipped')
+
+    def test_deflate(self):
+        decompressor = Decompressor.for_encoding(b' Deflate ')
+        self.assertEqual(decode(decompressor, zlib.compress(DATA)), DATA)
+
+    def test_raw_deflate(self):
+        # the zlib header check fails once the second byte arrives
+        decompressor = Decompressor.for_encoding(b'deflate')
+        self.assertEqual(decode(decompressor, raw_deflate(DATA), 1), DATA)
+
+    def test_brotli(self):
+        try:
+            import brotli
+        except ImportError:
+            raise unittest.SkipTest("no brotli")
+        decompressor = Decompressor.for_encoding(b'br')
+        self.assertEqual(decode(decompressor, brotli.compress(DATA)), DATA)
+        decompressor = Decompressor.for_encoding(b'br', maxsize=len(DATA))
+        self.assertEqual(decode(decompressor, brotli.compress(DATA), 1000),
+                         DATA)
+        bomb = brotli.compress(b'\0' * 64 * 1024 * 1024)
+        decompressor = Decompressor.for_encoding(b'br', maxsize=1024)
+        self.assertRaises(DecompressionMaxSizeExceeded,
+                          decompressor.decompress, bomb)
+        self.assertLess(decompressor.size, 16 * 1024 * 1024)
+
+    def test_zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise unittest.SkipTest("no zstandard")
+        compressor = zstandard.ZstdCompressor()
+        data = compressor.compress(DATA) + compressor.compress(b'last')
+        decompressor = Decompressor.for_encoding(b'zstd')
+        self.assertEqual(decode(decompressor, data), DATA + b'last')
+        decompressor = Decompressor.for_encoding(b'zstd', maxsize=len(DATA) + 4)
+        self.assertEqual(decode(decompressor, data, 1000), DATA + b'last')
+        bomb = compressor.compress(b'\0' * 10 * 1024 * 1024)
+        decompressor = Decompressor.for_encoding(b'zstd', maxsize=1024)
+        self.assertRaises(DecompressionMaxSizeExceeded,
+                          decompressor.decompress, bomb)
+        self.assertLess(decompressor.size, 1024 * 1024)
+
+    def test_unsupported(self):
+        self.assertIsNone(Decompressor.for_encoding(b'uuencode'))
+
+    def test_maxsize(self):
+        decompressor = Decompressor.for_encoding(b'gzip', maxsize=len(DATA))
+        self.assertEqual(decode(decompressor, gzip(DATA)), DATA)
+        bomb = gzip(b'\0' * 10 * 1024 * 1024)
+        decompressor = Decompressor.for_encoding(b'gzip', maxsize=1024)
+        self.assertRaises(DecompressionMaxSizeExceeded,
+                          decompressor.decompress, bomb)
+        # no more than the limit gets decoded
+        self.assertEqual(decompressor.size, 1025)
+
+
+if __name__ == "__main__":
+    unittest.main()
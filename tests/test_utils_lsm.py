@@ -0,0 +1,141 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from twisted.internet import defer
+from twisted.trial import unittest as trial_unittest
+
+from scrapy.utils.lsm import LSMFingerprintSet, Segment
+
+
+def _keys(start, stop):
+    return [hashlib.sha1(str(i).encode()).digest() for i in range(start, stop)]
+
+
+class LSMFingerprintSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'lsm')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add_contains(self):
+        fps = LSMFingerprintSet(self.path, buffer_size=10)
+        keys = _keys(0, 100)
+        for key in keys:
+            self.assertTrue(fps.add(key))
+        for key in keys:
+            self.assertFalse(fps.add(key))
+            self.assertIn(key, fps)
+        for key in _keys(100, 200):
+            self.assertNotIn(key, fps)
+        self.assertEqual(len(fps), 100)
+        self.assertLess(len(fps.buffer), 10)
+        fps.close()
+
+    def test_merges(self):
+        fps = LSMFingerprintSet(self.path, buffer_size=10, fanout=4)
+        for key in _keys(0, 1000):
+            fps.add(key)
+        # 100 segments of 10 keys, merged by 4 at each level
+        self.assertLessEqual(len(fps.segments), 3 * 4)
+        for segment in fps.segments:
+            keys = list(segment)
+            self.assertEqual(keys, sorted(keys))
+            self.assertEqual(len(keys), len(segment))
+        self.assertEqual(len(fps), 1000)
+        self.assertEqual(sum(len(s) for s in fps.segments), 1000)
+        fps.close()
+        files = os.listdir(self.path)
+        self.assertEqual(len(files), 2 * len(fps.segments))
+
+    def test_persistence(self):
+        fps = LSMFingerprintSet(self.path, buffer_size=10)
+        for key in _keys(0, 55):
+            fps.add(key)
+        fps.close()
+        # leftovers of an interrupted segment write are ignored
+        open(os.path.join(self.path, 's99999999.tmp'), 'wb').close()
+        open(os.path.join(self.path, 's99999999.bloom'), 'wb').close()
+
+        fps = LSMFingerprintSet(self.path, buffer_size=10)
+        self.assertEqual(len(fps), 55)
+        for key in _keys(0, 55):
+            self.assertIn(key, fps)
+        self.assertTrue(fps.add(_keys(55, 56)[0]))
+        fps.close()
+        self.assertFalse(any(f.startswith('s99999999')
+                             for f in os.listdir(self.path)))
+
+    def test_key_size(self):
+        self.assertRaises(ValueError, LSMFingerprintSet, self.path, 8)
+        fps = LSMFingerprintSet(self.path, 16)
+        self.assertRaises(ValueError, fps.add, b'a' * 20)
+        fps.close()
+
+    def test_segment(self):
+        os.makedirs(self.path)
+        path = os.path.join(self.path, 'segment')
+        keys = sorted(_keys(0, 5000))
+        segment = Segment.write(path, keys, len(keys), 20, 0.01)
+        for key in keys:
+            self.assertIn(key, segment)
+        for key in _keys(5000, 6000):
+            self.assertNotIn(key, segment)
+        self.assertEqual(list(segment), keys)
+        segment.remove()
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_invalid_segment(self):
+        os.makedirs(self.path)
+        path = os.path.join(self.path, 's00000000')
+        with open(path, 'wb') as f:
+            f.write(b'garbage')
+        self.assertRaises(ValueError, LSMFingerprintSet, self.path)
+
+
+class BackgroundMergeTest(trial_unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @defer.inlineCallbacks
+    def test_background_merge(self):
+        path = os.path.join(self.tmpdir, 'lsm')
+        fps = LSMFingerprintSet(path, buffer_size=10, background=True)
+        keys = _keys(0, 500)
+        for key in keys:
+            fps.add(key)
+        for key in keys:
+            self.assertIn(key, fps)
+        yield fps.close()
+        fps = LSMFingerprintSet(path, buffer_size=10)
+        self.assertEqual(len(fps), 500)
+        self.assertLessEqual(len(fps.segments), 3 * 4)
+        fps.close()
+
+    @defer.inlineCallbacks
+    def test_background_flush(self):
+        path = os.path.join(self.tmpdir, 'lsm')
+        fps = LSMFingerprintSet(path, buffer_size=10, background=True)
+        keys = _keys(0, 10)
+        for key in keys:
+            fps.add(key)
+        # written in a thread, and still looked up meanwhile
+        self.assertEqual(fps.segments, [])
+        self.assertEqual(len(fps), 10)
+        for key in keys:
+            self.assertIn(key, fps)
+            self.assertFalse(fps.add(key))
+        yield defer.DeferredList(list(fps._jobs))
+        self.assertEqual(len(fps.segments), 1)
+        self.assertEqual(fps._frozen, [])
+        self.assertEqual(len(fps), 10)
+        yield fps.close()
@@ -0,0 +1,47 @@
+import unittest
+
+from twisted.internet import task
+
+from scrapy.utils.ratelimit import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+
+    def test_burst(self):
+        bucket = TokenBucket(100, clock=self.clock)
+        self.assertEqual(bucket.consume(60), 0)
+        self.assertEqual(bucket.consume(40), 0)
+        self.assertEqual(bucket.consume(50), 0.5)
+        self.assertEqual(bucket.delay(), 0.5)
+        self.clock.advance(0.25)
+        self.assertEqual(bucket.delay(), 0.25)
+        self.clock.advance(0.25)
+        self.assertEqual(bucket.delay(), 0)
+
+    def test_refill_up_to_burst(self):
+        bucket = TokenBucket(100, burst=10, clock=self.clock)
+        self.assertEqual(bucket.consume(20), 0.1)
+        self.clock.advance(60)
+        self.assertEqual(bucket.delay(), 0)
+        self.assertEqual(bucket.tokens, 10)
+        self.assertEqual(bucket.consume(10), 0)
+
+    def test_current_rate(self):
+        bucket = TokenBucket(1000, clock=self.clock)
+        for _ in range(4):
+            self.clock.advance(0.5)
+            bucket.consume(100)
+        self.assertEqual(bucket.current_rate, 200)
+        self.clock.advance(0.5)
+        bucket.consume(300)
+        self.assertEqual(bucket.current_rate, 200)
+        self.clock.advance(0.5)
+        bucket.consume(100)
+        self.assertEqual(bucket.current_rate, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+from twisted.internet import task
+from twisted.trial import unittest
+
+from scrapy.spiders import Spider
+from scrapy.utils.reactor import DelayedCallHeap
+from scrapy.utils.test import get_crawler
+
+
+class DelayedCallHeapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.stats = get_crawler(Spider).stats
+        self.timer = DelayedCallHeap(self.clock, self.stats, 'test')
+        self.calls = []
+
+    def test_order(self):
+        for delay in (3, 1, 2):
+            self.timer.callLater(delay, self.calls.append, delay)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(1.5)
+        self.assertEqual(self.calls, [1])
+        self.clock.advance(5)
+        self.assertEqual(self.calls, [1, 2, 3])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(len(self.timer), 0)
+
+    def test_earlier_call_resets_reactor_call(self):
+        self.timer.callLater(10, self.calls.append, 10)
+        self.timer.callLater(1, self.calls.append, 1)
+        self.assertEqual(self.clock.getDelayedCalls()[0].getTime(), 1)
+        self.clock.advance(1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.clock.getDelayedCalls()[0].getTime(), 10)
+
+    def test_cancel(self):
+        call = self.timer.callLater(1, self.calls.append, 1)
+        self.timer.callLater(2, self.calls.append, 2)
+        self.assertTrue(call.active())
+        self.assertEqual(call.getTime(), 1)
+        call.cancel()
+        self.assertFalse(call.active())
+        self.assertEqual(len(self.timer), 1)
+        self.clock.advance(2)
+        self.assertEqual(self.calls, [2])
+
+    def test_call_raises(self):
+        self.timer.callLater(1, lambda: 1 / 0)
+        self.timer.callLater(1, self.calls.append, 1)
+        self.clock.advance(1)
+        self.assertEqual(self.calls, [1])
+        self.flushLoggedErrors(ZeroDivisionError)
+
+    def test_stats(self):
+        self.timer.callLater(1, self.calls.append, 1)
+        self.timer.callLater(2, self.calls.append, 2)
+        self.clock.advance(3)
+        self.assertEqual(self.stats.get_value('test/dispatches'), 2)
+        self.assertEqual(self.stats.get_value('test/dispatch_lag_max'), 2)
+        self.assertEqual(self.stats.get_value('test/dispatch_lag_avg'), 1.5)
+
+    def test_close(self):
+        call = self.timer.callLater(1, self.calls.append, 1)
+        self.timer.close()
+        self.assertFalse(call.active())
+        self.assertEqual(self.clock.getDelayedCalls(), [])
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from scrapy.http import Request, FormRequest
+from scrapy.utils import reqcodec
+from scrapy.utils.reqser import request_to_dict, request_from_dict
+from tests.test_utils_reqser import RequestSerializationTest
+
+
+class RequestCodecTest(RequestSerializationTest):
+
+    def _assert_serializes_ok(self, request, spider=None):
+        d = request_to_dict(request, spider=spider)
+        data = reqcodec.dumps(d)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(reqcodec.loads(data), d)
+        request2 = request_from_dict(reqcodec.loads(data), spider=spider)
+        self._assert_same_request(request, request2)
+
+    def test_meta_values(self):
+        r = Request("http://www.example.com", meta={
+            'depth': 3, 'neg': -129, 'big': 2 ** 70, 'ratio': 0.25,
+            'flag': True, 'none': None, 'bytes': b'\x00\xff',
+            'text': u'сайт', 'list': [1, [2, u'3']], 'tuple': (1, b'2'),
+            'dict': {1: {u'nested': False}},
+        })
+        self._assert_serializes_ok(r)
+
+    def test_smaller_than_pickle(self):
+        from six.moves import cPickle as pickle
+        d = request_to_dict(FormRequest("http://www.example.com/some/path",
+                                        formdata={'a': 'b'},
+                                        meta={'depth': 1}))
+        self.assertLess(len(reqcodec.dumps(d)),
+                        len(pickle.dumps(d, protocol=2)))
+
+    def test_unserializable_meta(self):
+        r = Request("http://www.example.com", meta={'obj': object()})
+        self.assertRaises(ValueError, reqcodec.dumps, request_to_dict(r))
+
+    def test_unserializable_headers(self):
+        d = request_to_dict(Request("http://www.example.com"))
+        d['headers'] = {b'Accept': [object()]}
+        self.assertRaises(ValueError, reqcodec.dumps, d)
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_other_values(self):
+        for value in [b'', b'abc', u'abc', 0, -1, 1.5, None, True, [], {},
+                      {'url': 'dict with some request keys'}]:
+            self.assertEqual(reqcodec.loads(reqcodec.dumps(value)), value)
+
+    def test_unsupported_version(self):
+        data = reqcodec.dumps(b'abc')
+        self.assertRaises(ValueError, reqcodec.loads, b'\x00' + data[1:])
+        self.assertRaises(ValueError, reqcodec.loads, b'')
+
+    def test_interned_callback(self):
+        d = request_to_dict(Request("http://example.com"))
+        d['callback'] = ''.join(['parse', '_item'])
+        d2 = reqcodec.loads(reqcodec.dumps(d))
+        self.assertIs(d2['callback'], reqcodec.loads(reqcodec.dumps(d))['callback'])
+
+    def test_truncated_data(self):
+        data = reqcodec.dumps(request_to_dict(Request("http://example.com")))
+        self.assertRaises(ValueError, reqcodec.loads, data[:-3])
@@ -1,7 +1,10 @@
 from __future__ import print_function
+import hashlib
+import binascii
 import unittest
 from scrapy.http import Request
 from scrapy.utils.request import request_fingerprint, _fingerprint_cache, \
+    request_fingerprint_digest, _canonical_url_cache, \
     request_authenticate, request_httprepr
 
 class UtilsRequestTest(unittest.TestCase):
@@ -56,6 +59,41 @@ class UtilsRequestTest(unittest.TestCase):
         fp2 = request_fingerprint(r2)
         self.assertNotEqual(fp1, fp2)
 
+    def test_request_fingerprint_digest(self):
+        r1 = Request("http://www.example.com/query?id=111&cat=222")
+        r2 = Request("http://www.example.com/query?cat=222&id=111")
+        digest = request_fingerprint_digest(r1)
+        self.assertIsInstance(digest, bytes)
+        self.assertEqual(binascii.hexlify(digest).decode('ascii'),
+                         request_fingerprint(r1))
+        self.assertEqual(digest, request_fingerprint_digest(r2))
+
+        r3 = Request("http://www.example.com/query?id=111&cat=222",
+                     headers={'Accept-Language': 'en'})
+        self.assertEqual(digest, request_fingerprint_digest(r3))
+        self.assertNotEqual(
+            digest, request_fingerprint_digest(r3, ['Accept-Language']))
+        self.assertEqual(
+            binascii.hexlify(request_fingerprint_digest(r3, ['Accept-Language'])),
+            request_fingerprint(r3, ['accept-language']).encode('ascii'))
+
+    def test_request_fingerprint_hash_function(self):
+        r1 = Request("http://www.example.com/query?id=111&cat=222")
+        r2 = Request("http://www.example.com/query?cat=222&id=111")
+        digest = request_fingerprint_digest(r1, hash_function=hashlib.md5)
+        self.assertEqual(len(digest), 16)
+        self.assertEqual(digest,
+                         request_fingerprint_digest(r2, hash_function=hashlib.md5))
+        self.assertEqual(len(request_fingerprint_digest(r1)), 20)
+
+    def test_canonical_url_cache(self):
+        url = "http://www.example.com/cache?b=2&a=1"
+        request_fingerprint(Request(url))
+        self.assertEqual(_canonical_url_cache[url],
+                         b"http://www.example.com/cache?a=1&b=2")
+        self.assertEqual(request_fingerprint(Request(url)),
+                         request_fingerprint(Request(url + '#fragment')))
+
     def test_request_authenticate(self):
         r = Request("http://www.example.com")
         request_authenticate(r, 'someuser', 'somepass')
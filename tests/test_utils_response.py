@@ -1,11 +1,13 @@
 import os
+import tempfile
 import unittest
 from six.moves.urllib.parse import urlparse
 
 from scrapy.http import Response, TextResponse, HtmlResponse
 from scrapy.utils.python import to_bytes
 from scrapy.utils.response import (response_httprepr, open_in_browser,
-                                   get_meta_refresh, get_base_url, response_status_message)
+                                   get_meta_refresh, get_base_url, response_status_message,
+                                   response_body_size)
 
 __doctests__ = ['scrapy.utils.response']
 
@@ -23,6 +25,16 @@ class ResponseUtilsTest(unittest.TestCase):
         r1 = Response("http://www.example.com", status=6666, headers={"Content-type": "text/html"}, body=b"Some body")
         self.assertEqual(response_httprepr(r1), b'HTTP/1.1 6666 \r\nContent-Type: text/html\r\n\r\nSome body')
 
+    def test_response_body_size(self):
+        self.assertEqual(response_body_size(Response("http://www.example.com",
+                                                     body=b"Some body")), 9)
+        with tempfile.TemporaryFile() as f:
+            f.write(b"Spooled body")
+            f.flush()
+            r1 = Response("http://www.example.com", body_file=f)
+            self.assertEqual(response_body_size(r1), 12)
+            self.assertIsNone(r1._body)
+
     def test_open_in_browser(self):
         url = "http:///www.example.com/some/page.html"
         body = b"<html> <head> <title>test page</title> </head> <body>test body</body> </html>"